@@ -0,0 +1,236 @@
+"""Vectorized sales analytics over order columns held in NumPy arrays.
+
+Orders are fetched as raw column tuples (never ORM objects) and packed into an
+`OrderColumns` instance; every report below is then a handful of array operations
+(``bincount``, ``cumsum``, ``unique``) instead of a Python loop per order:
+
+- `daily_totals` / `weekly_totals`: orders, revenue and discount per day or week,
+  with a trailing moving average of revenue.
+- `cohort_retention`: customers grouped by the month (or week) of their first order,
+  and the share of each cohort that ordered again N periods later.
+- `discount_impact`: discounted vs full-price orders, and how often customers whose
+  first order was discounted come back.
+
+Customers are identified by lower-cased email so guest checkouts are included.
+"""
+import numpy as np
+
+DEFAULT_BATCH_SIZE = 10000
+_WEEKDAY_OFFSET = 3  # 1970-01-01 was a Thursday; shift so weeks start on Monday
+
+
+class OrderColumns:
+    """Parallel arrays, one entry per order."""
+
+    def __init__(self, created, customer, total, discount, subtotal, customers=None):
+        self.created = np.asarray(created, dtype='datetime64[s]')
+        self.customer = np.asarray(customer, dtype=np.int64)
+        self.total = np.asarray(total, dtype=np.float64)
+        self.discount = np.asarray(discount, dtype=np.float64)
+        self.subtotal = np.asarray(subtotal, dtype=np.float64)
+        self.customers = customers if customers is not None else int(self.customer.max(initial=-1)) + 1
+
+    def __len__(self):
+        return len(self.total)
+
+    @property
+    def day(self):
+        """Days since 1970-01-01 as int64."""
+        return self.created.astype('datetime64[D]').astype(np.int64)
+
+    @classmethod
+    def from_batches(cls, batches):
+        """Build from an iterable of row batches of ``(created_epoch, email, total, discount, subtotal)``.
+
+        `created_epoch` is seconds since 1970-01-01 UTC and the money columns are plain
+        numbers: have the database do those conversions (see `load_order_columns` in
+        app.py), since turning millions of datetime/Decimal objects into arrays in Python
+        costs more than every report combined. Emails are mapped to dense integer codes
+        while reading, so no string array is kept.
+        """
+        codes = {}
+        created, customer, total, discount, subtotal = [], [], [], [], []
+        for rows in batches:
+            if not rows:
+                continue
+            n = len(rows)
+            c_at, emails, tot, disc, sub = zip(*rows)
+            created.append(np.fromiter(c_at, dtype=np.float64, count=n).astype(np.int64))
+            customer.append(np.fromiter((codes.setdefault((e or '').strip().lower(), len(codes)) for e in emails),
+                                        dtype=np.int64, count=n))
+            total.append(np.fromiter((v or 0.0 for v in tot), dtype=np.float64, count=n))
+            discount.append(np.fromiter((v or 0.0 for v in disc), dtype=np.float64, count=n))
+            subtotal.append(np.fromiter((v or 0.0 for v in sub), dtype=np.float64, count=n))
+        if not created:
+            return cls.empty()
+        return cls(np.concatenate(created).astype('datetime64[s]'), np.concatenate(customer),
+                   np.concatenate(total), np.concatenate(discount), np.concatenate(subtotal), customers=len(codes))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.array([], dtype='datetime64[s]'), [], [], [], [], customers=0)
+
+
+def moving_average(values, window: int):
+    """Trailing mean over `window` points; the first points average what is available."""
+    values = np.asarray(values, dtype=np.float64)
+    window = max(int(window), 1)
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    idx = np.arange(1, len(values) + 1)
+    lo = np.maximum(idx - window, 0)
+    return (csum[idx] - csum[lo]) / (idx - lo)
+
+
+def _day_to_iso(days):
+    return [str(d) for d in np.asarray(days, dtype=np.int64).astype('datetime64[D]')]
+
+
+def _round(values, digits=2):
+    return np.round(np.asarray(values, dtype=np.float64), digits).tolist()
+
+
+def _grouped(keys, cols, first=None, last=None):
+    """Sum orders, revenue and discount per integer key over the contiguous range [first, last]."""
+    if first is None:
+        first = int(keys.min()) if len(keys) else 0
+    if last is None:
+        last = int(keys.max()) if len(keys) else first - 1
+    keep = (keys >= first) & (keys <= last)
+    idx = keys[keep] - first
+    size = max(last - first + 1, 0)
+    orders = np.bincount(idx, minlength=size)
+    revenue = np.bincount(idx, weights=cols.total[keep], minlength=size)
+    discount = np.bincount(idx, weights=cols.discount[keep], minlength=size)
+    return np.arange(first, last + 1), orders, revenue, discount
+
+
+def _series(periods, orders, revenue, discount, window):
+    aov = np.divide(revenue, orders, out=np.zeros_like(revenue), where=orders > 0)
+    return {
+        'period': _day_to_iso(periods),
+        'orders': orders.tolist(),
+        'revenue': _round(revenue),
+        'discount': _round(discount),
+        'average_order_value': _round(aov),
+        'revenue_moving_average': _round(moving_average(revenue, window)),
+        'window': int(window),
+        'total_revenue': round(float(revenue.sum()), 2),
+        'total_orders': int(orders.sum()),
+    }
+
+
+def daily_totals(cols: OrderColumns, start=None, end=None, window: int = 7) -> dict:
+    """Per-day totals over every day in [start, end] (``datetime.date``), zero-filled."""
+    first = int(np.datetime64(start, 'D').astype(np.int64)) if start else None
+    last = int(np.datetime64(end, 'D').astype(np.int64)) if end else None
+    days, orders, revenue, discount = _grouped(cols.day, cols, first, last)
+    return {'grain': 'day', **_series(days, orders, revenue, discount, window)}
+
+
+def weekly_totals(cols: OrderColumns, start=None, end=None, window: int = 4) -> dict:
+    """Per-week totals; weeks start on Monday and are labelled by that Monday."""
+    week = (cols.day + _WEEKDAY_OFFSET) // 7
+    first = (int(np.datetime64(start, 'D').astype(np.int64)) + _WEEKDAY_OFFSET) // 7 if start else None
+    last = (int(np.datetime64(end, 'D').astype(np.int64)) + _WEEKDAY_OFFSET) // 7 if end else None
+    weeks, orders, revenue, discount = _grouped(week, cols, first, last)
+    return {'grain': 'week', **_series(weeks * 7 - _WEEKDAY_OFFSET, orders, revenue, discount, window)}
+
+
+def _period_index(cols, period):
+    if period == 'week':
+        return (cols.day + _WEEKDAY_OFFSET) // 7
+    return cols.created.astype('datetime64[M]').astype(np.int64)
+
+
+def _period_label(index, period):
+    if period == 'week':
+        return _day_to_iso(index * 7 - _WEEKDAY_OFFSET)
+    return [str(m) for m in np.asarray(index, dtype=np.int64).astype('datetime64[M]')]
+
+
+def cohort_retention(cols: OrderColumns, period: str = 'month', periods: int = 12) -> dict:
+    """Cohort matrix: row = first-order period, column = periods since, value = share of the cohort active."""
+    if period not in ('month', 'week'):
+        raise ValueError("period must be 'month' or 'week'")
+    periods = max(int(periods), 1)
+    if not len(cols):
+        return {'period': period, 'cohorts': [], 'sizes': [], 'active': [], 'retention': []}
+    when = _period_index(cols, period)
+    never = np.iinfo(np.int64).max
+    first = np.full(cols.customers, never, dtype=np.int64)
+    np.minimum.at(first, cols.customer, when)
+    offset = when - first[cols.customer]
+    keep = offset < periods
+    # One entry per (customer, offset) so repeat orders in a period count once
+    pairs = np.unique(cols.customer[keep] * periods + offset[keep])
+    customer, offset = pairs // periods, pairs % periods
+    cohort = first[customer]
+    seen = first[first != never]
+    base = int(seen.min())
+    rows = int(seen.max()) - base + 1
+    active = np.bincount((cohort - base) * periods + offset, minlength=rows * periods).reshape(rows, periods)
+    sizes = active[:, 0]
+    present = sizes > 0
+    active, sizes = active[present], sizes[present]
+    retention = active / sizes[:, None]
+    # Cells after the newest data point have not happened yet
+    last = int(when.max())
+    labels = np.arange(base, base + rows)[present]
+    elapsed = last - labels
+    mask = np.arange(periods)[None, :] > elapsed[:, None]
+    return {
+        'period': period,
+        'cohorts': _period_label(labels, period),
+        'sizes': sizes.tolist(),
+        'active': [[None if m else int(v) for v, m in zip(row, mrow)] for row, mrow in zip(active, mask)],
+        'retention': [[None if m else round(float(v), 4) for v, m in zip(row, mrow)]
+                      for row, mrow in zip(retention, mask)],
+    }
+
+
+def _order_stats(cols, mask):
+    count = int(mask.sum())
+    revenue = float(cols.total[mask].sum())
+    discount = float(cols.discount[mask].sum())
+    subtotal = float(cols.subtotal[mask].sum())
+    return {
+        'orders': count,
+        'share': round(count / len(cols), 4) if len(cols) else 0.0,
+        'revenue': round(revenue, 2),
+        'average_order_value': round(revenue / count, 2) if count else 0.0,
+        'average_subtotal': round(subtotal / count, 2) if count else 0.0,
+        'discount': round(discount, 2),
+        'discount_rate': round(discount / subtotal, 4) if subtotal else 0.0,
+    }
+
+
+def discount_impact(cols: OrderColumns) -> dict:
+    """Compare discounted with full-price orders, and repeat rates by first-order discount."""
+    discounted = cols.discount > 0
+    result = {'discounted': _order_stats(cols, discounted), 'full_price': _order_stats(cols, ~discounted)}
+    if not len(cols):
+        result['repeat_rate'] = {'first_order_discounted': 0.0, 'first_order_full_price': 0.0}
+        return result
+    chronological = np.argsort(cols.created, kind='stable')
+    customers, first_idx = np.unique(cols.customer[chronological], return_index=True)
+    first_discounted = discounted[chronological][first_idx]
+    repeat = np.bincount(cols.customer, minlength=cols.customers)[customers] > 1
+
+    def rate(mask):
+        return round(float(repeat[mask].mean()), 4) if mask.any() else 0.0
+
+    result['repeat_rate'] = {'first_order_discounted': rate(first_discounted),
+                             'first_order_full_price': rate(~first_discounted)}
+    return result
+
+
+def synthetic_orders(n: int, customers: int = None, days: int = 730, seed: int = 0,
+                     start='2023-01-01') -> OrderColumns:
+    """Random but plausible orders, used by the benchmark and tests."""
+    rng = np.random.default_rng(seed)
+    customers = customers or max(n // 4, 1)
+    created = np.datetime64(start, 's') + rng.integers(0, days * 86400, n).astype('timedelta64[s]')
+    customer = rng.zipf(1.6, n) % customers
+    subtotal = np.round(rng.gamma(2.0, 150.0, n), 2)
+    discount = np.where(rng.random(n) < 0.2, np.round(subtotal * rng.uniform(0.05, 0.3, n), 2), 0.0)
+    return OrderColumns(created, customer, subtotal - discount, discount, subtotal, customers=customers)
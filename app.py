@@ -23,19 +23,27 @@ def load_dotenv(path: str = ".env"):
             os.environ[key] = val
 
 from flask import (
-    Flask, render_template, request, redirect, url_for, flash, session,
-    send_from_directory, jsonify, abort, Response
+    Flask, render_template, request, redirect, url_for, flash, session, g,
+    send_from_directory, jsonify, abort, Response, stream_with_context, has_request_context
 )
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import (
     LoginManager, login_user, logout_user, login_required, current_user, UserMixin
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-import requests
+from storage import LocalStorage, S3Storage, DatabaseStorage, StorageError
+import db_pool
+import query_stats
+import metrics
+import request_profiler
+import structured_logging
+import error_buffer
+from image_processing import process_image, ImageValidationError
+# requests, smtplib, flask_migrate and redis/rq are imported where they are used:
+# together they are a large share of a cold start that most requests never need.
+import re
 import uuid
-import smtplib
 import ssl
 import urllib.parse
 import threading
@@ -43,6 +51,9 @@ import time
 from email.utils import parseaddr
 import json as _json
 import logging
+import click
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import column_property
 import sys
 import tempfile
 
@@ -52,19 +63,28 @@ SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY", "")
 # Default model for AI integrations (set to Claude Haiku 4.5 by default)
 DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "claude-haiku-4.5")
 DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "claude-haiku-4.5")
-USE_RQ = False
-if REDIS_URL:
-    try:
-        import importlib
-        redis = importlib.import_module("redis")
-        rq = importlib.import_module("rq")
-        Queue = getattr(rq, "Queue")
-        USE_RQ = True
-        _redis_conn = redis.from_url(REDIS_URL)
-        _rq_queue = Queue("emails", connection=_redis_conn)
-    except Exception:
-        USE_RQ = False
+# redis/rq are imported on the first enqueue (see _get_rq_queue), not at import time
+USE_RQ = bool(REDIS_URL)
+_rq_queue = None
+
+
+def _get_rq_queue():
+    """Return the RQ email queue, connecting on first use; None (and USE_RQ off) if unavailable."""
+    global USE_RQ, _rq_queue
+    if not USE_RQ:
+        return None
+    if _rq_queue is None:
+        try:
+            import importlib
+            redis = importlib.import_module("redis")
+            rq = importlib.import_module("rq")
+            _rq_queue = rq.Queue("emails", connection=redis.from_url(REDIS_URL))
+        except Exception:
+            USE_RQ = False
+            return None
+    return _rq_queue
 from email.message import EmailMessage
+from contextlib import contextmanager
 
 # Load env
 load_dotenv()
@@ -75,16 +95,8 @@ if os.environ.get("VERCEL") or os.environ.get("VERCEL_URL"):
     UPLOAD_FOLDER = Path("/tmp") / "images"
 else:
     UPLOAD_FOLDER = BASE_DIR / "static" / "images"
-UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
-# Validate upload folder permissions and existence
-try:
-    if not UPLOAD_FOLDER.exists():
-        UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
-    test_file = UPLOAD_FOLDER / '.permcheck'
-    test_file.write_text('ok')
-    test_file.unlink()
-except Exception as e:
-    print(f"[WARNING] Failed to ensure UPLOAD_FOLDER exists or is writable: {UPLOAD_FOLDER} — {e}")
+# The folder is created, and its permissions checked, by the first upload
+# (see _is_upload_folder_writable) rather than on every cold start.
 
 # Helper function for timezone-aware UTC datetime
 def utc_now():
@@ -99,14 +111,6 @@ app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "change-me")
 from pathlib import Path as _Path
 _STATIC_IMG_DIR = _Path(__file__).parent / 'static' / 'images'
 
-@app.route('/static/images/<path:filename>')
-def _serve_static_image(filename):
-    try:
-        return send_from_directory(str(_STATIC_IMG_DIR), filename)
-    except Exception:
-        app.logger.exception('Failed to serve static image %s', filename)
-        abort(404)
-
 @app.route('/favicon.ico')
 def _favicon():
     try:
@@ -119,6 +123,17 @@ _env_db = os.environ.get("SQLALCHEMY_DATABASE_URI", "").strip()
 _db_url = _env_db or os.environ.get("DATABASE_URL", "").strip()
 
 
+_driver_probes = {}
+
+
+def _driver_installed(name: str) -> bool:
+    """Whether DB driver `name` can be imported; probed once per process (find_spec walks sys.path)."""
+    if name not in _driver_probes:
+        import importlib.util
+        _driver_probes[name] = importlib.util.find_spec(name) is not None
+    return _driver_probes[name]
+
+
 def _normalize_db_url_for_driver(db_url: str) -> str:
     """Normalize DB URL for SQLAlchemy and drivers.
 
@@ -135,8 +150,8 @@ def _normalize_db_url_for_driver(db_url: str) -> str:
         is_postgres = db_url.startswith("postgres://") or db_url.startswith("postgresql://")
         if not is_postgres:
             return db_url
-        have_psycopg2 = importlib.util.find_spec("psycopg2") is not None or importlib.util.find_spec("psycopg2_binary") is not None
-        have_pg8000 = importlib.util.find_spec("pg8000") is not None
+        have_psycopg2 = _driver_installed("psycopg2") or _driver_installed("psycopg2_binary")
+        have_pg8000 = _driver_installed("pg8000")
         if not have_psycopg2 and have_pg8000:
             # Rewrite scheme to use pg8000
             if db_url.startswith("postgres://"):
@@ -194,49 +209,486 @@ app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
 app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024  # 5MB
 
 
+class ImageManifest:
+    """In-memory index of image files served under /static/images and /uploads/images.
+
+    The index is built once at startup by scanning the known image folders and
+    is kept current by `_save_uploaded_file`, so serving an image is a dict
+    lookup instead of a `Path.exists()` probe per candidate folder. Misses are
+    remembered for `miss_ttl` seconds; after that a single probe runs again so
+    files written by other workers (or restored volumes) are still found.
+    """
+
+    def __init__(self, miss_ttl: float = 60.0, max_misses: int = 4096):
+        self.miss_ttl = miss_ttl
+        self.max_misses = max_misses
+        self._index = {}   # relative path -> list of directories holding it
+        self._misses = {}  # (scope, relative path) -> monotonic expiry
+        self._lock = threading.Lock()
+        # Lookup outcomes for the cache hit ratio metric; a cached miss is a hit
+        self.hits = 0
+        self.misses = 0
+
+    def scan(self, directory) -> int:
+        """Register every (non-hidden) file below `directory`. Returns the number found."""
+        directory = str(directory)
+        found = 0
+        if not os.path.isdir(directory):
+            return 0
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            rel_root = os.path.relpath(root, directory)
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                rel = name if rel_root == '.' else f"{rel_root}/{name}".replace(os.sep, '/')
+                self.add(directory, rel)
+                found += 1
+        return found
+
+    def add(self, directory, relpath: str):
+        """Record that `relpath` exists in `directory` and drop any cached misses for it."""
+        directory = str(directory)
+        with self._lock:
+            dirs = self._index.setdefault(relpath, [])
+            if directory not in dirs:
+                dirs.append(directory)
+            for key in [k for k in self._misses if k[1] == relpath]:
+                self._misses.pop(key, None)
+
+    def discard(self, directory, relpath: str):
+        """Forget a file that turned out to be missing on disk."""
+        directory = str(directory)
+        with self._lock:
+            dirs = self._index.get(relpath)
+            if dirs and directory in dirs:
+                dirs.remove(directory)
+                if not dirs:
+                    self._index.pop(relpath, None)
+
+    def lookup(self, scope: str, relpath: str, directories):
+        """Return the first directory (in `directories` order) that holds `relpath`, or None."""
+        directories = [str(d) for d in directories if d]
+        hits = self._index.get(relpath)
+        if hits:
+            for d in directories:
+                if d in hits:
+                    self.hits += 1
+                    return d
+        key = (scope, relpath)
+        now = time.monotonic()
+        expiry = self._misses.get(key)
+        if expiry is not None and expiry > now:
+            self.hits += 1
+            return None
+        self.misses += 1
+        # Cold miss: probe the filesystem once, then cache the answer either way
+        from werkzeug.security import safe_join
+        hidden = any(part.startswith('.') for part in relpath.split('/'))
+        for d in ([] if hidden else directories):
+            candidate = safe_join(d, relpath)
+            if candidate and os.path.isfile(candidate):
+                self.add(d, relpath)
+                return d
+        with self._lock:
+            if len(self._misses) >= self.max_misses:
+                self._misses = {k: v for k, v in self._misses.items() if v > now}
+                if len(self._misses) >= self.max_misses:
+                    self._misses.clear()
+            self._misses[key] = now + self.miss_ttl
+        # Only cold misses are logged; cached misses stay quiet until the TTL expires
+        app.logger.warning('Image not found (%s): %s', scope, relpath)
+        return None
+
+    def __len__(self):
+        return len(self._index)
+
+
+image_manifest = ImageManifest(miss_ttl=float(os.environ.get('IMAGE_MANIFEST_MISS_TTL', '60')))
+
+
+def _image_dirs(scope: str):
+    """Candidate folders, in priority order, for the given image URL scope."""
+    upload_folder = app.config.get('UPLOAD_FOLDER') or str(UPLOAD_FOLDER)
+    if scope == 'static':
+        return [str(_STATIC_IMG_DIR), upload_folder]
+    return [
+        str(BASE_DIR / 'uploads' / 'images'),
+        str(BASE_DIR / 'static' / 'uploads' / 'images'),
+        upload_folder,
+    ]
+
+
+# Build the manifest once at startup; uploads keep it current afterwards.
+for _scope in ('static', 'uploads'):
+    for _dir in _image_dirs(_scope):
+        try:
+            image_manifest.scan(_dir)
+        except Exception:
+            pass
+
+# Precomputed placeholder returned for missing uploads so pages don't show broken images.
+_PLACEHOLDER_SVG = (
+    "<svg xmlns='http://www.w3.org/2000/svg' width='400' height='300' viewBox='0 0 400 300'>"
+    "<rect width='100%' height='100%' fill='#f3f4f6'/>"
+    "<text x='50%' y='50%' dominant-baseline='middle' text-anchor='middle'"
+    " font-family='Arial, Helvetica, sans-serif' font-size='20' fill='#9ca3af'>"
+    "Image not available"
+    "</text></svg>"
+).encode('utf-8')
+_PLACEHOLDER_HEADERS = {'Cache-Control': 'public, max-age=60', 'X-Content-Type-Options': 'nosniff'}
+
+
+def _placeholder_image_response():
+    return Response(_PLACEHOLDER_SVG, mimetype='image/svg+xml', headers=_PLACEHOLDER_HEADERS)
+
+
+def _serve_manifest_image(scope: str, filename: str):
+    """Serve `filename` from the manifest. Returns None when the image is unknown."""
+    directory = image_manifest.lookup(scope, filename, _image_dirs(scope))
+    if directory is None:
+        return None
+    try:
+        resp = send_from_directory(directory, filename, max_age=3600)
+    except Exception:
+        # Deleted behind our back; forget it so the next lookup re-probes
+        image_manifest.discard(directory, filename)
+        return None
+    resp.headers['X-Content-Type-Options'] = 'nosniff'
+    return resp
+
+
+# Explicit static image route so images are served correctly in serverless
+# environments (some deployment layers may not expose the default Flask static route).
+# Files uploaded to /tmp on Vercel are also visible here.
+@app.route('/static/images/<path:filename>')
+def _serve_static_image(filename):
+    resp = _serve_manifest_image('static', filename)
+    if resp is None:
+        abort(404)
+    return resp
+
+
 # Serve uploaded images path with graceful fallback when files are missing.
 # On Vercel the filesystem is ephemeral, so uploaded images may be absent.
 @app.route('/uploads/images/<path:filename>')
 def uploaded_image(filename):
-    """Serve an uploaded image from several candidate locations.
+    """Serve an uploaded image from the image manifest.
 
     If the file is missing, return a small SVG placeholder so pages don't show broken images.
     """
-    candidates = [
-        BASE_DIR / 'uploads' / 'images' / filename,
-        BASE_DIR / 'static' / 'uploads' / 'images' / filename,
-        Path(app.config.get('UPLOAD_FOLDER', '')) / filename,
-    ]
-    for p in candidates:
-        try:
-            if p and p.exists():
-                return send_from_directory(str(p.parent), p.name)
-        except Exception:
-            continue
+    resp = _serve_manifest_image('uploads', filename)
+    if resp is not None:
+        return resp
+    return _placeholder_image_response()
 
-    # Log missing file for diagnostics
-    app.logger.warning('Uploaded image not found: %s', filename)
-
-    # Return a small inline SVG placeholder
-    svg = (
-        "<svg xmlns='http://www.w3.org/2000/svg' width='400' height='300' viewBox='0 0 400 300'>"
-        "<rect width='100%' height='100%' fill='#f3f4f6'/>"
-        "<text x='50%' y='50%' dominant-baseline='middle' text-anchor='middle'"
-        " font-family='Arial, Helvetica, sans-serif' font-size='20' fill='#9ca3af'>"
-        "Image not available"
-        "</text></svg>"
-    )
-    return Response(svg, mimetype='image/svg+xml')
+# Fingerprinted static assets. `static_url('css/style.css')` emits a content-hashed
+# URL under /assets/ which can be cached forever; gzip/brotli variants are built
+# once per asset and picked per request from Accept-Encoding.
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_HASHED_ASSET_NAME = re.compile(r'^(.+)\.([0-9a-f]{12})(\.[^./]+)?$')
+# Unknown hashed names remembered by AssetRegistry.resolve() before the set starts over
+_ASSET_MISS_LIMIT = 4096
+_COMPRESSIBLE_ASSET_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+def _load_brotli():
+    """Return the optional `brotli` module, or None when it isn't installed."""
+    try:
+        import importlib
+        return importlib.import_module('brotli')
+    except Exception:
+        return None
+
+
+class AssetRegistry:
+    """Content-hash registry for files under `static/`.
+
+    Assets are registered lazily the first time `url()` is asked for them, or all
+    at once via `build()` (used by the `flask build-assets` command). A process
+    that has not rendered the page yet (another worker, a fresh serverless
+    instance) registers the asset from its hashed name in `resolve()`. Each entry
+    keeps the hashed name and, for text-like types, precompressed gzip (and
+    brotli, when the `brotli` package is installed) bodies so requests never
+    compress on the fly.
+    """
+
+    def __init__(self, static_dir, url_prefix='/assets'):
+        self.static_dir = Path(static_dir)
+        self.url_prefix = url_prefix.rstrip('/')
+        self._entries = {}   # logical path -> entry dict
+        self._by_name = {}   # hashed name -> entry dict
+        self._digests = {}   # logical path -> digest, for files resolve() read but did not register
+        self._misses = set()  # hashed names resolve() found unknown or stale
+        self._lock = threading.Lock()
+        self._brotli = _load_brotli()
+        # url() outcomes for the cache hit ratio metric
+        self.hits = 0
+        self.misses = 0
+
+    def _hashed_name(self, logical: str, digest: str) -> str:
+        stem, dot, ext = logical.rpartition('.')
+        if not dot or '/' in ext:
+            return f"{logical}.{digest}"
+        return f"{stem}.{digest}.{ext}"
+
+    def _read(self, logical: str):
+        """(path, bytes, digest) of a static file, or None if it does not exist."""
+        import hashlib
+        from werkzeug.security import safe_join
+        full = safe_join(str(self.static_dir), logical)
+        if not full or not os.path.isfile(full):
+            return None
+        data = Path(full).read_bytes()
+        return full, data, hashlib.sha256(data).hexdigest()[:12]
+
+    def register(self, logical: str, _read=None):
+        """Fingerprint (and precompress) one asset. Returns the entry or None if missing."""
+        import mimetypes as _mimetypes
+        read = _read or self._read(logical)
+        if read is None:
+            return None
+        full, data, digest = read
+        mimetype = _mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+        entry = {
+            'logical': logical,
+            'path': full,
+            'mtime': os.path.getmtime(full),
+            'name': self._hashed_name(logical, digest),
+            'etag': digest,
+            'mimetype': mimetype,
+            'variants': {'identity': data},
+        }
+        if mimetype.startswith(_COMPRESSIBLE_ASSET_TYPES) and len(data) >= 256:
+            import gzip
+            entry['variants']['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+            if self._brotli is not None:
+                try:
+                    entry['variants']['br'] = self._brotli.compress(data, quality=11)
+                except Exception:
+                    pass
+        with self._lock:
+            old = self._entries.get(logical)
+            if old is not None:
+                self._by_name.pop(old['name'], None)
+            self._entries[logical] = entry
+            self._by_name[entry['name']] = entry
+        return entry
+
+    def build(self) -> int:
+        """Register every file under the static folder. Returns the number of assets."""
+        count = 0
+        for root, dirs, files in os.walk(self.static_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                logical = os.path.relpath(os.path.join(root, name), self.static_dir).replace(os.sep, '/')
+                if self.register(logical) is not None:
+                    count += 1
+        return count
+
+    def url(self, logical: str) -> str:
+        """Hashed URL for `logical`, falling back to the plain /static/ URL if unknown."""
+        logical = logical.lstrip('/')
+        entry = self._entries.get(logical)
+        if entry is not None and app.debug:
+            # Pick up edits during local development without a restart
+            try:
+                if os.path.getmtime(entry['path']) != entry['mtime']:
+                    entry = None
+            except OSError:
+                entry = None
+        if entry is None:
+            self.misses += 1
+            entry = self.register(logical)
+        else:
+            self.hits += 1
+        if entry is None:
+            return f"/static/{logical}"
+        return f"{self.url_prefix}/{entry['name']}"
+
+    def get(self, name: str):
+        return self._by_name.get(name)
+
+    def resolve(self, name: str):
+        """Entry for hashed `name`, registering its asset on a miss; None if unknown or stale.
+
+        The requested digest is checked against the file before anything is
+        compressed. Each file is read at most once here and names that do not
+        match are remembered, so made-up or old digests cost a lookup.
+        """
+        entry = self._by_name.get(name)
+        if entry is not None:
+            return entry
+        match = _HASHED_ASSET_NAME.match(name)
+        if match is None or name in self._misses:
+            return None
+        logical = match.group(1) + (match.group(3) or '')
+        read = None
+        current = self._entries[logical]['etag'] if logical in self._entries else self._digests.get(logical)
+        if current is None:
+            read = self._read(logical)
+            if read is not None:
+                current = self._digests[logical] = read[2]
+        # A digest from another build of the file must not be cached forever under this content
+        if current != match.group(2):
+            with self._lock:
+                if len(self._misses) >= _ASSET_MISS_LIMIT:
+                    self._misses.clear()
+                self._misses.add(name)
+            return None
+        return self.register(logical, _read=read)
+
+    def manifest(self):
+        return {k: f"{self.url_prefix}/{v['name']}" for k, v in sorted(self._entries.items())}
+
+
+asset_registry = AssetRegistry(BASE_DIR / 'static')
+
+
+def static_url(filename: str) -> str:
+    """Template helper: content-hashed URL for a file under `static/`."""
+    try:
+        return asset_registry.url(filename)
+    except Exception:
+        return f"/static/{filename.lstrip('/')}"
+
+
+app.jinja_env.globals['static_url'] = static_url
 
-# Configure structured logging to stdout so Vercel captures full logs and tracebacks
+
+def _preferred_asset_encoding(entry, accept_encoding: str) -> str:
+    """Pick the best precompressed variant the client accepts (br, then gzip)."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    for enc in ('br', 'gzip'):
+        if enc in entry['variants'] and accepted.get(enc, accepted.get('*', 0)) > 0:
+            return enc
+    return 'identity'
+
+
+@app.route('/assets/<path:name>')
+def hashed_asset(name):
+    """Serve a fingerprinted asset with long-lived immutable caching."""
+    entry = asset_registry.resolve(name)
+    if entry is None:
+        abort(404)
+    encoding = _preferred_asset_encoding(entry, request.headers.get('Accept-Encoding', ''))
+    resp = Response(entry['variants'][encoding], mimetype=entry['mimetype'])
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    resp.headers['X-Content-Type-Options'] = 'nosniff'
+    resp.set_etag(f"{entry['etag']}-{encoding}")
+    return resp.make_conditional(request)
+
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Fingerprint and precompress everything under static/ and print the manifest."""
+    count = asset_registry.build()
+    if asset_registry._brotli is None:
+        print('[assets] brotli not installed; only gzip variants were built')
+    for logical, url in asset_registry.manifest().items():
+        entry = asset_registry._entries[logical]
+        sizes = ' '.join(f"{enc}={len(body)}" for enc, body in entry['variants'].items())
+        print(f"{logical} -> {url} ({sizes})")
+    print(f"Registered {count} assets.")
+
+
+# Configure structured logging to stdout so Vercel captures full logs and tracebacks.
+# Records are JSON (LOG_FORMAT=text for plain lines) carrying the request id, route,
+# user kind, latency and DB query count, and are written by a background listener so
+# request threads never block on stdout (on serverless each request waits for its
+# records to be written before it ends); see structured_logging.
 log_level = logging.DEBUG if os.environ.get("DEBUG", "").lower() in ("1", "true", "yes") else logging.INFO
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(log_level)
-stream_formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
-stream_handler.setFormatter(stream_formatter)
-if not any(isinstance(h, logging.StreamHandler) for h in app.logger.handlers):
-    app.logger.addHandler(stream_handler)
-app.logger.setLevel(log_level)
+_REQUEST_ID_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.:')
+
+
+def _user_kind():
+    """'admin', 'customer' or 'anonymous', without loading the user if Flask-Login hasn't yet."""
+    user = g.get('_login_user')
+    if user is not None:
+        if not getattr(user, 'is_authenticated', False):
+            return 'anonymous'
+        return 'admin' if getattr(user, 'is_admin', False) else 'customer'
+    # dict.get skips the session's access tracking, so logging never adds Vary: Cookie
+    user_id = str(dict.get(session._get_current_object(), '_user_id') or '')
+    if not user_id:
+        return 'anonymous'
+    return 'admin' if user_id.startswith('AdminUser:') else 'customer'
+
+
+def _log_context():
+    """Request fields for every log record emitted while serving a request."""
+    if not has_request_context():
+        return None
+    fields = {'request_id': g.get('request_id'), 'method': request.method, 'path': request.path,
+              'route': request.endpoint}
+    try:
+        fields['user'] = _user_kind()
+    except Exception:
+        pass
+    started = g.get('request_started')
+    if started is not None:
+        fields['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    stats = g.get('query_stats')
+    if stats is not None:
+        fields['db_queries'] = stats.count
+        fields['db_ms'] = round(stats.seconds * 1000, 3)
+    return fields
+
+
+log_handler = structured_logging.configure(
+    app.logger, level=log_level, fmt=os.environ.get('LOG_FORMAT', 'json').lower(), context=_log_context,
+    rate_limit=float(os.environ.get('LOG_RATE_LIMIT_SECONDS', '60') or 0))
+app.config.setdefault('LOG_REQUESTS', os.environ.get('LOG_REQUESTS', '1') != '0')
+
+
+@app.before_request
+def _assign_request_id():
+    g.request_started = time.perf_counter()
+    incoming = request.headers.get('X-Request-ID', '')
+    if incoming and len(incoming) <= 64 and set(incoming) <= _REQUEST_ID_CHARS:
+        g.request_id = incoming
+    else:
+        g.request_id = uuid.uuid4().hex
+
+
+@app.after_request
+def _log_request(response):
+    # Registered first, so it runs after every other after_request hook
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+        if app.config.get('LOG_REQUESTS') and request.endpoint != 'static':
+            app.logger.info('%s %s %s', request.method, request.path, response.status_code,
+                            extra={'status': response.status_code})
+    return response
+
+
+@app.teardown_request
+def _flush_request_logs(exc=None):
+    # Registered first, so it runs after every other teardown hook. A serverless
+    # instance can be frozen once the response is sent, with the access line or a
+    # 500's traceback still queued for the listener thread
+    if is_serverless():
+        structured_logging.flush()
+
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 PAYSTACK_SECRET = os.environ.get("PAYSTACK_SECRET_KEY", "")
@@ -282,14 +734,91 @@ else:
 
 ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "cyberworldstore360@gmail.com")
 
+# One SSL context for every DB connection in this process: building it once
+# avoids reloading the CA bundle, and reusing it lets reconnects resume the TLS
+# session instead of repeating the full handshake (see db_pool.build_ssl_context).
+# It is built when a DB URL first needs it, so SQLite deployments never load the bundle.
+_db_ssl_context = None
+
+
+def get_db_ssl_context():
+    global _db_ssl_context
+    if _db_ssl_context is None:
+        try:
+            _db_ssl_context = db_pool.build_ssl_context(os.environ.get('DB_SSL_CAFILE') or None)
+        except Exception:
+            _db_ssl_context = ssl.create_default_context()
+    return _db_ssl_context
+
 # Create SQLAlchemy instance without binding to app immediately so we can
 # handle missing DB drivers (e.g. psycopg2) gracefully at import time.
 db = SQLAlchemy()
 migrate = None
+sqlite_write_lock = None  # db_pool.SQLiteWriteLock when SQLITE_SERIALIZE_WRITES=1
 # Create a LoginManager instance early so decorators (e.g. @login_manager.user_loader)
 # can be applied at import time; it will be bound to the Flask app in _safe_initialize_extensions.
 login_manager = LoginManager()
 
+def _start_db_warmup(application):
+    """Open and validate one DB connection during init instead of on the first request.
+
+    DB_WARMUP=1 runs it in a background thread while the rest of the app loads,
+    DB_WARMUP=sync runs it inline and 0 disables it; the default is on for the
+    serverless pool profile only, whose pool then keeps the connection (see
+    db_pool). The outcome is kept in config['DB_WARMUP'].
+    """
+    mode = (os.environ.get('DB_WARMUP') or '').strip().lower()
+    if not db_pool.warmup_enabled(application.config.get('DB_POOL_PROFILE'), os.environ):
+        application.config['DB_WARMUP'] = {'status': 'disabled'}
+        return None
+    try:
+        with application.app_context():
+            engine = db.engine
+    except Exception:
+        application.config['DB_WARMUP'] = {'status': 'unavailable'}
+        return None
+    application.config['DB_WARMUP'] = {'status': 'running'}
+
+    def _run():
+        result = db_pool.warm_up(engine)
+        application.config['DB_WARMUP'] = {'status': 'ok' if result['ok'] else 'failed', **result}
+        if not result['ok']:
+            application.logger.warning('DB warm-up failed after %.0fms: %s', result['ms'], result['error'])
+
+    if mode == 'sync':
+        _run()
+        return None
+    t = threading.Thread(target=_run, name='db-warmup', daemon=True)
+    t.start()
+    return t
+
+
+# Flask-Migrate pulls in alembic and mako (~100ms) at import, yet only `flask db ...`
+# and AUTO_MIGRATE use it, so neither is imported on a cold start.
+def init_migrate(application):
+    """Bind Flask-Migrate to `application` (once); needed before running alembic commands."""
+    global migrate
+    if 'migrate' not in application.extensions:
+        from flask_migrate import Migrate
+        migrate = Migrate(application, db)
+    return application.extensions['migrate']
+
+
+class _LazyMigrateGroup(click.Group):
+    """`flask db ...`: Flask-Migrate's command group, loaded only when a db command runs."""
+
+    def _group(self, ctx):
+        init_migrate(app)
+        from flask_migrate.cli import db as migrate_group
+        return migrate_group
+
+    def list_commands(self, ctx):
+        return self._group(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._group(ctx).get_command(ctx, name)
+
+
 def _safe_initialize_extensions(application):
     """Init DB and extensions while handling missing DB drivers.
 
@@ -300,15 +829,15 @@ def _safe_initialize_extensions(application):
     - If neither driver is present and URI is Postgres: fall back to a local
       SQLite file so the app can still start and serve diagnostics.
     """
-    global migrate, login_manager
+    global login_manager, sqlite_write_lock
     try:
         import importlib.util
         uri = application.config.get("SQLALCHEMY_DATABASE_URI", "") or ""
         is_postgres = uri.startswith("postgres://") or uri.startswith("postgresql://")
 
         if is_postgres:
-            have_psycopg2 = importlib.util.find_spec("psycopg2") is not None or importlib.util.find_spec("psycopg2_binary") is not None
-            have_pg8000 = importlib.util.find_spec("pg8000") is not None
+            have_psycopg2 = _driver_installed("psycopg2") or _driver_installed("psycopg2_binary")
+            have_pg8000 = _driver_installed("pg8000")
 
             if not have_psycopg2 and have_pg8000:
                 # Rewrite to use pg8000 dialect for SQLAlchemy
@@ -339,7 +868,7 @@ def _safe_initialize_extensions(application):
                 # keyword args. Use a default SSL context for 'require' and related modes.
                 if had_sslmode:
                     try:
-                        ctx = ssl.create_default_context()
+                        ctx = get_db_ssl_context()
                         application.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
                         # pg8000 expects 'ssl_context' keyword in its connect args
                         application.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('connect_args', {})
@@ -373,7 +902,7 @@ def _safe_initialize_extensions(application):
                 application.config['SQLALCHEMY_DATABASE_URI'] = cleaned_any
                 uri = cleaned_any
                 try:
-                    ctx_any = ssl.create_default_context()
+                    ctx_any = get_db_ssl_context()
                     application.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
                     application.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('connect_args', {})
                     application.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['ssl_context'] = ctx_any
@@ -392,7 +921,7 @@ def _safe_initialize_extensions(application):
                 application.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('connect_args', {})
                 if 'ssl_context' not in application.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']:
                     try:
-                        ctx_default = ssl.create_default_context()
+                        ctx_default = get_db_ssl_context()
                         application.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['ssl_context'] = ctx_default
                         # Also provide explicit ssl=True/required flag to pg8000 connect args
                         application.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['ssl'] = True
@@ -404,9 +933,36 @@ def _safe_initialize_extensions(application):
                 application.logger.debug('ssl cleanup encountered an error; continuing')
             except Exception:
                 pass
+        # Pool settings for this deployment (see db_pool); explicitly configured options win
+        try:
+            uri = application.config.get('SQLALCHEMY_DATABASE_URI', '') or ''
+            profile = db_pool.detect_pool_profile(uri, os.environ)
+            application.config['DB_POOL_PROFILE'] = profile
+            options = application.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+            for key, value in db_pool.engine_options_for_profile(profile, uri, os.environ).items():
+                options.setdefault(key, value)
+            db_pool.timed_engine_options(options, uri)
+            application.logger.info('Using the %s DB pool profile', profile)
+        except Exception:
+            application.logger.warning('Failed to apply DB pool profile; using SQLAlchemy defaults')
         # Now initialize DB and other extensions
         db.init_app(application)
-        migrate = Migrate(application, db)
+        try:
+            with application.app_context():
+                for engine in db.engines.values():
+                    db_pool.instrument_engine(engine)
+                    query_stats.instrument(engine)
+        except Exception:
+            application.logger.warning('Failed to instrument the DB engine; connect metrics unavailable')
+        # WAL, busy_timeout and the other SQLite pragmas (and the optional write lock)
+        try:
+            with application.app_context():
+                for engine in db.engines.values():
+                    sqlite_write_lock = db_pool.configure_sqlite(engine, os.environ) or sqlite_write_lock
+        except Exception:
+            application.logger.warning('Failed to configure SQLite pragmas; using SQLite defaults')
+        _start_db_warmup(application)
+        # Flask-Migrate is bound on demand (see init_migrate and the `db` CLI group)
         # Bind the pre-created LoginManager instance to the application.
         # Do NOT reassign `login_manager` here because the @login_manager.user_loader
         # decorator registers callbacks on the original instance at module import time.
@@ -421,6 +977,221 @@ def _safe_initialize_extensions(application):
 
 # Call safe init so extensions are configured at import time but protected
 _safe_initialize_extensions(app)
+app.cli.add_command(_LazyMigrateGroup('db', help='Perform database migrations.'))
+
+# Per-request SQL statistics (see query_stats): query count, DB time and repeated
+# statements for every request, summarised at /admin/perf. SQL_STATS_HEADERS adds
+# them as X-SQL-* response headers (on by default in debug mode).
+app.config.setdefault('SQL_STATS', os.environ.get('SQL_STATS', '1') != '0')
+app.config.setdefault('SQL_STATS_HEADERS', os.environ.get('SQL_STATS_HEADERS') == '1')
+app.config.setdefault('SQL_REPEAT_THRESHOLD', int(os.environ.get('SQL_REPEAT_THRESHOLD', '5') or 5))
+
+
+@app.before_request
+def _start_query_stats():
+    if app.config.get('SQL_STATS') and request.endpoint != 'static':
+        g.query_stats, g.query_stats_token = query_stats.start()
+
+
+@app.after_request
+def _record_query_stats(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    try:
+        # Unmatched URLs share one label; the path is client-controlled and unbounded
+        repeated = query_stats.report.record(request.endpoint or 'unmatched', request.path,
+                                             response.status_code, stats, app.config['SQL_REPEAT_THRESHOLD'])
+        if app.debug or app.config.get('SQL_STATS_HEADERS'):
+            response.headers['X-SQL-Queries'] = str(stats.count)
+            response.headers['X-SQL-Time-Ms'] = f'{stats.seconds * 1000:.1f}'
+            if repeated:
+                worst = repeated[0]
+                response.headers['X-SQL-Repeated'] = (f"{worst['count']}x {worst['statement'][:200]}"
+                                                      .encode('ascii', 'replace').decode('ascii'))
+                app.logger.warning('Possible N+1 in %s: %sx %s', request.endpoint, worst['count'],
+                                   worst['statement'][:500])
+    except Exception:
+        app.logger.debug('Failed to record query stats', exc_info=True)
+    return response
+
+
+@app.teardown_request
+def _stop_query_stats(exc=None):
+    token = g.pop('query_stats_token', None)
+    if token is not None:
+        query_stats.stop(token)
+
+
+# Prometheus metrics (see metrics.py), served at /metrics to holders of METRICS_TOKEN.
+# METRICS_DIR aggregates them across gunicorn workers.
+metrics_registry = metrics.configure_from_env(os.environ, metrics.Registry())
+HTTP_REQUESTS = metrics.Counter('shop_http_requests_total', 'HTTP requests by method, endpoint and status.',
+                                ['method', 'endpoint', 'status'], registry=metrics_registry)
+HTTP_LATENCY = metrics.Histogram('shop_http_request_duration_seconds', 'HTTP request latency by endpoint.',
+                                 ['method', 'endpoint'], registry=metrics_registry)
+HTTP_IN_FLIGHT = metrics.Gauge('shop_http_requests_in_flight', 'Requests being served.', registry=metrics_registry)
+DB_POOL_CHECKOUTS = metrics.Counter('shop_db_pool_checkouts_total', 'DB pool connection checkouts.',
+                                    registry=metrics_registry)
+DB_POOL_FAILURES = metrics.Counter('shop_db_pool_checkout_failures_total',
+                                   'DB pool checkouts that failed or timed out.', registry=metrics_registry)
+DB_POOL_SLOW = metrics.Counter('shop_db_pool_slow_checkouts_total', 'DB pool checkouts that waited too long.',
+                               registry=metrics_registry)
+DB_POOL_IN_USE = metrics.Gauge('shop_db_pool_connections_in_use', 'DB connections checked out.',
+                               registry=metrics_registry)
+DB_POOL_CAPACITY = metrics.Gauge('shop_db_pool_capacity', 'DB pool size plus overflow (0 when unbounded).',
+                                 registry=metrics_registry)
+DB_POOL_CHECKOUT_P95 = metrics.Gauge('shop_db_pool_checkout_p95_seconds',
+                                     'p95 DB pool checkout wait over recent checkouts (worst worker).',
+                                     registry=metrics_registry, mode='livemax')
+EMAIL_QUEUE_DEPTH = metrics.Gauge('shop_email_queue_depth', 'Emails waiting to be sent, by queue.', ['queue'],
+                                  registry=metrics_registry, mode='local')
+CACHE_REQUESTS = metrics.Counter('shop_cache_requests_total', 'In-process cache lookups by cache and result.',
+                                 ['cache', 'result'], registry=metrics_registry)
+OUTBOUND_LATENCY = metrics.Histogram('shop_outbound_request_duration_seconds',
+                                     'Latency of calls to Paystack and SendGrid.',
+                                     ['service', 'operation', 'outcome'], registry=metrics_registry)
+
+
+def _request_db_connections() -> int:
+    """Connections held by the current request's session; Flask-SQLAlchemy returns
+    them when the app context ends, after the request's metrics are written."""
+    if not has_request_context() or not db.session.registry.has():
+        return 0
+    transaction = db.session().get_transaction()
+    return len(getattr(transaction, '_connections', None) or ()) if transaction is not None else 0
+
+
+@metrics_registry.collect
+def _collect_process_metrics():
+    pool = db_pool.pool_metrics.snapshot()
+    DB_POOL_CHECKOUTS.set_total(pool['checkouts'])
+    DB_POOL_FAILURES.set_total(pool['failures'])
+    DB_POOL_SLOW.set_total(pool['slow_checkouts'])
+    DB_POOL_IN_USE.set(max(pool['in_use'] - _request_db_connections(), 0))
+    DB_POOL_CAPACITY.set(pool['capacity'] or 0)
+    DB_POOL_CHECKOUT_P95.set(pool['checkout_ms_p95'] / 1000)
+    for name, cache in (('image_manifest', image_manifest), ('assets', asset_registry)):
+        CACHE_REQUESTS.set_total(cache.hits, cache=name, result='hit')
+        CACHE_REQUESTS.set_total(cache.misses, cache=name, result='miss')
+
+
+@metrics_registry.scrape
+def _scrape_queue_depths():
+    EMAIL_QUEUE_DEPTH.set(FailedEmail.query.filter(FailedEmail.attempts < 5).count(), queue='failed_email')
+    queue = _get_rq_queue()
+    if queue is not None:
+        EMAIL_QUEUE_DEPTH.set(queue.count, queue='rq_emails')
+
+
+@metrics_registry.derive
+def _derive_cache_hit_ratio(merged):
+    totals = {}
+    for (cache, result), value in merged.get('shop_cache_requests_total', {}).get('values', []):
+        totals.setdefault(cache, {})[result] = value
+    values = [[[cache], counts.get('hit', 0) / (counts.get('hit', 0) + counts.get('miss', 0))]
+              for cache, counts in totals.items() if counts.get('hit', 0) + counts.get('miss', 0)]
+    return {'shop_cache_hit_ratio': {'type': 'gauge', 'help': 'Cache hits / lookups since start, by cache.',
+                                     'labelnames': ['cache'], 'values': values}}
+
+
+@contextmanager
+def _outbound_call(service, operation):
+    """Time a call to an external API: ``with _outbound_call('paystack', 'verify') as call: ...``.
+
+    Set ``call['status']`` to the HTTP status; an exception is recorded as outcome ``error``.
+    """
+    call = {'status': None}
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        status = call['status']
+        outcome = f'{str(status)[0]}xx' if status else 'error'
+        OUTBOUND_LATENCY.observe(time.perf_counter() - started, service=service, operation=operation,
+                                 outcome=outcome)
+
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_LATENCY.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+        HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(exc=None):
+    if g.pop('metrics_started', None) is not None:
+        HTTP_IN_FLIGHT.dec()
+        # After the decrement, so the file does not count this request as in flight
+        metrics_registry.flush()
+
+
+# On-demand profiling (see request_profiler): a request carrying PROFILER_TOKEN (or,
+# if unset, ERROR_VIEW_TOKEN) in X-Profile-Token or ?__profile= runs under cProfile and
+# its call tree is kept in profile_buffer, listed on /admin/diagnostics.
+profile_buffer = request_profiler.ProfileBuffer(int(os.environ.get('PROFILE_BUFFER_SIZE', '20') or 20))
+
+
+@app.before_request
+def _start_request_profile():
+    expected = os.environ.get('PROFILER_TOKEN') or os.environ.get('ERROR_VIEW_TOKEN')
+    if not expected:
+        return
+    token = request_profiler.requested_token(request)
+    if not token:
+        return
+    import hmac
+    if not hmac.compare_digest(token.encode(), expected.encode()):
+        return
+    try:
+        g.request_profile = request_profiler.RequestProfile()
+    except ValueError:
+        # Another profiler is already active in this thread
+        app.logger.warning('Request profiling unavailable: another profiler is active')
+
+
+@app.after_request
+def _store_request_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return response
+    try:
+        entry = profile.finish(request.method, request_profiler.profiled_path(request), request.endpoint,
+                               response.status_code)
+        profile_buffer.add(entry)
+        response.headers['X-Profile-Id'] = entry['id']
+    except Exception:
+        app.logger.warning('Failed to store request profile', exc_info=True)
+    return response
+
+
+@app.teardown_request
+def _stop_request_profile(exc=None):
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop()
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text format; needs METRICS_TOKEN as a bearer token (or ?token=)."""
+    import hmac
+    expected = os.environ.get('METRICS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    token = auth[7:] if auth.startswith('Bearer ') else request.args.get('token', '')
+    if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+        abort(403)
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 CURRENCY = "GH\u20B5"  # GH₵
 
@@ -440,6 +1211,7 @@ def init_db_on_first_request():
             if os.environ.get('AUTO_MIGRATE') == '1':
                 try:
                     from flask_migrate import upgrade as _fl_upgrade
+                    init_migrate(app)
                     app.logger.info('AUTO_MIGRATE=1: running alembic upgrade head')
                     _fl_upgrade()
                 except Exception as mig_exc:
@@ -595,6 +1367,82 @@ def _ensure_settings_columns():
 
 
 
+# Recent exceptions, grouped by fingerprint, for /__last_error (see error_buffer).
+# With ERROR_LOG_DB=1 the groups are also upserted into error_group in batches, from
+# a timer thread ERROR_LOG_FLUSH_SECONDS after the first unsaved error, so the error
+# path itself never waits on the database.
+error_log = error_buffer.ErrorBuffer(int(os.environ.get('ERROR_BUFFER_SIZE', '100') or 100),
+                                     track_pending=os.environ.get('ERROR_LOG_DB') == '1')
+_error_flush_timer = None
+_error_flush_lock = threading.Lock()
+
+
+def _fit_column(column, value):
+    """`value` cut to the length of String `column`, so a long value cannot fail the insert."""
+    length = getattr(column.type, 'length', None)
+    return value[:length] if value and length else value
+
+
+def _record_error(exc, tb=None):
+    """Add `exc` to error_log with the current request's route and request id."""
+    route = request_id = None
+    if has_request_context():
+        # The path (unmatched routes have no endpoint) is client-controlled and unbounded
+        route = _fit_column(ErrorGroup.route, request.endpoint or request.path)
+        request_id = _fit_column(ErrorGroup.request_id, g.get('request_id'))
+    try:
+        error_log.record(exc, route=route, request_id=request_id, tb=tb)
+    except Exception:
+        app.logger.debug('Failed to record error', exc_info=True)
+        return
+    if os.environ.get('ERROR_LOG_DB') == '1':
+        _schedule_error_flush()
+
+
+def _schedule_error_flush():
+    global _error_flush_timer
+    with _error_flush_lock:
+        if _error_flush_timer is not None:
+            return
+        delay = float(os.environ.get('ERROR_LOG_FLUSH_SECONDS', '30') or 30)
+        _error_flush_timer = threading.Timer(delay, _flush_error_groups)
+        _error_flush_timer.daemon = True
+        _error_flush_timer.start()
+
+
+def _flush_error_groups():
+    """Upsert the error groups recorded since the last flush; returns how many were saved."""
+    global _error_flush_timer
+    with _error_flush_lock:
+        _error_flush_timer = None
+    batch = error_log.take_pending()
+    if not batch:
+        return 0
+    try:
+        with app.app_context():
+            fingerprints = [group['fingerprint'] for group in batch]
+            rows = {r.fingerprint: r for r in ErrorGroup.query.filter(ErrorGroup.fingerprint.in_(fingerprints))}
+            for group in batch:
+                row = rows.get(group['fingerprint'])
+                if row is None:
+                    row = ErrorGroup(fingerprint=group['fingerprint'], count=0, first_seen=group['first_seen'])
+                    db.session.add(row)
+                row.count = (row.count or 0) + group['new']
+                row.exc_type = _fit_column(ErrorGroup.exc_type, group['type'])
+                row.message = group['message']
+                row.route = _fit_column(ErrorGroup.route, group['route'])
+                row.request_id = _fit_column(ErrorGroup.request_id, group['request_id'])
+                row.traceback = group['traceback']
+                row.last_seen = group['last_seen']
+            db.session.commit()
+    except Exception:
+        app.logger.warning('Failed to persist %s error groups; will retry', len(batch), exc_info=True)
+        error_log.restore_pending(batch)
+        _schedule_error_flush()
+        return 0
+    return len(batch)
+
+
 # Global error handler to catch unhandled exceptions and log full tracebacks
 @app.errorhandler(500)
 def handle_internal_server_error(e):
@@ -611,18 +1459,8 @@ def handle_internal_server_error(e):
         except Exception:
             pass
     # Return a friendly error page while logging details
-    # Persist last traceback to a temporary file (serverless writable path)
-    try:
-        last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-        with open(last_err_path, 'w', encoding='utf-8') as fh:
-            fh.write(f"Time: {utc_now().isoformat()}\n")
-            fh.write(str(e) + "\n\n")
-            fh.write(tb)
-    except Exception:
-        try:
-            app.logger.exception('Failed to write last_error file')
-        except Exception:
-            pass
+    # Keep the traceback in the error buffer for /__last_error
+    _record_error(getattr(e, 'original_exception', None) or e, tb)
 
     # Clear any failed DB transaction state to prevent subsequent 'in failed transaction block' errors
     try:
@@ -641,20 +1479,28 @@ def handle_internal_server_error(e):
         return ("Internal Server Error", 500)
 
 
-# Secure endpoint to fetch the last saved traceback (protected by ERROR_VIEW_TOKEN env var)
+# Secure endpoint listing recent errors, grouped by fingerprint with counts (protected by
+# ERROR_VIEW_TOKEN env var). ?source=db lists the persisted error_group rows instead;
+# ?format=json (or Accept: application/json) returns JSON.
 @app.route('/__last_error')
 def __last_error():
     token = request.args.get('token') or request.headers.get('X-ERROR-TOKEN')
     expected = os.environ.get('ERROR_VIEW_TOKEN')
     if not expected or token != expected:
         abort(403)
-    last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-    try:
-        with open(last_err_path, 'r', encoding='utf-8') as fh:
-            content = fh.read()
-    except Exception:
-        content = ''
-    return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    if request.args.get('source') == 'db':
+        rows = ErrorGroup.query.order_by(ErrorGroup.last_seen.desc()).limit(error_log.size).all()
+        groups = [{'fingerprint': r.fingerprint, 'type': r.exc_type, 'count': r.count, 'message': r.message,
+                   'route': r.route, 'request_id': r.request_id, 'traceback': r.traceback,
+                   'first_seen': r.first_seen, 'last_seen': r.last_seen} for r in rows]
+    else:
+        groups = error_log.grouped()
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        for group in groups:
+            for key in ('first_seen', 'last_seen'):
+                group[key] = group[key].isoformat() if group[key] else None
+        return jsonify({'status': 'success', 'errors': groups})
+    return error_buffer.format_groups(groups), 200, {'Content-Type': 'text/plain; charset=utf-8'}
 
 
 # Temporary secure admin reset endpoint (protected by ADMIN_RESET_TOKEN env var)
@@ -693,6 +1539,8 @@ class Product(db.Model):
     price_ghc = db.Column(db.Numeric(10, 2), nullable=False, default=0.0)
     old_price_ghc = db.Column(db.Numeric(10, 2))
     image = db.Column(db.String(300))
+    # External stock-keeping unit; the key for bulk import upserts
+    sku = db.Column(db.String(64), unique=True, index=True, nullable=True)
     # Optional BLOB fallback for serverless deployments where saving to static is not possible
     product_image_data = db.Column(db.LargeBinary, nullable=True)
     product_image_mime = db.Column(db.String(50), nullable=True)
@@ -700,6 +1548,12 @@ class Product(db.Model):
     card_size = db.Column(db.String(20), default='medium')
     created_at = db.Column(db.DateTime, default=utc_now)
 
+    # Storefront listings: newest first, and the featured strip
+    __table_args__ = (
+        db.Index('ix_product_created_at_id', 'created_at', 'id'),
+        db.Index('ix_product_featured_created_at', 'featured', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<Product id={self.id} title='{self.title}' price={self.price_ghc}>"
 
@@ -725,6 +1579,7 @@ class Product(db.Model):
         """Convert product to dictionary for API responses"""
         return {
             "id": self.id,
+            "sku": self.sku,
             "title": self.title,
             "short": self.short,
             "price_ghc": float(self.price_ghc or 0),
@@ -856,11 +1711,17 @@ class User(UserMixin, db.Model):
 class Wallet(db.Model):
     """User wallet for storing balance"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True, index=True)
     balance = db.Column(db.Numeric(10, 2), default=0.0, nullable=False)
     created_at = db.Column(db.DateTime, default=utc_now)
     updated_at = db.Column(db.DateTime, default=utc_now, onupdate=utc_now)
 
+    __table_args__ = (
+        # Admin wallet list sorts
+        db.Index('ix_wallet_balance', 'balance'),
+        db.Index('ix_wallet_updated_at', 'updated_at'),
+    )
+
     def __repr__(self):
         return f"<Wallet user_id={self.user_id} balance={self.balance}>"
 
@@ -921,11 +1782,23 @@ class Order(db.Model):
     subtotal = db.Column(db.Numeric(12, 2), nullable=False, default=0)
     discount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
     total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
-    status = db.Column(db.String(20), default='pending')  # pending, completed, cancelled
+    # active_history: the sales rollups need the previous value even when the row was expired
+    status = column_property(db.Column(db.String(20), default='pending'), active_history=True)  # pending, completed, cancelled
     payment_method = db.Column(db.String(20), default='unknown')  # wallet, paystack, unknown
     payment_reference = db.Column(db.String(200), nullable=True)
-    paid = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=utc_now)
+    paid = column_property(db.Column(db.Boolean, default=False), active_history=True)
+    created_at = db.Column(db.DateTime, default=utc_now, nullable=False)
+
+    # Composite indexes backing the admin order list filters and keyset pagination
+    __table_args__ = (
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_paid_created_at', 'paid', 'created_at'),
+        db.Index('ix_order_payment_method_created_at', 'payment_method', 'created_at'),
+        db.Index('ix_order_email', 'email'),
+        # Customer account order history
+        db.Index('ix_order_user_id_created_at', 'user_id', 'created_at'),
+    )
 
     def __repr__(self):
         return f"<Order id={self.id} ref='{self.reference}' status='{self.status}' total={self.total}>"
@@ -984,7 +1857,7 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, nullable=True)
     title = db.Column(db.String(255))
     qty = db.Column(db.Integer, nullable=False, default=1)
@@ -1118,6 +1991,10 @@ class OrderLog(db.Model):
     note = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=utc_now)
 
+    __table_args__ = (
+        db.Index('ix_order_log_order_id_created_at', 'order_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<OrderLog id={self.id} order_id={self.order_id} {self.old_status}→{self.new_status}>"
 
@@ -1133,6 +2010,115 @@ class OrderLog(db.Model):
         }
 
 
+class AdminAuditLog(db.Model):
+    """Audit trail for admin bulk operations (one row per operation, not per product)."""
+    __tablename__ = 'admin_audit_log'
+    id = db.Column(db.Integer, primary_key=True)
+    actor = db.Column(db.String(120))
+    action = db.Column(db.String(40), nullable=False)
+    target = db.Column(db.String(40), nullable=False, default='product')
+    affected = db.Column(db.Integer, default=0)
+    detail = db.Column(db.Text)  # JSON: the operation's parameters and selection
+    created_at = db.Column(db.DateTime, default=utc_now, index=True)
+
+    def __repr__(self):
+        return f"<AdminAuditLog id={self.id} {self.action} {self.target} affected={self.affected}>"
+
+    def to_display_dict(self):
+        try:
+            detail = _json.loads(self.detail) if self.detail else {}
+        except ValueError:
+            detail = {}
+        return {
+            "id": self.id,
+            "actor": self.actor or "System",
+            "action": self.action,
+            "target": self.target,
+            "affected": self.affected or 0,
+            "detail": detail,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class ErrorGroup(db.Model):
+    """Persisted error_buffer groups: one row per fingerprint, counts summed across processes."""
+    __tablename__ = 'error_group'
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(40), nullable=False, unique=True)
+    exc_type = db.Column(db.String(120))
+    message = db.Column(db.Text)
+    route = db.Column(db.String(120))
+    request_id = db.Column(db.String(64))
+    traceback = db.Column(db.Text)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_seen = db.Column(db.DateTime, default=utc_now)
+    last_seen = db.Column(db.DateTime, default=utc_now, index=True)
+
+    def __repr__(self):
+        return f"<ErrorGroup {self.fingerprint} {self.exc_type} count={self.count}>"
+
+
+class DailySales(db.Model):
+    """Per-day sales rollup, kept current by the order flush hook (see _apply_sales_rollups)."""
+    __tablename__ = 'daily_sales'
+    day = db.Column(db.Date, primary_key=True)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    discount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailySales day={self.day} orders={self.orders_count} revenue={self.revenue}>"
+
+
+class ProductSalesDaily(db.Model):
+    """Per-day, per-product sales rollup. product_id 0 collects items without a product."""
+    __tablename__ = 'product_sales_daily'
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(255))
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ProductSalesDaily day={self.day} product_id={self.product_id} qty={self.qty}>"
+
+
+class CustomerSegment(db.Model):
+    """RFM (recency, frequency, monetary) scores per customer; see refresh_customer_segments."""
+    __tablename__ = 'customer_segment'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    last_order_at = db.Column(db.DateTime)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    monetary = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    recency_score = db.Column(db.Integer, nullable=False, default=1)
+    frequency_score = db.Column(db.Integer, nullable=False, default=1)
+    monetary_score = db.Column(db.Integer, nullable=False, default=1)
+    segment = db.Column(db.String(30), index=True)
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    def __repr__(self):
+        return f"<CustomerSegment user_id={self.user_id} rfm={self.rfm} segment='{self.segment}'>"
+
+    @property
+    def rfm(self):
+        return f"{self.recency_score}{self.frequency_score}{self.monetary_score}"
+
+
+class SegmentRun(db.Model):
+    """One customer_segment refresh. last_order_id is the watermark for the next incremental run."""
+    __tablename__ = 'segment_run'
+    id = db.Column(db.Integer, primary_key=True)
+    full = db.Column(db.Boolean, default=False)
+    last_order_id = db.Column(db.Integer, nullable=False, default=0)
+    customers_updated = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, default=utc_now)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<SegmentRun id={self.id} last_order_id={self.last_order_id} updated={self.customers_updated}>"
+
+
 class Slider(db.Model):
     """Product sliders for homepage"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1276,6 +2262,11 @@ class FailedEmail(db.Model):
     last_attempt_at = db.Column(db.DateTime, default=None)
     created_at = db.Column(db.DateTime, default=utc_now)
 
+    # The retry loop scans for rows under the attempt limit
+    __table_args__ = (
+        db.Index('ix_failed_email_attempts_last_attempt_at', 'attempts', 'last_attempt_at'),
+    )
+
     def __repr__(self):
         return f"<FailedEmail id={self.id} to={self.to_address} attempts={self.attempts}>"
 
@@ -1296,6 +2287,52 @@ class FailedEmail(db.Model):
             "age_minutes": int((utc_now() - self.created_at).total_seconds() / 60) if self.created_at else 0,
         }
 
+
+class StoredFile(db.Model):
+    """Uploaded file kept in the database by the `db` storage backend (served at /files/<key>)."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(512), unique=True, nullable=False, index=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    content_type = db.Column(db.String(100), default='application/octet-stream')
+    size = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=utc_now)
+
+    def __repr__(self):
+        return f"<StoredFile key={self.key} size={self.size}>"
+
+
+class ImageJob(db.Model):
+    """Background processing job for an uploaded admin image (see enqueue_image_job)."""
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, processing, done, failed
+    target = db.Column(db.String(20), nullable=False)  # 'product' or 'settings'
+    target_id = db.Column(db.Integer, nullable=True)  # product id
+    slot = db.Column(db.String(20), nullable=True)  # settings slot: logo, banner1, banner2, bg
+    filename = db.Column(db.String(255), nullable=False)
+    staging_path = db.Column(db.String(1000), nullable=False)
+    result_url = db.Column(db.String(1000), nullable=True)
+    derivatives = db.Column(db.Text, nullable=True)  # JSON: {name: url}
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=utc_now)
+    updated_at = db.Column(db.DateTime, default=utc_now, onupdate=utc_now)
+
+    def __repr__(self):
+        return f"<ImageJob id={self.id} status={self.status} target={self.target}>"
+
+    def to_display_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "target": self.target,
+            "target_id": self.target_id,
+            "slot": self.slot,
+            "url": self.result_url,
+            "derivatives": _json.loads(self.derivatives) if self.derivatives else {},
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
 @login_manager.user_loader
 def load_user(user_id):
     """Load user from session - tries AdminUser first, then User (customer)"""
@@ -1415,6 +2452,12 @@ def _safe_db_rollback_and_close():
                 pass
 
 
+def is_serverless() -> bool:
+    """Return True on Vercel (or Lambda), where /tmp is the only writable folder and
+    belongs to one short-lived instance."""
+    return bool(os.environ.get('VERCEL') or os.environ.get('VERCEL_URL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+
+
 def is_s3_configured():
     """Return True if AWS S3 env vars are present to enable S3 uploads."""
     return bool(os.environ.get('AWS_S3_BUCKET') and os.environ.get('AWS_ACCESS_KEY_ID') and os.environ.get('AWS_SECRET_ACCESS_KEY'))
@@ -1430,72 +2473,200 @@ def _is_upload_folder_writable() -> bool:
         test_path.write_text('ok')
         test_path.unlink()
         return True
-    except Exception:
+    except Exception as e:
+        app.logger.warning('Upload folder %s is not writable: %s', app.config.get('UPLOAD_FOLDER'), e)
         return False
 
 
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'auto').strip().lower()
+_s3_storage_instance = None
+_storage_lock = threading.Lock()
+
+
+def _s3_storage():
+    """Return the shared S3 driver (one boto3 client per process)."""
+    global _s3_storage_instance
+    if _s3_storage_instance is None:
+        with _storage_lock:
+            if _s3_storage_instance is None:
+                _s3_storage_instance = S3Storage(
+                    bucket=os.environ.get('AWS_S3_BUCKET'),
+                    region=os.environ.get('AWS_REGION'),
+                    endpoint_url=os.environ.get('AWS_S3_ENDPOINT_URL'),
+                    access_key=os.environ.get('AWS_ACCESS_KEY_ID'),
+                    secret_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+                    prefix=os.environ.get('AWS_S3_PREFIX', 'uploads/images'),
+                    public_base_url=os.environ.get('AWS_S3_PUBLIC_URL'),
+                    acl=os.environ.get('AWS_S3_ACL', 'public-read'),
+                    multipart_threshold=int(os.environ.get('AWS_S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024))),
+                )
+    return _s3_storage_instance
+
+
+def get_storage(name=None):
+    """Return the storage driver for `name` ('local', 's3' or 'db').
+
+    Without a name the configured STORAGE_BACKEND is used; 'auto' picks the local
+    upload folder when writable (never on serverless), then S3 when configured,
+    then the database.
+    """
+    name = (name or STORAGE_BACKEND or 'auto').lower()
+    if name == 'auto':
+        return _storage_chain()[0]
+    if name == 'local':
+        return LocalStorage(app.config.get('UPLOAD_FOLDER', ''), on_put=image_manifest.add)
+    if name == 's3':
+        return _s3_storage()
+    if name == 'db':
+        return DatabaseStorage(db, StoredFile)
+    raise ValueError(f'Unknown storage backend: {name}')
+
+
+def _storage_chain():
+    """Drivers to try, in order, for the configured backend."""
+    if STORAGE_BACKEND != 'auto':
+        return [get_storage(STORAGE_BACKEND)]
+    chain = []
+    # A serverless instance's /tmp is writable but lost on the next cold start, and
+    # other instances cannot see it
+    if not is_serverless() and _is_upload_folder_writable():
+        chain.append(get_storage('local'))
+    if is_s3_configured():
+        chain.append(get_storage('s3'))
+    chain.append(get_storage('db'))
+    return chain
+
+
 def _save_uploaded_file(file_obj, filename, mime_type=None) -> str:
-    """Save an uploaded file to local `UPLOAD_FOLDER` or, if not writable and S3 configured,
-    fallback to S3 and return the public URL/path for the saved file. Returns the chosen
-    path (local /uploads/images/<filename> or S3 URL). Raises on fatal errors when neither
-    option is available.
+    """Store an uploaded file through the configured storage backend and return its URL.
+
+    Local saves return /uploads/images/<filename>, S3 saves the bucket URL and database
+    saves /files/<filename>. In 'auto' mode each driver is tried in turn; raises IOError
+    when none of them accepts the file.
     """
-    folder = Path(app.config.get('UPLOAD_FOLDER', ''))
-    local_path = folder / filename
-    # Ensure bucket path for S3
-    s3_key = f"uploads/images/{filename}"
-    # First try local write if possible
-    if _is_upload_folder_writable():
+    for storage in _storage_chain():
         try:
-            file_obj.seek(0)
-            # werkzeug FileStorage has save
-            file_obj.save(local_path)
-            return f"/uploads/images/{filename}"
-        except Exception:
-            # fallthrough to S3
-            pass
-    # If local save failed or not writable, try S3
-    if is_s3_configured():
+            return storage.put(filename, file_obj, content_type=mime_type)
+        except Exception as e:
+            try:
+                app.logger.warning('Storage backend %s failed for %s: %s', storage.name, filename, e)
+            except Exception:
+                print(f'Storage backend {storage.name} failed for {filename}: {e}')
+    raise IOError('Failed to save uploaded file to any storage backend')
+
+
+# Settings image URL columns may still be String(300) on databases that predate the widening
+_MAX_SETTINGS_IMAGE_URL = 300
+
+
+def _store_settings_image(settings, slot, file, filename=None, mime_type=None):
+    """Store an uploaded settings image (`slot` is logo, banner1, banner2 or bg) and point
+    `settings` at it, dropping any legacy base64 blob for that slot."""
+    mime_type = mime_type or get_mime_type(file.filename)
+    filename = filename or f"{slot}_{int(time.time())}_{secure_filename(file.filename)}"
+    saved = _save_uploaded_file(file, filename, mime_type=mime_type)
+    if len(saved) > _MAX_SETTINGS_IMAGE_URL:
         try:
-            file_obj.seek(0)
-            url = upload_to_s3(file_obj, s3_key, mime_type=mime_type)
-            if url:
-                return url
+            app.logger.warning('Storage URL too long for DB; storing %s in database len=%s', slot, len(saved))
         except Exception:
             pass
-    # If we've reached here, nothing worked
-    raise IOError('Failed to save uploaded file locally or to S3')
+        saved = get_storage('db').put(filename, file, content_type=mime_type)
+    _assign_settings_image(settings, slot, saved, mime_type)
+    return saved
+
+
+def _assign_settings_image(settings, slot, url, mime_type):
+    """Point a settings image slot at `url` and drop any legacy base64 blob.
+
+    Raises ValueError when `url` does not fit the slot's column.
+    """
+    if len(url) > _MAX_SETTINGS_IMAGE_URL:
+        raise ValueError(f'Image URL is too long to store ({len(url)} > {_MAX_SETTINGS_IMAGE_URL} characters)')
+    setattr(settings, f'{slot}_image', url)
+    setattr(settings, f'{slot}_image_data', None)
+    setattr(settings, f'{slot}_image_mime', mime_type)
+
+
+@app.route('/files/<path:key>')
+def stored_file(key):
+    """Stream a file kept by the database (or, for private buckets, S3) storage backend."""
+    backends = ['db'] + (['s3'] if is_s3_configured() else [])
+    for name in backends:
+        try:
+            obj = get_storage(name).open_stream(key)
+        except (FileNotFoundError, StorageError):
+            continue
+        except Exception as e:
+            try:
+                app.logger.warning('Stored file read failed (%s): %s', name, e)
+            except Exception:
+                pass
+            _safe_db_rollback_and_close()
+            continue
+        resp = Response(obj.chunks, mimetype=obj.content_type, direct_passthrough=True)
+        if obj.size is not None:
+            resp.content_length = obj.size
+        if obj.etag:
+            resp.set_etag(obj.etag)
+        resp.headers['Cache-Control'] = 'public, max-age=3600'
+        resp.headers['X-Content-Type-Options'] = 'nosniff'
+        return resp.make_conditional(request)
+    return _placeholder_image_response()
+
+
+# Presigned direct-to-bucket uploads: the browser sends the file to S3 and the app only
+# records the key, so admin uploads never stream through a worker.
+DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get('DIRECT_UPLOAD_MAX_BYTES', str(app.config['MAX_CONTENT_LENGTH'])))
+DIRECT_UPLOAD_EXPIRES = int(os.environ.get('DIRECT_UPLOAD_EXPIRES', '300'))
+_DIRECT_UPLOAD_TYPES = {'image/png', 'image/jpeg', 'image/gif'}
+SETTINGS_IMAGE_SLOTS = ('logo', 'banner1', 'banner2', 'bg')
+
+
+def direct_uploads_enabled() -> bool:
+    """Return True when uploads can go straight to S3 (bucket configured and not pinned to local/db)."""
+    return is_s3_configured() and STORAGE_BACKEND in ('auto', 's3')
+
+
+def _direct_upload_serializer():
+    from itsdangerous import URLSafeTimedSerializer
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='direct-upload')
+
+
+def _verify_direct_upload(token):
+    """Check a finalize token against the uploaded object and return (url, mime_type).
+
+    Raises ValueError when the token is invalid or expired, or the object is missing,
+    too large or of a different content type than was signed.
+    """
+    from itsdangerous import BadSignature
+    try:
+        claims = _direct_upload_serializer().loads(token, max_age=DIRECT_UPLOAD_EXPIRES + 3600)
+    except BadSignature:
+        raise ValueError('Invalid or expired upload token')
+    storage = _s3_storage()
+    try:
+        info = storage.stat(claims['key'])
+    except FileNotFoundError:
+        raise ValueError('Uploaded object not found')
+    if not info['size'] or info['size'] > DIRECT_UPLOAD_MAX_BYTES:
+        storage.delete(claims['key'])
+        raise ValueError('Uploaded object exceeds the size limit')
+    if (info['content_type'] or '').split(';')[0] != claims['content_type']:
+        storage.delete(claims['key'])
+        raise ValueError('Uploaded object has the wrong content type')
+    return storage.url(claims['key']), claims['content_type']
+
+
+app.jinja_env.globals['direct_uploads_enabled'] = direct_uploads_enabled
 
 
 def upload_to_s3(file_obj, key, mime_type=None):
     """Upload file-like object to S3 and return the public URL. Returns None on failure.
 
-    Expects env vars: AWS_S3_BUCKET, AWS_REGION (optional). Uses boto3 if installed.
+    Expects env vars: AWS_S3_BUCKET, AWS_REGION (optional). Reuses the shared S3 driver.
     """
     try:
-        import importlib
-        boto3 = importlib.import_module('boto3')
-        bucket = os.environ.get('AWS_S3_BUCKET')
-        region = os.environ.get('AWS_REGION') or None
-        # Build client using env creds
-        s3 = boto3.client('s3',
-                          aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-                          aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-                          region_name=region)
-        # Prepare body
-        file_obj.seek(0)
-        body = file_obj.read()
-        extra_args = {}
-        if mime_type:
-            extra_args['ContentType'] = mime_type
-        # Use a reasonably unique key
-        s3.put_object(Bucket=bucket, Key=key, Body=body, ACL='public-read', **extra_args)
-        # Construct public URL (standard S3 URL)
-        if region and region != 'us-east-1':
-            url = f"https://{bucket}.s3.{region}.amazonaws.com/{key}"
-        else:
-            url = f"https://{bucket}.s3.amazonaws.com/{key}"
-        return url
+        return _s3_storage().put(key, file_obj, content_type=mime_type)
     except Exception as e:
         try:
             app.logger.warning('S3 upload failed: %s', e)
@@ -1503,6 +2674,717 @@ def upload_to_s3(file_obj, key, mime_type=None):
             pass
 
 
+# ============================================================================
+# Background image processing
+# ============================================================================
+# Admin uploads are written to a staging folder and recorded as ImageJob rows. Once
+# the admin request commits, a worker thread validates and optimizes the image,
+# builds derivatives and stores everything through the storage backend; the admin
+# UI polls /admin/uploads/jobs/<id> for the result.
+IMAGE_STAGING_DIR = Path(os.environ.get('IMAGE_STAGING_DIR') or (Path(tempfile.gettempdir()) / 'image_staging'))
+
+
+def _image_processing_mode() -> str:
+    """IMAGE_PROCESSING_MODE: 'background' returns immediately; 'inline' finishes the
+    job before the request returns.
+
+    Serverless defaults to inline: the staged file is in one instance's /tmp and the
+    worker thread is frozen once the response is sent, so a background job could
+    only be finished by a status poll that happens to reach the same instance.
+    """
+    mode = (os.environ.get('IMAGE_PROCESSING_MODE') or '').strip().lower()
+    return mode or ('inline' if is_serverless() else 'background')
+
+
+IMAGE_PROCESSING_MODE = _image_processing_mode()
+# Jobs still pending after this many seconds are finished by the status endpoint (serverless
+# hosts may freeze the worker thread once the response is sent)
+IMAGE_JOB_STALE_SECONDS = int(os.environ.get('IMAGE_JOB_STALE_SECONDS', '30'))
+_image_executor = None
+_image_executor_lock = threading.Lock()
+
+
+def _get_image_executor():
+    global _image_executor
+    if _image_executor is None:
+        with _image_executor_lock:
+            if _image_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _image_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('IMAGE_WORKERS', '2')),
+                                                     thread_name_prefix='image-job')
+    return _image_executor
+
+
+def enqueue_image_job(file, target, target_id=None, slot=None):
+    """Stage an uploaded image and add an ImageJob for it to the current session.
+
+    The job is dispatched only when the surrounding transaction commits and its
+    staging file is removed if the transaction rolls back.
+    """
+    IMAGE_STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    filename = f"{slot or 'product'}_{int(time.time())}_{job_id[:8]}_{secure_filename(file.filename)}"
+    staging = IMAGE_STAGING_DIR / f"{job_id}_{filename}"
+    file.save(str(staging))
+    job = ImageJob(id=job_id, target=target, target_id=target_id, slot=slot,
+                   filename=filename, staging_path=str(staging))
+    db.session.add(job)
+    db.session.info.setdefault('image_jobs', []).append((job_id, str(staging)))
+    return job
+
+
+def _queue_product_image(product, file):
+    """Queue `file` as the product's new image; store it synchronously if staging is unavailable."""
+    try:
+        job = enqueue_image_job(file, 'product', target_id=product.id)
+        _remember_image_job(job)
+        return job
+    except OSError:
+        mime_type = get_mime_type(file.filename)
+        filename = f"{int(time.time())}_{secure_filename(file.filename)}"
+        product.image = _save_uploaded_file(file, filename, mime_type=mime_type)
+        # Clear any legacy blob so get_image_url() serves the new upload
+        product.product_image_data = None
+        product.product_image_mime = mime_type
+        return None
+
+
+@sa_event.listens_for(db.session, 'after_commit')
+def _dispatch_committed_image_jobs(session):
+    for job_id, _staging in session.info.pop('image_jobs', None) or []:
+        try:
+            future = _get_image_executor().submit(process_image_job, job_id)
+            if IMAGE_PROCESSING_MODE == 'inline':
+                future.result(timeout=120)
+        except Exception as e:
+            try:
+                app.logger.warning('Image job %s dispatch failed: %s', job_id, e)
+            except Exception:
+                print(f'Image job {job_id} dispatch failed: {e}')
+
+
+@sa_event.listens_for(db.session, 'after_soft_rollback')
+def _discard_rolled_back_image_jobs(session, previous_transaction):
+    for _job_id, staging in session.info.pop('image_jobs', None) or []:
+        try:
+            os.unlink(staging)
+        except OSError:
+            pass
+
+
+def _claim_image_job(job_id) -> bool:
+    """Atomically move a pending (or abandoned processing) job to 'processing'."""
+    from datetime import timedelta
+    from sqlalchemy import update, or_, and_
+    abandoned = utc_now() - timedelta(seconds=IMAGE_JOB_STALE_SECONDS * 10)
+    result = db.session.execute(
+        update(ImageJob)
+        .where(ImageJob.id == job_id)
+        .where(or_(ImageJob.status == 'pending',
+                   and_(ImageJob.status == 'processing', ImageJob.updated_at < abandoned)))
+        .values(status='processing', updated_at=utc_now())
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def process_image_job(job_id) -> bool:
+    """Validate, optimize and store a staged image, then attach it to its product or settings slot."""
+    import io
+    with app.app_context():
+        keep_staging = False
+        staging = None
+        try:
+            if not _claim_image_job(job_id):
+                return False
+            job = db.session.get(ImageJob, job_id)
+            staging = job.staging_path
+            with open(staging, 'rb') as fh:
+                processed = process_image(fh.read())
+            if job.target == 'settings':
+                settings = get_settings()
+                url = _store_settings_image(settings, job.slot, io.BytesIO(processed.data),
+                                            filename=job.filename, mime_type=processed.mime_type)
+                settings.updated_at = utc_now()
+            else:
+                product = db.session.get(Product, job.target_id)
+                if product is None:
+                    raise ValueError(f'Product {job.target_id} no longer exists')
+                url = _save_uploaded_file(io.BytesIO(processed.data), job.filename, mime_type=processed.mime_type)
+                product.image = url
+                product.product_image_data = None
+                product.product_image_mime = processed.mime_type
+            stem, ext = os.path.splitext(job.filename)
+            derivatives = {}
+            for name, blob in processed.derivatives.items():
+                derivatives[name] = _save_uploaded_file(io.BytesIO(blob), f"{stem}_{name}{ext}",
+                                                        mime_type=processed.mime_type)
+            job.status = 'done'
+            job.result_url = url
+            job.derivatives = _json.dumps(derivatives)
+            job.error = None
+            db.session.commit()
+            return True
+        except Exception as e:
+            # Keep the staged file for a retry unless the image itself was rejected
+            keep_staging = not isinstance(e, ImageValidationError)
+            try:
+                app.logger.warning('Image job %s failed: %s', job_id, e)
+            except Exception:
+                print(f'Image job {job_id} failed: {e}')
+            _safe_db_rollback_and_close()
+            try:
+                job = db.session.get(ImageJob, job_id)
+                if job is not None:
+                    job.status = 'failed'
+                    job.error = str(e)[:1000]
+                    db.session.commit()
+            except Exception:
+                _safe_db_rollback_and_close()
+            return False
+        finally:
+            if staging and not keep_staging:
+                try:
+                    os.unlink(staging)
+                except OSError:
+                    pass
+            db.session.remove()
+
+
+def _image_job_age(job) -> float:
+    created = job.created_at
+    if created is None:
+        return 0.0
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return (utc_now() - created).total_seconds()
+
+
+def pending_image_jobs():
+    """Return (and forget) the image job ids queued by this admin session, for the status poller."""
+    try:
+        return session.pop('image_jobs', [])
+    except Exception:
+        return []
+
+
+app.jinja_env.globals['pending_image_jobs'] = pending_image_jobs
+
+
+def _remember_image_job(job):
+    session['image_jobs'] = (session.get('image_jobs') or []) + [job.id]
+
+
+@app.cli.command("process-image-jobs")
+@click.option('--retry-failed', is_flag=True, help='Also retry failed jobs whose staged file still exists.')
+def process_image_jobs_command(retry_failed):
+    """Run pending (and abandoned) image jobs in this process."""
+    with app.app_context():
+        if retry_failed:
+            for job in ImageJob.query.filter_by(status='failed').all():
+                if job.staging_path and os.path.exists(job.staging_path):
+                    job.status = 'pending'
+            db.session.commit()
+        job_ids = [j.id for j in ImageJob.query.filter(ImageJob.status.in_(('pending', 'processing'))).all()]
+    done = sum(1 for job_id in job_ids if process_image_job(job_id))
+    print(f"Processed {done} of {len(job_ids)} image jobs.")
+
+
+# ============================================================================
+# Sales rollups
+# ============================================================================
+# daily_sales and product_sales_daily are maintained by an after_flush hook, so every
+# code path that creates orders or changes their status keeps them current in the
+# same transaction. An order counts as a sale while it is paid and not cancelled.
+# `flask backfill-sales-rollups` rebuilds them from the order tables.
+_rollup_tables_checked_at = None
+_rollup_tables_ready = False
+
+
+def order_counts_as_sale(paid, status) -> bool:
+    return bool(paid) and status != 'cancelled'
+
+
+def _rollup_day(created_at):
+    return (created_at or utc_now()).date()
+
+
+def _rollups_available(conn) -> bool:
+    """True once the rollup tables exist (rechecked every minute until they do)."""
+    global _rollup_tables_checked_at, _rollup_tables_ready
+    if _rollup_tables_ready:
+        return True
+    now = time.monotonic()
+    if _rollup_tables_checked_at is not None and now - _rollup_tables_checked_at < 60:
+        return False
+    _rollup_tables_checked_at = now
+    from sqlalchemy import inspect as sa_inspect
+    insp = sa_inspect(conn)
+    _rollup_tables_ready = insp.has_table('daily_sales') and insp.has_table('product_sales_daily')
+    if not _rollup_tables_ready:
+        try:
+            app.logger.warning('Sales rollup tables missing; run migrations then `flask backfill-sales-rollups`')
+        except Exception:
+            pass
+    return _rollup_tables_ready
+
+
+def _old_and_new(obj, attr):
+    from sqlalchemy import inspect as sa_inspect
+    new = getattr(obj, attr)
+    hist = sa_inspect(obj).attrs[attr].history
+    return (hist.deleted[0] if hist.deleted else new), new
+
+
+def _add_order_delta(daily, day, order, sign):
+    row = daily.setdefault(day, [0, Decimal('0'), Decimal('0'), 0])
+    row[0] += sign
+    row[1] += sign * Decimal(str(order.total or 0))
+    row[2] += sign * Decimal(str(order.discount or 0))
+
+
+def _add_item_delta(daily, products, day, product_id, title, qty, subtotal, sign):
+    daily.setdefault(day, [0, Decimal('0'), Decimal('0'), 0])[3] += sign * int(qty or 0)
+    row = products.setdefault((day, product_id or 0), [title, 0, Decimal('0')])
+    row[0] = row[0] or title
+    row[1] += sign * int(qty or 0)
+    row[2] += sign * Decimal(str(subtotal or 0))
+
+
+@sa_event.listens_for(db.session, 'after_flush')
+def _track_sales_rollups(session, flush_context):
+    """Turn order inserts, status/paid changes and deletions in this flush into rollup deltas."""
+    touched = any(isinstance(o, (Order, OrderItem))
+                  for group in (session.new, session.dirty, session.deleted) for o in group)
+    if not touched:
+        return
+    conn = session.connection()
+    if not _rollups_available(conn):
+        return
+    from sqlalchemy import select, func
+    daily, products = {}, {}
+
+    def order_state(order_id):
+        order = session.identity_map.get(session.identity_key(Order, order_id))
+        if order is not None:
+            return _rollup_day(order.created_at), order_counts_as_sale(order.paid, order.status)
+        row = conn.execute(select(Order.created_at, Order.paid, Order.status).where(Order.id == order_id)).first()
+        if row is None:
+            return None, False
+        return _rollup_day(row.created_at), order_counts_as_sale(row.paid, row.status)
+
+    new_item_ids = [o.id for o in session.new if isinstance(o, OrderItem)]
+    for obj in session.new:
+        if isinstance(obj, Order) and order_counts_as_sale(obj.paid, obj.status):
+            _add_order_delta(daily, _rollup_day(obj.created_at), obj, 1)
+        elif isinstance(obj, OrderItem):
+            day, counted = order_state(obj.order_id)
+            if counted:
+                _add_item_delta(daily, products, day, obj.product_id, obj.title, obj.qty, obj.subtotal, 1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Order) or not session.is_modified(obj, include_collections=False):
+            continue
+        old_paid, new_paid = _old_and_new(obj, 'paid')
+        old_status, new_status = _old_and_new(obj, 'status')
+        was, now = order_counts_as_sale(old_paid, old_status), order_counts_as_sale(new_paid, new_status)
+        if was == now:
+            continue
+        sign = 1 if now else -1
+        day = _rollup_day(obj.created_at)
+        _add_order_delta(daily, day, obj, sign)
+        items = conn.execute(
+            select(OrderItem.product_id, func.max(OrderItem.title).label('title'),
+                   func.sum(OrderItem.qty).label('qty'), func.sum(OrderItem.subtotal).label('subtotal'))
+            .where(OrderItem.order_id == obj.id, OrderItem.id.notin_(new_item_ids))
+            .group_by(OrderItem.product_id))
+        for it in items:
+            _add_item_delta(daily, products, day, it.product_id, it.title, it.qty, it.subtotal, sign)
+
+    for obj in session.deleted:
+        if isinstance(obj, Order) and order_counts_as_sale(obj.paid, obj.status):
+            _add_order_delta(daily, _rollup_day(obj.created_at), obj, -1)
+        elif isinstance(obj, OrderItem):
+            day, counted = order_state(obj.order_id)
+            if counted:
+                _add_item_delta(daily, products, day, obj.product_id, obj.title, obj.qty, obj.subtotal, -1)
+
+    _apply_sales_rollups(conn, daily, products)
+
+
+def _upsert_increment(conn, table, keys, increments, extra=None):
+    """Add `increments` to the row identified by `keys`, inserting it if missing."""
+    from sqlalchemy import and_, func
+    extra = extra or {}
+    values = {**keys, **increments, **extra}
+    dialect = conn.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        import importlib
+        insert = importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert
+        stmt = insert(table).values(**values)
+        set_ = {c: table.c[c] + stmt.excluded[c] for c in increments}
+        set_.update({c: func.coalesce(stmt.excluded[c], table.c[c]) for c in extra})
+        conn.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_))
+        return
+    match = and_(*[table.c[k] == v for k, v in keys.items()])
+    updates = {c: table.c[c] + v for c, v in increments.items()}
+    updates.update({c: v for c, v in extra.items() if v is not None})
+    if conn.execute(table.update().where(match).values(**updates)).rowcount == 0:
+        conn.execute(table.insert().values(**values))
+
+
+def _apply_sales_rollups(conn, daily, products):
+    for day, (orders, revenue, discount, items) in daily.items():
+        if orders or revenue or discount or items:
+            _upsert_increment(conn, DailySales.__table__, {'day': day},
+                              {'orders_count': orders, 'revenue': revenue, 'discount': discount, 'items_sold': items})
+    for (day, product_id), (title, qty, revenue) in products.items():
+        if qty or revenue:
+            _upsert_increment(conn, ProductSalesDaily.__table__, {'day': day, 'product_id': product_id},
+                              {'qty': qty, 'revenue': revenue}, extra={'title': title})
+
+
+def _as_date(value):
+    from datetime import date
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def sale_criteria(start=None, end=None) -> list:
+    """WHERE clauses for orders that count as sales created in [start, end] (dates)."""
+    from datetime import timedelta, datetime as _dt
+    from sqlalchemy import or_
+    counted = [Order.paid.is_(True), or_(Order.status.is_(None), Order.status != 'cancelled'),
+               Order.created_at.isnot(None)]
+    if start:
+        counted.append(Order.created_at >= _dt.combine(start, _dt.min.time()))
+    if end:
+        counted.append(Order.created_at < _dt.combine(end + timedelta(days=1), _dt.min.time()))
+    return counted
+
+
+def backfill_sales_rollups(start=None, end=None) -> dict:
+    """Rebuild the rollups for days in [start, end] (all days when omitted) from orders.
+
+    Uses two GROUP BY queries and replaces the affected rollup rows in one transaction.
+    """
+    from sqlalchemy import select, func, delete
+    counted = sale_criteria(start, end)
+    day = func.date(Order.created_at).label('day')
+    order_rows = db.session.execute(
+        select(day, func.count(Order.id), func.coalesce(func.sum(Order.total), 0),
+               func.coalesce(func.sum(Order.discount), 0))
+        .where(*counted).group_by(day)).all()
+    product_id = func.coalesce(OrderItem.product_id, 0).label('product_id')
+    item_rows = db.session.execute(
+        select(day, product_id, func.max(OrderItem.title), func.coalesce(func.sum(OrderItem.qty), 0),
+               func.coalesce(func.sum(OrderItem.subtotal), 0))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*counted).group_by(day, product_id)).all()
+
+    daily = {}
+    for d, count, revenue, discount in order_rows:
+        daily[_as_date(d)] = {'day': _as_date(d), 'orders_count': count, 'revenue': revenue,
+                              'discount': discount, 'items_sold': 0}
+    products = []
+    for d, pid, title, qty, revenue in item_rows:
+        d = _as_date(d)
+        daily.setdefault(d, {'day': d, 'orders_count': 0, 'revenue': 0, 'discount': 0, 'items_sold': 0})
+        daily[d]['items_sold'] += int(qty or 0)
+        products.append({'day': d, 'product_id': pid, 'title': title, 'qty': qty, 'revenue': revenue})
+
+    for model in (DailySales, ProductSalesDaily):
+        stmt = delete(model)
+        if start:
+            stmt = stmt.where(model.day >= start)
+        if end:
+            stmt = stmt.where(model.day <= end)
+        db.session.execute(stmt)
+    if daily:
+        db.session.execute(DailySales.__table__.insert(), list(daily.values()))
+    if products:
+        db.session.execute(ProductSalesDaily.__table__.insert(), products)
+    db.session.commit()
+    return {'days': len(daily), 'product_days': len(products)}
+
+
+def sales_summary(start, end, top=10) -> dict:
+    """Revenue, order count, AOV, daily series and top products for [start, end], from the rollups only."""
+    from sqlalchemy import select, func
+    days = DailySales.query.filter(DailySales.day >= start, DailySales.day <= end).order_by(DailySales.day).all()
+    revenue = sum((Decimal(str(d.revenue or 0)) for d in days), Decimal('0'))
+    orders = sum(int(d.orders_count or 0) for d in days)
+    discount = sum((Decimal(str(d.discount or 0)) for d in days), Decimal('0'))
+    total_revenue = func.sum(ProductSalesDaily.revenue).label('revenue')
+    top_rows = db.session.execute(
+        select(ProductSalesDaily.product_id, func.max(ProductSalesDaily.title).label('title'),
+               func.sum(ProductSalesDaily.qty).label('qty'), total_revenue)
+        .where(ProductSalesDaily.day >= start, ProductSalesDaily.day <= end)
+        .group_by(ProductSalesDaily.product_id)
+        .order_by(total_revenue.desc())
+        .limit(top)).all()
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'revenue': float(revenue),
+        'orders': orders,
+        'average_order_value': float(revenue / orders) if orders else 0.0,
+        'discount': float(discount),
+        'items_sold': sum(int(d.items_sold or 0) for d in days),
+        'daily': [{'day': d.day.isoformat(), 'orders': d.orders_count, 'revenue': float(d.revenue or 0)} for d in days],
+        'top_products': [{'product_id': r.product_id or None, 'title': r.title, 'qty': int(r.qty or 0),
+                          'revenue': float(r.revenue or 0)} for r in top_rows],
+    }
+
+
+@app.cli.command("backfill-sales-rollups")
+@click.option('--start', default=None, help='First day to rebuild (YYYY-MM-DD); default: all history.')
+@click.option('--end', default=None, help='Last day to rebuild (YYYY-MM-DD); default: today.')
+def backfill_sales_rollups_command(start, end):
+    """Rebuild daily_sales and product_sales_daily from the order tables."""
+    from datetime import date
+    with app.app_context():
+        result = backfill_sales_rollups(date.fromisoformat(start) if start else None,
+                                        date.fromisoformat(end) if end else None)
+    print(f"Rebuilt {result['days']} daily rows and {result['product_days']} product-day rows.")
+
+
+# ============================================================================
+# Sales analytics (NumPy)
+# ============================================================================
+# Deeper reports (day/week series, cohorts, discount impact) load the counted orders
+# as raw column tuples into NumPy arrays; see analytics.py. NumPy is imported on
+# first use so the app still starts without it.
+ANALYTICS_REPORTS = ('daily', 'weekly', 'cohorts', 'discounts')
+
+
+def _analytics_module():
+    import importlib
+    try:
+        return importlib.import_module('analytics')
+    except Exception as e:
+        try:
+            app.logger.warning(f"Analytics unavailable (is numpy installed?): {e}")
+        except Exception:
+            print(f"Analytics unavailable (is numpy installed?): {e}")
+        return None
+
+
+def load_order_columns(start=None, end=None, batch_size=None):
+    """Fetch counted orders created in [start, end] into an `analytics.OrderColumns`."""
+    analytics = _analytics_module()
+    if analytics is None:
+        raise RuntimeError('numpy is required for sales analytics')
+    from sqlalchemy import select, func, cast, Float
+    batch_size = batch_size or analytics.DEFAULT_BATCH_SIZE
+    # Convert in SQL: epoch seconds and floats load into arrays far faster than datetime/Decimal objects
+    stmt = (select(cast(func.extract('epoch', Order.created_at), Float), Order.email,
+                   cast(Order.total, Float), cast(Order.discount, Float), cast(Order.subtotal, Float))
+            .where(*sale_criteria(start, end))
+            .execution_options(yield_per=batch_size))
+    result = db.session.execute(stmt)
+    return analytics.OrderColumns.from_batches(result.partitions(batch_size))
+
+
+def sales_analytics_report(report, start=None, end=None, window=None, period='month', periods=12) -> dict:
+    """Run one of `ANALYTICS_REPORTS` over counted orders in [start, end]."""
+    if report not in ANALYTICS_REPORTS:
+        raise ValueError(f"Unknown report {report!r}; expected one of {', '.join(ANALYTICS_REPORTS)}")
+    analytics = _analytics_module()
+    if analytics is None:
+        raise RuntimeError('numpy is required for sales analytics')
+    cols = load_order_columns(start, end)
+    if report == 'daily':
+        data = analytics.daily_totals(cols, start, end, window=window or 7)
+    elif report == 'weekly':
+        data = analytics.weekly_totals(cols, start, end, window=window or 4)
+    elif report == 'cohorts':
+        data = analytics.cohort_retention(cols, period=period, periods=periods)
+    else:
+        data = analytics.discount_impact(cols)
+    return {'report': report, 'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None, 'orders_loaded': len(cols), **data}
+
+
+@app.cli.command("sales-analytics")
+@click.argument('report', type=click.Choice(ANALYTICS_REPORTS))
+@click.option('--start', default=None, help='First day (YYYY-MM-DD); default: all history.')
+@click.option('--end', default=None, help='Last day (YYYY-MM-DD); default: today.')
+@click.option('--window', default=None, type=int, help='Moving-average window for daily/weekly reports.')
+@click.option('--period', default='month', type=click.Choice(['month', 'week']), help='Cohort period.')
+@click.option('--periods', default=12, type=int, help='Number of cohort periods to track.')
+def sales_analytics_command(report, start, end, window, period, periods):
+    """Print a sales analytics report as JSON."""
+    from datetime import date
+    with app.app_context():
+        data = sales_analytics_report(report, date.fromisoformat(start) if start else None,
+                                      date.fromisoformat(end) if end else None,
+                                      window=window, period=period, periods=periods)
+    print(_json.dumps(data, indent=2))
+
+
+# ============================================================================
+# Customer segments (RFM)
+# ============================================================================
+# Every registered customer with a counted order gets 1-5 scores for recency (days
+# since the last order), frequency (number of orders) and monetary (total spent),
+# plus a named segment. Scores use fixed thresholds rather than quantiles, so an
+# incremental run only re-aggregates customers with orders newer than the previous
+# run's watermark. Recency changes as time passes, so each run re-scores every row
+# with set-based UPDATEs. Use --full after bulk cancellations or refunds.
+RFM_RECENCY_DAYS = (30, 60, 120, 240)         # ordered within 30 days -> 5 ... over 240 -> 1
+RFM_FREQUENCY_ORDERS = (10, 5, 3, 2)          # 10+ orders -> 5 ... a single order -> 1
+RFM_MONETARY_TOTAL = (5000, 2000, 1000, 300)  # spent 5000+ -> 5 ... under 300 -> 1
+CUSTOMER_SEGMENTS = (
+    ('champions', 'Recent, frequent, high spenders'),
+    ('loyal', 'Order often'),
+    ('new', 'First order was recent'),
+    ('at_risk', 'Valuable customers who have not ordered for a while'),
+    ('lapsed', 'Have not ordered for a while'),
+    ('regular', 'Everyone else'),
+)
+SEGMENT_INSERT_BATCH_SIZE = 1000
+COUPON_INSERT_BATCH_SIZE = int(os.environ.get('COUPON_INSERT_BATCH_SIZE', '500'))
+
+
+def _rfm_score_updates(now):
+    from datetime import timedelta
+    from sqlalchemy import case
+    cs = CustomerSegment
+    return {
+        'recency_score': case(*[(cs.last_order_at >= now - timedelta(days=days), 5 - i)
+                                for i, days in enumerate(RFM_RECENCY_DAYS)], else_=1),
+        'frequency_score': case(*[(cs.orders_count >= n, 5 - i)
+                                  for i, n in enumerate(RFM_FREQUENCY_ORDERS)], else_=1),
+        'monetary_score': case(*[(cs.monetary >= amount, 5 - i)
+                                 for i, amount in enumerate(RFM_MONETARY_TOTAL)], else_=1),
+    }
+
+
+def _segment_from_scores():
+    from sqlalchemy import case, and_, or_
+    r, f, m = CustomerSegment.recency_score, CustomerSegment.frequency_score, CustomerSegment.monetary_score
+    return case(
+        (and_(r >= 4, f >= 4, m >= 4), 'champions'),
+        (and_(r >= 3, f >= 4), 'loyal'),
+        (and_(r >= 4, f == 1), 'new'),
+        (and_(r <= 2, or_(f >= 3, m >= 4)), 'at_risk'),
+        (r <= 2, 'lapsed'),
+        else_='regular',
+    )
+
+
+def refresh_customer_segments(full=False, now=None) -> dict:
+    """Recompute customer_segment. Incremental unless `full` or there is no previous run.
+
+    The RFM inputs come from one GROUP BY query over orders, limited to customers with
+    orders newer than the last run's watermark; scores and segments are then
+    recomputed in SQL for every row.
+    """
+    from sqlalchemy import select, func, delete, insert, update
+    now = (now or utc_now()).replace(tzinfo=None)
+    started = utc_now()
+    previous = SegmentRun.query.order_by(SegmentRun.id.desc()).first()
+    full = full or previous is None
+    since = 0 if full else previous.last_order_id
+    # Taken before aggregating: orders arriving during the run are picked up next time
+    watermark = db.session.execute(select(func.coalesce(func.max(Order.id), 0))).scalar() or 0
+
+    stmt = (select(Order.user_id, func.max(Order.created_at), func.count(Order.id),
+                   func.coalesce(func.sum(Order.total), 0))
+            .where(*sale_criteria(), Order.user_id.isnot(None), Order.id <= watermark)
+            .group_by(Order.user_id))
+    cleanup = delete(CustomerSegment)
+    if not full:
+        changed = select(Order.user_id).where(Order.id > since, Order.id <= watermark,
+                                              Order.user_id.isnot(None))
+        stmt = stmt.where(Order.user_id.in_(changed))
+        cleanup = cleanup.where(CustomerSegment.user_id.in_(changed))
+    rows = [{'user_id': uid, 'last_order_at': last, 'orders_count': count, 'monetary': total,
+             'updated_at': now} for uid, last, count, total in db.session.execute(stmt)]
+
+    try:
+        db.session.execute(cleanup)
+        for i in range(0, len(rows), SEGMENT_INSERT_BATCH_SIZE):
+            db.session.execute(insert(CustomerSegment), rows[i:i + SEGMENT_INSERT_BATCH_SIZE])
+        db.session.execute(update(CustomerSegment).values(**_rfm_score_updates(now)),
+                           execution_options={'synchronize_session': False})
+        db.session.execute(update(CustomerSegment).values(segment=_segment_from_scores()),
+                           execution_options={'synchronize_session': False})
+        db.session.add(SegmentRun(full=full, last_order_id=watermark, customers_updated=len(rows),
+                                  started_at=started, finished_at=utc_now()))
+        db.session.commit()
+    except Exception:
+        _safe_db_rollback_and_close()
+        raise
+    return {'full': full, 'customers_updated': len(rows), 'last_order_id': watermark}
+
+
+def customer_segment_counts() -> dict:
+    """Customers per segment, every segment present (0 when empty)."""
+    from sqlalchemy import select, func
+    counts = dict(db.session.execute(
+        select(CustomerSegment.segment, func.count()).group_by(CustomerSegment.segment)).all())
+    return {name: counts.get(name, 0) for name, _ in CUSTOMER_SEGMENTS}
+
+
+def _new_coupon_codes(prefix, count):
+    import secrets
+    return [f"{prefix}-{secrets.token_hex(4).upper()}" for _ in range(count)]
+
+
+def issue_segment_coupons(segment, discount_type, discount_value, expiry_date=None, prefix='SEG',
+                          min_amount=Decimal('0'), max_discount=None, batch_size=None) -> list:
+    """Create one single-use coupon per customer in `segment`, in batched INSERTs.
+
+    Returns ``[(email, code), ...]`` so the codes can be sent out. Either every
+    coupon is created or none is.
+    """
+    from sqlalchemy import select, insert
+    batch_size = batch_size or COUPON_INSERT_BATCH_SIZE
+    emails = db.session.execute(
+        select(User.email).join(CustomerSegment, CustomerSegment.user_id == User.id)
+        .where(CustomerSegment.segment == segment).order_by(User.id)).scalars().all()
+    issued = []
+    try:
+        for i in range(0, len(emails), batch_size):
+            chunk = emails[i:i + batch_size]
+            codes = _new_coupon_codes(prefix, len(chunk))
+            # Random codes can collide with existing ones; redraw those before inserting
+            while True:
+                taken = set(db.session.execute(select(Coupon.code).where(Coupon.code.in_(codes))).scalars())
+                taken |= {c for c in codes if codes.count(c) > 1}
+                if not taken:
+                    break
+                codes = [c for c in codes if c not in taken]
+                codes += _new_coupon_codes(prefix, len(chunk) - len(codes))
+            db.session.execute(insert(Coupon), [
+                {'code': code, 'discount_type': discount_type, 'discount_value': discount_value,
+                 'max_uses': 1, 'current_uses': 0, 'min_amount': min_amount, 'max_discount': max_discount,
+                 'expiry_date': expiry_date, 'is_active': True}
+                for code in codes])
+            issued.extend(zip(chunk, codes))
+        db.session.commit()
+    except Exception:
+        _safe_db_rollback_and_close()
+        raise
+    return issued
+
+
+@app.cli.command("refresh-customer-segments")
+@click.option('--full', is_flag=True, help='Rebuild every customer instead of only those with new orders.')
+def refresh_customer_segments_command(full):
+    """Recompute RFM scores and segments in customer_segment."""
+    with app.app_context():
+        result = refresh_customer_segments(full=full)
+        counts = customer_segment_counts()
+    mode = 'Full' if result['full'] else 'Incremental'
+    print(f"{mode} refresh: {result['customers_updated']} customers updated (orders up to #{result['last_order_id']}).")
+    for name, count in counts.items():
+        print(f"  {name:<10} {count}")
+
+
 # ============================================================================
 # Helper Functions for Data Validation, Type Conversion, and Formatting
 # ============================================================================
@@ -1582,26 +3464,13 @@ def get_settings():
             app.logger.warning("Could not query Settings (db schema mismatch): %s", e)
         except Exception:
             pass
-        # Attempt to rollback any failed session state, then persist last traceback
+        # Attempt to rollback any failed session state, then record the traceback
         try:
             _safe_db_rollback_and_close()
         except Exception:
             pass
-        # Persist last traceback for easier debugging in serverless/production
-        try:
-            import traceback
-            tb = traceback.format_exc()
-            last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-            with open(last_err_path, 'w', encoding='utf-8') as fh:
-                fh.write(f"Time: {utc_now().isoformat()}\n")
-                fh.write(str(e) + '\n\n')
-                fh.write(tb)
-        except Exception:
-            # If we can't persist to /tmp, do not crash the app
-            try:
-                app.logger.exception('Failed to write last_error file')
-            except Exception:
-                pass
+        # Keep the traceback for /__last_error
+        _record_error(e)
         return Settings()
 
     if not settings:
@@ -1724,6 +3593,7 @@ def send_email(to_address: str, subject: str, body: str):
             except Exception:
                 print("[sendgrid error] falling back to SMTP")
 
+    import smtplib
     context = ssl.create_default_context()
     try:
         if MAIL_USE_SSL:
@@ -1769,7 +3639,10 @@ def _send_via_sendgrid(to_address: str, subject: str, body: str, html_body = Non
 
     headers = {"Authorization": f"Bearer {SENDGRID_API_KEY}", "Content-Type": "application/json"}
     try:
-        r = requests.post("https://api.sendgrid.com/v3/mail/send", headers=headers, json=payload, timeout=15)
+        with _outbound_call('sendgrid', 'send') as call:
+            import requests
+            r = requests.post("https://api.sendgrid.com/v3/mail/send", headers=headers, json=payload, timeout=15)
+            call['status'] = getattr(r, 'status_code', None)
         if r.status_code in (200, 202):
             return True
         try:
@@ -1820,9 +3693,10 @@ def send_email_async(to_address: str, subject: str, body: str):
         return False
 
     # If RQ is configured, enqueue the send job there so it can be executed by workers
-    if USE_RQ:
+    rq_queue = _get_rq_queue()
+    if rq_queue is not None:
         try:
-            _rq_queue.enqueue(send_email, to_address, subject, body)
+            rq_queue.enqueue(send_email, to_address, subject, body)
             return True
         except Exception:
             try:
@@ -1883,6 +3757,7 @@ def send_html_email(to_address: str, subject: str, html_body: str, plain_text =
             except Exception:
                 print("[sendgrid error] falling back to SMTP")
 
+    import smtplib
     context = ssl.create_default_context()
     try:
         if MAIL_USE_SSL:
@@ -1914,9 +3789,10 @@ def send_html_email_async(to_address: str, subject: str, html_body: str, plain_t
         return False
 
     # If RQ is configured, enqueue the send job there
-    if USE_RQ:
+    rq_queue = _get_rq_queue()
+    if rq_queue is not None:
         try:
-            _rq_queue.enqueue(send_html_email, to_address, subject, html_body, plain_text)
+            rq_queue.enqueue(send_html_email, to_address, subject, html_body, plain_text)
             return True
         except Exception:
             try:
@@ -1935,6 +3811,43 @@ def send_html_email_async(to_address: str, subject: str, html_body: str, plain_t
     return True
 
 
+def send_html_email_batch(messages):
+    """Send (to_address, subject, html_body, plain_text) messages in turn; failures are stored for retry."""
+    sent = 0
+    for to_address, subject, html_body, plain_text in messages:
+        try:
+            ok = send_html_email(to_address, subject, html_body, plain_text)
+        except Exception:
+            ok = False
+        if ok:
+            sent += 1
+        else:
+            enqueue_failed_email(to_address, subject, plain_text or html_body)
+    return sent
+
+
+def send_html_emails_async(messages):
+    """Queue many HTML emails as one background job (one RQ job or one thread, not one per email)."""
+    messages = [m for m in messages if is_valid_email(m[0])]
+    if not messages:
+        return 0
+
+    rq_queue = _get_rq_queue()
+    if rq_queue is not None:
+        try:
+            rq_queue.enqueue(send_html_email_batch, messages)
+            return len(messages)
+        except Exception:
+            try:
+                app.logger.exception("RQ enqueue failed, falling back to thread")
+            except Exception:
+                print("[rq error] enqueue failed, using thread")
+
+    t = threading.Thread(target=send_html_email_batch, args=(messages,), daemon=True)
+    t.start()
+    return len(messages)
+
+
 def build_order_items_html(items: list, base_url: str = "http://127.0.0.1:5000") -> str:
     """Build HTML table for order items with product images."""
     html = '<table style="width:100%; border-collapse:collapse; margin:20px 0;">'
@@ -2586,7 +4499,10 @@ def paystack_init():
             return redirect(url_for("checkout"))
 
         try:
-            r = requests.post(initialize_url, json=payload, headers=headers, timeout=15)
+            with _outbound_call('paystack', 'initialize') as call:
+                import requests
+                r = requests.post(initialize_url, json=payload, headers=headers, timeout=15)
+                call['status'] = getattr(r, 'status_code', None)
             r.raise_for_status()
             data = r.json()
             if data.get("status") and data.get("data") and data["data"].get("authorization_url"):
@@ -2675,7 +4591,10 @@ def paystack_init_url():
         return jsonify({'status': 'error', 'message': 'Paystack secret key not configured.'}), 500
 
     try:
-        r = requests.post(initialize_url, json=payload, headers=headers, timeout=15)
+        with _outbound_call('paystack', 'initialize') as call:
+            import requests
+            r = requests.post(initialize_url, json=payload, headers=headers, timeout=15)
+            call['status'] = getattr(r, 'status_code', None)
         r.raise_for_status()
         data = r.json()
         if data.get("status") and data.get("data") and data["data"].get("authorization_url"):
@@ -2943,7 +4862,10 @@ def paystack_callback():
     verify_url = f"https://api.paystack.co/transaction/verify/{ref}"
     headers = {"Authorization": f"Bearer {PAYSTACK_SECRET}"}
     try:
-        r = requests.get(verify_url, headers=headers, timeout=15)
+        with _outbound_call('paystack', 'verify') as call:
+            import requests
+            r = requests.get(verify_url, headers=headers, timeout=15)
+            call['status'] = getattr(r, 'status_code', None)
         r.raise_for_status()
         data = r.json()
         if data.get("status") and data.get("data") and data["data"].get("status") == "success":
@@ -3463,14 +5385,7 @@ def register():
                     sys.stderr.write(tb + "\n")
                 except Exception:
                     pass
-            try:
-                last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-                with open(last_err_path, 'w', encoding='utf-8') as fh:
-                    fh.write(f"Time: {utc_now().isoformat()}\n")
-                    fh.write(str(e) + '\n\n')
-                    fh.write(tb)
-            except Exception:
-                pass
+            _record_error(e, tb)
             try:
                 # Attempt a rollback and close the session to ensure it's not left in a failed state
                 _safe_db_rollback_and_close()
@@ -3542,11 +5457,101 @@ def admin_index():
         flash('Admin access required. Please login as admin.', 'danger')
         return redirect(url_for('index'))
 
-    prods = Product.query.order_by(Product.created_at.desc(), Product.id.desc()).all()
     recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
     settings = get_settings()
     dashboard_layout = settings.dashboard_layout if settings and hasattr(settings, 'dashboard_layout') else 'grid'
-    return render_template('admin_index.html', products=prods, recent_orders=recent_orders, dashboard_layout=dashboard_layout)
+    page = admin_product_page(request.args, settings=settings)
+    return render_template('admin_index.html', recent_orders=recent_orders, dashboard_layout=dashboard_layout, **page)
+
+
+ADMIN_PRODUCTS_PER_PAGE = 48
+
+
+def product_filters_from_args(args):
+    """Build (criteria, filters) for Product queries: `q` matches anywhere in the title, `featured` is yes/no."""
+    criteria, filters = [], {}
+    q = (args.get('q') or '').strip()
+    if q:
+        criteria.append(Product.title.ilike('%' + _like_prefix(q), escape='\\'))
+        filters['q'] = q
+    featured = args.get('featured')
+    if featured in ('yes', 'no'):
+        criteria.append(Product.featured.is_(True) if featured == 'yes' else Product.featured.isnot(True))
+        filters['featured'] = featured
+    return criteria, filters
+
+
+def admin_product_page(args, per_page=ADMIN_PRODUCTS_PER_PAGE, settings=None):
+    """One page of products for the admin dashboard, newest first.
+
+    Selects only the listed columns (never the image BLOB; a SQL expression reports
+    whether one exists) and resolves every image URL in one pass with a single
+    settings lookup. `q` matches anywhere in the title, `featured` is yes/no and
+    `after` is the last product id of the previous page.
+    """
+    from sqlalchemy import select
+    cols = (Product.id, Product.title, Product.short, Product.price_ghc, Product.old_price_ghc,
+            Product.image, Product.featured, Product.card_size, Product.created_at,
+            Product.product_image_data.isnot(None).label('has_image_data'))
+    criteria, filters = product_filters_from_args(args)
+    stmt = select(*cols).where(*criteria)
+    try:
+        after = int(args.get('after')) if args.get('after') else None
+    except ValueError:
+        after = None
+    if after is not None:
+        stmt = stmt.where(Product.id < after)
+    rows = db.session.execute(stmt.order_by(Product.id.desc()).limit(per_page + 1)).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if settings is None:
+        try:
+            settings = get_settings()
+        except Exception:
+            settings = None
+    fallback = (settings.get_bg_url() if settings else None) or '/static/images/product-bg.svg'
+    products = [{
+        'id': r.id,
+        'title': r.title,
+        'short': r.short or '',
+        'price_ghc': r.price_ghc,
+        'old_price_ghc': r.old_price_ghc,
+        'featured': bool(r.featured),
+        'card_size': r.card_size,
+        'created_at': r.created_at,
+        # Same precedence as Product.get_image_url
+        'image_url': f'/product/image/{r.id}' if r.has_image_data else (r.image or fallback),
+    } for r in rows]
+    return {
+        'products': products,
+        'filters': filters,
+        'per_page': per_page,
+        'next_cursor': products[-1]['id'] if products and has_more else None,
+    }
+
+
+@app.route('/admin/products/api')
+@login_required
+@admin_required
+def admin_products_api():
+    """Next page of the admin product grid as JSON, with the rendered rows for the current layout."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    try:
+        per_page = min(max(int(request.args.get('per_page', ADMIN_PRODUCTS_PER_PAGE)), 1), 200)
+    except ValueError:
+        per_page = ADMIN_PRODUCTS_PER_PAGE
+    settings = get_settings()
+    layout = request.args.get('layout') or getattr(settings, 'dashboard_layout', None) or 'grid'
+    page = admin_product_page(request.args, per_page=per_page, settings=settings)
+    html = render_template('admin_product_rows.html', products=page['products'], dashboard_layout=layout)
+    products = [{**p, 'price_ghc': float(p['price_ghc'] or 0),
+                 'old_price_ghc': float(p['old_price_ghc']) if p['old_price_ghc'] else None,
+                 'created_at': p['created_at'].isoformat() if p['created_at'] else None}
+                for p in page['products']]
+    return jsonify({'status': 'success', 'products': products, 'next_cursor': page['next_cursor'],
+                    'html': html}), 200
 
 
 @app.route('/admin/diagnostics')
@@ -3576,11 +5581,85 @@ def admin_diagnostics():
         'SETTINGS_HAS_LOGO_DB': bool(settings.logo_image_data),
         'SETTINGS_HAS_BANNER1_DB': bool(settings.banner1_image_data),
         'UPLOAD_FOLDER': app.config.get('UPLOAD_FOLDER'),
-        'DB_URI': app.config.get('SQLALCHEMY_DATABASE_URI')
+        'DB_URI': app.config.get('SQLALCHEMY_DATABASE_URI'),
+        'DB_POOL_PROFILE': app.config.get('DB_POOL_PROFILE'),
+        'DB_WARMUP': app.config.get('DB_WARMUP'),
+        'DB_SSL_CONTEXT': type(_db_ssl_context).__name__ if _db_ssl_context is not None else 'not built',
     }
+    try:
+        for key, value in db_pool.pool_status(db.engine).items():
+            diagnostics[f'DB_POOL_{key.upper()}'] = value
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.connect() as conn:
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'foreign_keys'):
+                    diagnostics[f'SQLITE_{pragma.upper()}'] = conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+            if sqlite_write_lock is not None:
+                diagnostics.update({f'SQLITE_{k.upper()}': v for k, v in sqlite_write_lock.snapshot().items()})
+    except Exception:
+        diagnostics['DB_POOL_STATUS'] = 'unavailable'
 
     # Render a minimal diagnostics page
-    return render_template('admin_diagnostics.html', diagnostics=diagnostics)
+    profiles = [dict(p, when=datetime.fromtimestamp(p['at'], timezone.utc)) for p in profile_buffer.list()]
+    return render_template('admin_diagnostics.html', diagnostics=diagnostics, profiles=profiles)
+
+
+@app.route('/admin/diagnostics/profiles/<profile_id>')
+@login_required
+@admin_required
+def admin_request_profile(profile_id):
+    """Call tree and hottest functions of one profiled request."""
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if not getattr(current_user, 'is_admin', False):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+        flash('Admin access required.', 'danger')
+        return redirect(url_for('index'))
+    entry = profile_buffer.get(profile_id)
+    if entry is None:
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Profile not found (only the most recent are kept)'}), 404
+        flash('Profile not found; only the most recent profiles are kept.', 'warning')
+        return redirect(url_for('admin_diagnostics'))
+    if wants_json:
+        return jsonify({'status': 'success', 'profile': entry}), 200
+    return render_template('admin_profile.html', profile=entry, tree_text=request_profiler.format_tree(entry['tree']),
+                           at=datetime.fromtimestamp(entry['at'], timezone.utc))
+
+
+@app.route('/admin/diagnostics/pool')
+@login_required
+@admin_required
+def admin_diagnostics_pool():
+    """Connection pool profile, checkout latency and saturation as JSON."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    return jsonify({'status': 'success', 'profile': app.config.get('DB_POOL_PROFILE'),
+                    'warmup': app.config.get('DB_WARMUP'), 'pool': db_pool.pool_status(db.engine)}), 200
+
+
+@app.route('/admin/perf', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_perf():
+    """Rolling per-endpoint SQL query counts, DB time and suspected N+1 statements."""
+    wants_json = request.accept_mimetypes.best == 'application/json' or request.args.get('format') == 'json'
+    if not getattr(current_user, 'is_admin', False):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+        flash('Admin access required.', 'danger')
+        return redirect(url_for('index'))
+    if request.method == 'POST':
+        query_stats.report.reset()
+        if wants_json:
+            return jsonify({'status': 'success'}), 200
+        flash('Performance report reset.', 'success')
+        return redirect(url_for('admin_perf'))
+    report = query_stats.report.snapshot()
+    report['repeat_threshold'] = app.config.get('SQL_REPEAT_THRESHOLD')
+    if wants_json:
+        return jsonify({'status': 'success', 'report': report}), 200
+    return render_template('admin_perf.html', report=report,
+                           since=datetime.fromtimestamp(report['since'], timezone.utc))
 
 
 @app.route('/admin/order/<int:oid>/invoice')
@@ -3631,23 +5710,24 @@ def admin_new():
 
         image_path = '/uploads/images/placeholder.png'
         
-        # Handle image upload — use a helper to handle local or S3 saves
+        # Handle image upload through the configured storage backend
         file = request.files.get('image_file')
-        if file and file.filename and allowed_file(file.filename):
+        direct_token = request.form.get('image_file_direct_token')
+        if direct_token:
             try:
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid filename conflicts
-                import time
-                filename = f"{int(time.time())}_{filename}"
-                mime = get_mime_type(file.filename)
-                saved = _save_uploaded_file(file, filename, mime_type=mime)
-                image_path = saved
+                image_path, _mime = _verify_direct_upload(direct_token)
             except Exception as e:
                 flash(f'Image upload failed: {str(e)}', 'warning')
-
         try:
             prod = Product(title=title, short=short, price_ghc=price, old_price_ghc=old_price, image=image_path, featured=featured)
             db.session.add(prod)
+            if not direct_token and file and file.filename and allowed_file(file.filename):
+                # The image job needs the product id
+                db.session.flush()
+                try:
+                    _queue_product_image(prod, file)
+                except Exception as e:
+                    flash(f'Image upload failed: {str(e)}', 'warning')
             db.session.commit()
             flash('Product created successfully.', 'success')
             return redirect(url_for('admin_index'))
@@ -3706,36 +5786,16 @@ def admin_edit(pid):
 
         # Handle image upload
         file = request.files.get('image_file')
-        if file and file.filename and allowed_file(file.filename):
+        direct_token = request.form.get('image_file_direct_token')
+        if direct_token:
             try:
-                filename = secure_filename(file.filename)
-                import time
-                filename = f"{int(time.time())}_{filename}"
-                mime_type = get_mime_type(file.filename)
-                # Upload to S3 when configured
-                if is_s3_configured():
-                    key = f"products/{int(time.time())}_{filename}"
-                    url = upload_to_s3(file, key, mime_type=mime_type)
-                    if url:
-                        p.image = url
-                    else:
-                        # fallback to DB blob
-                        b64_data = encode_image_to_base64(file)
-                        p.product_image_data = b64_data
-                        p.product_image_mime = mime_type
-                        p.image = url_for('product_image', pid=p.id)
-                else:
-                    # Prefer local save or S3 fallback; helper returns either an S3 URL
-                    # or a path (e.g. /uploads/images/<filename>) which we can store in the DB.
-                    try:
-                        saved = _save_uploaded_file(file, filename, mime_type=mime_type)
-                        p.image = saved
-                    except Exception:
-                        # Serverless fallback - store in DB when save fails
-                        b64_data = encode_image_to_base64(file)
-                        p.product_image_data = b64_data
-                        p.product_image_mime = mime_type
-                        p.image = url_for('product_image', pid=p.id)
+                p.image, p.product_image_mime = _verify_direct_upload(direct_token)
+                p.product_image_data = None
+            except Exception as e:
+                flash(f'Image upload failed: {str(e)}', 'warning')
+        elif file and file.filename and allowed_file(file.filename):
+            try:
+                _queue_product_image(p, file)
             except Exception as e:
                 flash(f'Image upload failed: {str(e)}', 'warning')
 
@@ -3753,6 +5813,286 @@ def admin_edit(pid):
     return render_template('admin_edit.html', product=p)
 
 
+@app.route('/admin/uploads/presign', methods=['POST'])
+@login_required
+@admin_required
+def admin_upload_presign():
+    """Issue a presigned POST (default) or PUT for uploading one admin image straight to S3."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    if not direct_uploads_enabled():
+        return jsonify({'status': 'error', 'message': 'Direct uploads are not configured'}), 409
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename') or ''))
+    if not filename or not allowed_file(filename):
+        return jsonify({'status': 'error', 'message': 'Unsupported file type'}), 400
+    content_type = str(data.get('content_type') or get_mime_type(filename)).lower()
+    if content_type not in _DIRECT_UPLOAD_TYPES:
+        return jsonify({'status': 'error', 'message': 'Unsupported content type'}), 400
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        size = 0
+    if size <= 0 or size > DIRECT_UPLOAD_MAX_BYTES:
+        return jsonify({'status': 'error', 'message': f'File must be between 1 byte and {DIRECT_UPLOAD_MAX_BYTES} bytes'}), 400
+
+    key = f"direct/{uuid.uuid4().hex}_{filename}"
+    storage = _s3_storage()
+    try:
+        if data.get('method') == 'put':
+            signed = storage.presign_put(key, content_type, expires_in=DIRECT_UPLOAD_EXPIRES)
+            payload = {'method': 'PUT', 'url': signed['url'], 'headers': signed['headers']}
+        else:
+            signed = storage.presign_post(key, content_type, DIRECT_UPLOAD_MAX_BYTES, expires_in=DIRECT_UPLOAD_EXPIRES)
+            payload = {'method': 'POST', 'url': signed['url'], 'fields': signed['fields']}
+    except Exception as e:
+        try:
+            app.logger.warning('Presign failed: %s', e)
+        except Exception:
+            pass
+        return jsonify({'status': 'error', 'message': 'Could not sign upload'}), 502
+    payload.update({
+        'status': 'success',
+        'key': key,
+        'expires_in': DIRECT_UPLOAD_EXPIRES,
+        'max_bytes': DIRECT_UPLOAD_MAX_BYTES,
+        'token': _direct_upload_serializer().dumps({'key': key, 'content_type': content_type}),
+    })
+    return jsonify(payload), 200
+
+
+@app.route('/admin/uploads/finalize', methods=['POST'])
+@login_required
+@admin_required
+def admin_upload_finalize():
+    """Record a completed direct upload on a product (`product_id`) or settings slot (`slot`)."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    data = request.get_json(silent=True) or {}
+    target = data.get('target')
+    if target not in ('product', 'settings'):
+        return jsonify({'status': 'error', 'message': "target must be 'product' or 'settings'"}), 400
+    if target == 'settings' and data.get('slot') not in SETTINGS_IMAGE_SLOTS:
+        return jsonify({'status': 'error', 'message': 'Unknown settings slot'}), 400
+    try:
+        url, mime_type = _verify_direct_upload(str(data.get('token') or ''))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        try:
+            app.logger.warning('Direct upload verification failed: %s', e)
+        except Exception:
+            pass
+        return jsonify({'status': 'error', 'message': 'Could not verify upload'}), 502
+
+    try:
+        if target == 'product':
+            product = db.session.get(Product, int(data.get('product_id') or 0))
+            if product is None:
+                return jsonify({'status': 'error', 'message': 'Product not found'}), 404
+            product.image = url
+            product.product_image_data = None
+            product.product_image_mime = mime_type
+        else:
+            settings = get_settings()
+            _assign_settings_image(settings, data['slot'], url, mime_type)
+            settings.updated_at = utc_now()
+        db.session.commit()
+    except ValueError as e:
+        _safe_db_rollback_and_close()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        _safe_db_rollback_and_close()
+        try:
+            app.logger.exception('Finalize upload failed')
+        except Exception:
+            pass
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({'status': 'success', 'url': url}), 200
+
+
+@app.route('/admin/uploads/jobs/<job_id>')
+@login_required
+@admin_required
+def admin_image_job_status(job_id):
+    """Report the state of a background image job; finishes it here if its worker went away."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    job = db.session.get(ImageJob, job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    if job.status in ('pending', 'processing') and _image_job_age(job) > IMAGE_JOB_STALE_SECONDS:
+        try:
+            _get_image_executor().submit(process_image_job, job.id).result(timeout=120)
+        except Exception as e:
+            try:
+                app.logger.warning('Image job %s could not be resumed: %s', job.id, e)
+            except Exception:
+                pass
+        db.session.refresh(job)
+    payload = job.to_display_dict()
+    payload['job_status'] = payload.pop('status')
+    payload['status'] = 'success'
+    return jsonify(payload), 200
+
+
+ORDER_STATUSES = ('pending', 'completed', 'cancelled')
+ADMIN_ORDERS_PER_PAGE = 50
+# Sortable columns of the admin order list; every sort is (column, id) for keyset pagination
+_ORDER_SORT_COLUMNS = {
+    'created_at': Order.created_at,
+    'total': Order.total,
+    'email': Order.email,
+    'status': Order.status,
+}
+# A row comparison against NULL is never true, so rows with a NULL sort value would
+# drop out of every page after the first; these columns sort as COALESCE(column, default)
+_ORDER_SORT_DEFAULTS = {'total': Decimal('0'), 'email': '', 'status': ''}
+
+
+def _parse_day(value):
+    """Parse YYYY-MM-DD into a naive UTC datetime (Order.created_at is stored without tz)."""
+    try:
+        return datetime.strptime((value or '').strip(), '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _like_prefix(text):
+    """LIKE pattern matching values that start with `text` (use with escape='\\')."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def order_filters_from_args(args):
+    """Build (criteria, filters) for Order queries from request args.
+
+    Supported args: status, paid (yes/no), payment_method, date_from and date_to
+    (YYYY-MM-DD, inclusive) and q (email or reference prefix). `filters` holds the
+    normalized values so templates can re-render the form and pagination links.
+    """
+    from datetime import timedelta
+    from sqlalchemy import or_
+    criteria, filters = [], {}
+    status = (args.get('status') or '').strip()
+    if status in ORDER_STATUSES:
+        criteria.append(Order.status == status)
+        filters['status'] = status
+    paid = (args.get('paid') or '').strip().lower()
+    if paid in ('yes', 'no'):
+        criteria.append(Order.paid.is_(paid == 'yes'))
+        filters['paid'] = paid
+    method = (args.get('payment_method') or '').strip()
+    if method:
+        criteria.append(Order.payment_method == method[:20])
+        filters['payment_method'] = method[:20]
+    date_from = _parse_day(args.get('date_from'))
+    if date_from:
+        criteria.append(Order.created_at >= date_from)
+        filters['date_from'] = date_from.strftime('%Y-%m-%d')
+    date_to = _parse_day(args.get('date_to'))
+    if date_to:
+        criteria.append(Order.created_at < date_to + timedelta(days=1))
+        filters['date_to'] = date_to.strftime('%Y-%m-%d')
+    q = (args.get('q') or '').strip()
+    if q:
+        # Prefix match only. An index can serve it where LIKE compares bytewise
+        # (Postgres: a text_pattern_ops or "C" collation index; SQLite: only with
+        # case_sensitive_like on), otherwise it filters the scanned rows.
+        pattern = _like_prefix(q)
+        criteria.append(or_(Order.email.like(pattern, escape='\\'),
+                               Order.reference.like(pattern, escape='\\')))
+        filters['q'] = q
+    return criteria, filters
+
+
+def _encode_keyset(value, row_id):
+    import base64
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    raw = _json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_keyset(token, kind=None):
+    """Return (value, id) from a keyset cursor, or None if it is malformed.
+
+    `kind` is 'datetime' or 'decimal' to convert the value back from JSON; a
+    null value is returned as None.
+    """
+    import base64
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, last_id = _json.loads(raw)
+        if value is None:
+            pass
+        elif kind == 'datetime':
+            value = datetime.fromisoformat(value).replace(tzinfo=None)
+        elif kind == 'decimal':
+            value = Decimal(value)
+        return value, int(last_id)
+    except Exception:
+        return None
+
+
+def _encode_cursor(order, sort):
+    value = getattr(order, sort)
+    return _encode_keyset(_ORDER_SORT_DEFAULTS.get(sort) if value is None else value, order.id)
+
+
+def _decode_cursor(token, sort):
+    """Return (value, id) from an order list cursor, or None if it is malformed."""
+    return _decode_keyset(token, {'created_at': 'datetime', 'total': 'decimal'}.get(sort))
+
+
+def paginate_orders(args, per_page=ADMIN_ORDERS_PER_PAGE):
+    """Return one keyset page of orders for the admin list.
+
+    Pages are addressed by `after`/`before` cursors over (sort column, id) and
+    no total count is computed. Sorted by created_at, a page is one range scan
+    of `per_page + 1` rows on ix_order_created_at_id however many orders exist.
+    The other sorts, and a `q` prefix search LIKE cannot take to an index (see
+    order_filters_from_args), still read the filtered rows to find the page.
+    """
+    from sqlalchemy import tuple_, literal, func
+    criteria, filters = order_filters_from_args(args)
+    sort = args.get('sort') if args.get('sort') in _ORDER_SORT_COLUMNS else 'created_at'
+    direction = 'asc' if args.get('dir') == 'asc' else 'desc'
+    column = _ORDER_SORT_COLUMNS[sort]
+    if sort in _ORDER_SORT_DEFAULTS:
+        column = func.coalesce(column, literal(_ORDER_SORT_DEFAULTS[sort], type_=column.type))
+    key = tuple_(column, Order.id)
+
+    after, before = args.get('after'), args.get('before')
+    backwards = bool(before) and not after
+    cursor = _decode_cursor(before if backwards else after, sort) if (after or before) else None
+    # Walking backwards flips the scan direction; rows are reversed again below
+    ascending = (direction == 'asc') != backwards
+    query = Order.query.filter(*criteria)
+    if cursor is not None:
+        bound = tuple_(literal(cursor[0], type_=column.type), literal(cursor[1]))
+        query = query.filter(key > bound if ascending else key < bound)
+    order_by = (column.asc(), Order.id.asc()) if ascending else (column.desc(), Order.id.desc())
+    rows = query.order_by(*order_by).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    has_next = has_more if not backwards else True
+    has_prev = (cursor is not None) if not backwards else has_more
+    return {
+        'orders': rows,
+        'filters': filters,
+        'sort': sort,
+        'dir': direction,
+        'per_page': per_page,
+        'next_cursor': _encode_cursor(rows[-1], sort) if rows and has_next else None,
+        'prev_cursor': _encode_cursor(rows[0], sort) if rows and has_prev else None,
+    }
+
+
 @app.route('/admin/orders')
 @login_required
 @admin_required
@@ -3760,26 +6100,754 @@ def admin_orders():
     if not getattr(current_user, 'is_admin', False):
         flash('Admin access required. Please login as admin.', 'danger')
         return redirect(url_for('index'))
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return render_template('admin_orders.html', orders=orders)
+    try:
+        per_page = min(max(int(request.args.get('per_page', ADMIN_ORDERS_PER_PAGE)), 1), 200)
+    except ValueError:
+        per_page = ADMIN_ORDERS_PER_PAGE
+    page = paginate_orders(request.args, per_page=per_page)
+    return render_template('admin_orders.html', statuses=ORDER_STATUSES, **page)
+
+
+ORDER_EXPORT_BATCH_SIZE = int(os.environ.get('ORDER_EXPORT_BATCH_SIZE', '1000'))
+_ORDER_EXPORT_FIELDS = ('id', 'reference', 'email', 'total', 'paid', 'status', 'created_at')
+_ORDER_ITEM_EXPORT_FIELDS = ('product_id', 'title', 'qty', 'price', 'subtotal')
+
+
+def iter_orders_for_export(criteria, include_items=False, batch_size=None):
+    """Yield (order_row, item_rows) for matching orders, newest first, in constant memory.
+
+    Orders are read in keyset batches over id. Each batch is one query that joins
+    the batch's orders to their OrderItem rows (when `include_items`) and selects
+    plain columns, so no ORM objects or whole result sets are held.
+    """
+    from sqlalchemy import select
+    batch_size = batch_size or ORDER_EXPORT_BATCH_SIZE
+    order_cols = (Order.id, Order.reference, Order.email, Order.total, Order.paid,
+                  Order.status, Order.payment_method, Order.created_at)
+    last_id = None
+    while True:
+        page = select(Order.id.label('page_id')).where(*criteria)
+        if last_id is not None:
+            page = page.where(Order.id < last_id)
+        page = page.order_by(Order.id.desc()).limit(batch_size).subquery()
+        stmt = select(*order_cols).join(page, page.c.page_id == Order.id)
+        if include_items:
+            stmt = (stmt.add_columns(OrderItem.id.label('item_id'), OrderItem.product_id, OrderItem.title,
+                                     OrderItem.qty, OrderItem.price, OrderItem.subtotal.label('item_subtotal'))
+                    .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+                    .order_by(Order.id.desc(), OrderItem.id))
+        else:
+            stmt = stmt.order_by(Order.id.desc())
+        result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        current, items, seen = None, [], 0
+        for row in result:
+            if current is None or row.id != current.id:
+                if current is not None:
+                    yield current, items
+                current, items = row, []
+                seen += 1
+            if include_items and row.item_id is not None:
+                items.append(row)
+        if current is None:
+            return
+        yield current, items
+        if seen < batch_size:
+            return
+        last_id = current.id
+
+
+def _export_order_dict(o):
+    return {
+        'id': o.id,
+        'reference': o.reference,
+        'email': o.email,
+        'total': float(o.total or 0),
+        'paid': bool(o.paid),
+        'status': o.status,
+        'payment_method': o.payment_method,
+        'created_at': o.created_at.isoformat() if o.created_at else None,
+    }
+
+
+def _export_item_dict(i):
+    return {
+        'product_id': i.product_id,
+        'title': i.title,
+        'qty': i.qty,
+        'price': float(i.price or 0),
+        'subtotal': float(i.item_subtotal or 0),
+    }
+
+
+def generate_orders_csv(rows, include_items=False, flush_bytes=64 * 1024):
+    """Yield CSV text in ~`flush_bytes` chunks. With items there is one line per order item."""
+    import csv
+    from io import StringIO
+    buf = StringIO()
+    writer = csv.writer(buf)
+    header = list(_ORDER_EXPORT_FIELDS)
+    if include_items:
+        header += [f'item_{f}' for f in _ORDER_ITEM_EXPORT_FIELDS]
+    writer.writerow(header)
+    for o, items in rows:
+        base = [o.id, o.reference, o.email, float(o.total or 0), 'yes' if o.paid else 'no', o.status,
+                o.created_at.isoformat() if o.created_at else '']
+        if not include_items:
+            writer.writerow(base)
+        elif not items:
+            writer.writerow(base + [''] * len(_ORDER_ITEM_EXPORT_FIELDS))
+        else:
+            for i in items:
+                writer.writerow(base + [i.product_id, i.title, i.qty, float(i.price or 0), float(i.item_subtotal or 0)])
+        if buf.tell() >= flush_bytes:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def generate_orders_jsonl(rows, include_items=False, flush_bytes=64 * 1024):
+    """Yield JSON Lines text (one order per line) in ~`flush_bytes` chunks."""
+    chunk, size = [], 0
+    for o, items in rows:
+        record = _export_order_dict(o)
+        if include_items:
+            record['items'] = [_export_item_dict(i) for i in items]
+        line = _json.dumps(record) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= flush_bytes:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _gzip_stream(chunks):
+    """Gzip a stream of text chunks on the fly."""
+    import zlib
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
 
 
 @app.route('/admin/orders/export')
 @login_required
 @admin_required
 def admin_orders_export():
+    """Stream orders as CSV (default) or JSONL (`format=jsonl`).
+
+    Accepts the admin order list filters, `items=1` to include line items and
+    `gzip=1` to download a compressed file.
+    """
     if not getattr(current_user, 'is_admin', False):
         flash('Admin access required. Please login as admin.', 'danger')
         return redirect(url_for('index'))
+    fmt = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    include_items = request.args.get('items') in ('1', 'yes', 'true')
+    compress = request.args.get('gzip') in ('1', 'yes', 'true')
+    criteria, _filters = order_filters_from_args(request.args)
+
+    rows = iter_orders_for_export(criteria, include_items=include_items)
+    if fmt == 'jsonl':
+        body, mimetype = generate_orders_jsonl(rows, include_items), 'application/x-ndjson'
+    else:
+        body, mimetype = generate_orders_csv(rows, include_items), 'text/csv'
+    filename = f"orders.{fmt}"
+    if compress:
+        body, mimetype, filename = _gzip_stream(body), 'application/gzip', filename + '.gz'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}",
+                             "X-Accel-Buffering": "no"})
+
+
+PRODUCT_IMPORT_BATCH_SIZE = int(os.environ.get('PRODUCT_IMPORT_BATCH_SIZE', '1000'))
+PRODUCT_IMPORT_MAX_ERRORS = 1000
+PRODUCT_EXPORT_FIELDS = ('sku', 'title', 'short', 'price_ghc', 'old_price_ghc', 'image', 'featured', 'card_size')
+_TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+
+
+def _product_import_format(filename, requested=None):
+    if requested in ('csv', 'jsonl'):
+        return requested
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def iter_product_records(stream, fmt):
+    """Yield (line_number, record_dict_or_None, parse_error_or_None) from a binary stream.
+
+    Reads one line at a time, so memory does not grow with the file size.
+    """
+    import io
+    import csv
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = _json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, 'Each line must be a JSON object'
+                continue
+            yield line_no, record, None
+        return
+    reader = csv.DictReader(text)
+    for record in reader:
+        yield reader.line_num, record, None
+
+
+def normalize_product_record(record):
+    """Return (values, errors) for one import record; `values` holds Product column values.
+
+    Only the columns the record carries (the CSV header or the JSON object's
+    keys) are in `values`, besides `sku`, so an update leaves the others as they
+    are; an empty value still clears a column. Whether a new product has its
+    title and price is checked in _upsert_product_batch, which knows the SKU is new.
+    """
+    def text(key, limit):
+        value = record.get(key)
+        value = '' if value is None else str(value).strip()
+        if len(value) > limit:
+            errors.append(f'{key} is longer than {limit} characters')
+        return value
+
+    errors = []
+    values = {'sku': text('sku', 64)}
+    if not values['sku']:
+        errors.append('sku is required')
+    if 'title' in record:
+        values['title'] = text('title', 255)
+    price_key = next((k for k in ('price_ghc', 'price') if k in record), None)
+    price = None
+    if price_key:
+        price = record.get(price_key)
+        price = '' if price is None else str(price).strip()
+    # validate_product_data checks a title and a price; keep what it says about
+    # the ones this record carries
+    price_errors = []
+    for message in validate_product_data(values.get('title'), price):
+        if 'title' in message:
+            if 'title' in values:
+                errors.append(message)
+        elif price_key:
+            price_errors.append(message)
+    errors.extend(price_errors)
+    if price_key and not price_errors:
+        values['price_ghc'] = Decimal(price)
+    if 'old_price_ghc' in record:
+        old_price = record.get('old_price_ghc')
+        old_price = None if old_price in (None, '') else str(old_price).strip()
+        if old_price is not None:
+            try:
+                old_price = Decimal(old_price)
+                if old_price < 0:
+                    errors.append('old_price_ghc cannot be negative')
+            except Exception:
+                errors.append('Invalid old_price_ghc format')
+        values['old_price_ghc'] = old_price
+    if 'short' in record:
+        values['short'] = text('short', 500) or None
+    if 'image' in record:
+        values['image'] = text('image', 300) or None
+    if 'featured' in record:
+        featured = record.get('featured')
+        values['featured'] = featured if isinstance(featured, bool) else str(featured or '').strip().lower() in _TRUE_VALUES
+    if 'card_size' in record:
+        values['card_size'] = text('card_size', 20) or 'medium'
+        if values['card_size'] not in ('small', 'medium', 'large'):
+            errors.append('card_size must be small, medium or large')
+    return values, errors
+
+
+# Columns a new product cannot be created without, with the error reported for each
+_PRODUCT_INSERT_REQUIRED = (('title', 'Product title is required'), ('price_ghc', 'Product price is required'))
+
+
+def _write_product_rows(inserts, updates):
+    from sqlalchemy import insert, update
+    # The rows may carry different columns (a partial update sets only its own);
+    # SQLAlchemy's bulk insert/update splits them into executemany groups by key set
+    if inserts:
+        db.session.execute(insert(Product), inserts)
+    if updates:
+        db.session.execute(update(Product), updates)
+
+
+def _upsert_product_batch(batch, dry_run=False):
+    """Insert or update a {sku: (line, values)} batch; returns (inserted, updated, errors).
+
+    One lookup finds the existing SKUs, then the batch is written with two bulk
+    statements in a savepoint. If the database rejects it (say a price too large
+    for its column), the batch is written again one savepoint per row, so only
+    the rows that fail are reported in `errors` and the rest are kept.
+    """
+    from sqlalchemy import select
+    existing = dict(db.session.execute(select(Product.sku, Product.id).where(Product.sku.in_(list(batch)))).all())
+    # `product-<id>` is what the export writes for products without a SKU; match
+    # those back to the product (which then keeps the SKU) instead of duplicating it
+    fallback = {int(sku[8:]): sku for sku in batch
+                if sku not in existing and sku.startswith('product-') and sku[8:].isdigit()}
+    if fallback:
+        existing.update((fallback[pid], pid) for pid in db.session.execute(
+            select(Product.id).where(Product.id.in_(list(fallback)), Product.sku.is_(None))).scalars())
+    inserts, updates, errors = [], [], []
+    for sku, (line, values) in batch.items():
+        if sku in existing:
+            updates.append((line, {'id': existing[sku], **values}))
+            continue
+        missing = [message for column, message in _PRODUCT_INSERT_REQUIRED if column not in values]
+        if missing:
+            errors.append({'line': line, 'sku': sku, 'errors': missing})
+        else:
+            inserts.append((line, values))
+    if dry_run:
+        return len(inserts), len(updates), errors
+
+    try:
+        with db.session.begin_nested():
+            _write_product_rows([v for _, v in inserts], [v for _, v in updates])
+    except Exception:
+        kept = []
+        for line, values in inserts + updates:
+            row = ([], [values]) if 'id' in values else ([values], [])
+            try:
+                with db.session.begin_nested():
+                    _write_product_rows(*row)
+            except Exception as e:
+                errors.append({'line': line, 'sku': values['sku'],
+                               'errors': [f'Could not be saved: {getattr(e, "orig", None) or e}'[:300]]})
+            else:
+                kept.append(values)
+        inserts = [v for v in kept if 'id' not in v]
+        updates = [v for v in kept if 'id' in v]
+    db.session.commit()
+    return len(inserts), len(updates), sorted(errors, key=lambda e: e['line'])
+
+
+def import_products(stream, fmt='csv', dry_run=False, batch_size=None) -> dict:
+    """Stream-parse CSV or JSONL product rows and upsert them by SKU in batches.
+
+    Each batch commits separately, so a failure keeps earlier batches; re-running
+    the same file is safe because rows are matched by SKU. Columns missing from
+    the file are left unchanged on existing products. A row the database rejects
+    is reported like a validation error. With `dry_run` nothing is written but
+    the report shows what would be inserted or updated.
+    """
+    batch_size = batch_size or PRODUCT_IMPORT_BATCH_SIZE
+    report = {'dry_run': bool(dry_run), 'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    batch = {}
+
+    def fail(entry):
+        report['failed'] += 1
+        if len(report['errors']) < PRODUCT_IMPORT_MAX_ERRORS:
+            report['errors'].append(entry)
+
+    def flush():
+        try:
+            inserted, updated, errors = _upsert_product_batch(batch, dry_run=dry_run)
+        except Exception:
+            _safe_db_rollback_and_close()
+            raise
+        report['inserted'] += inserted
+        report['updated'] += updated
+        for entry in errors:
+            fail(entry)
+        batch.clear()
+
+    for line_no, record, parse_error in iter_product_records(stream, fmt):
+        report['rows'] += 1
+        if parse_error:
+            errors, sku = [parse_error], None
+        else:
+            values, errors = normalize_product_record(record)
+            sku = values['sku'] or None
+        if errors:
+            fail({'line': line_no, 'sku': sku, 'errors': errors})
+            continue
+        if sku in batch:
+            # The same SKU twice in one batch is one product: apply the later row on top
+            values = {**batch[sku][1], **values}
+        batch[sku] = (line_no, values)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
+
+
+def iter_products_for_export(batch_size=None):
+    """Yield product rows (export columns only, no image BLOBs) in id keyset batches."""
+    from sqlalchemy import select
+    batch_size = batch_size or PRODUCT_IMPORT_BATCH_SIZE
+    cols = [Product.id] + [getattr(Product, f) for f in PRODUCT_EXPORT_FIELDS]
+    last_id = 0
+    while True:
+        rows = db.session.execute(select(*cols).where(Product.id > last_id)
+                                  .order_by(Product.id).limit(batch_size)).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+
+def _export_product_dict(row):
+    record = {f: getattr(row, f) for f in PRODUCT_EXPORT_FIELDS}
+    # Products created in the admin have no SKU; export their id so they can be re-imported
+    record['sku'] = record['sku'] or f'product-{row.id}'
+    for key in ('price_ghc', 'old_price_ghc'):
+        record[key] = str(record[key]) if record[key] is not None else None
+    record['featured'] = bool(record['featured'])
+    return record
+
+
+def generate_products_export(rows, fmt='csv', flush_bytes=64 * 1024):
+    """Yield CSV or JSONL text in ~`flush_bytes` chunks; the output re-imports as-is."""
     import csv
     from io import StringIO
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['id','reference','email','total','paid','status','created_at'])
-    for o in Order.query.order_by(Order.created_at.desc()).all():
-        cw.writerow([o.id, o.reference, o.email, float(o.total), 'yes' if o.paid else 'no', o.status, o.created_at.isoformat() if o.created_at else ''])
-    output = si.getvalue()
-    return app.response_class(output, mimetype='text/csv', headers={"Content-Disposition": "attachment; filename=orders.csv"})
+    buf = StringIO()
+    writer = csv.DictWriter(buf, fieldnames=PRODUCT_EXPORT_FIELDS) if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    for row in rows:
+        record = _export_product_dict(row)
+        if writer:
+            writer.writerow({k: '' if v is None else v for k, v in record.items()})
+        else:
+            buf.write(_json.dumps(record) + '\n')
+        if buf.tell() >= flush_bytes:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+@app.route('/admin/products/export')
+@login_required
+@admin_required
+def admin_products_export():
+    """Stream every product as CSV (default) or JSONL (`format=jsonl`)."""
+    if not getattr(current_user, 'is_admin', False):
+        flash('Admin access required. Please login as admin.', 'danger')
+        return redirect(url_for('index'))
+    fmt = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    body = generate_products_export(iter_products_for_export(), fmt)
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=products.{fmt}",
+                             "X-Accel-Buffering": "no"})
+
+
+@app.route('/admin/products/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_products_import():
+    """Upload a CSV or JSONL product file; `dry_run` validates without writing.
+
+    Responds with the HTML report, or JSON when the client asks for it.
+    """
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if not getattr(current_user, 'is_admin', False):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+        flash('Admin access required. Please login as admin.', 'danger')
+        return redirect(url_for('index'))
+    if request.method == 'GET':
+        return render_template('admin_product_import.html', report=None, fields=PRODUCT_EXPORT_FIELDS)
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'No file uploaded'}), 400
+        flash('Choose a CSV or JSONL file to import.', 'danger')
+        return redirect(url_for('admin_products_import'))
+    fmt = _product_import_format(upload.filename, request.form.get('format'))
+    stream = upload.stream
+    if upload.filename.lower().endswith('.gz'):
+        import gzip
+        stream = gzip.GzipFile(fileobj=stream)
+    try:
+        report = import_products(stream, fmt, dry_run=bool(request.form.get('dry_run')))
+    except Exception as e:
+        try:
+            app.logger.exception('Product import failed: %s', e)
+        except Exception:
+            pass
+        if wants_json:
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+        flash(f'Import failed: {str(e)}', 'danger')
+        return redirect(url_for('admin_products_import'))
+    if wants_json:
+        return jsonify({'status': 'success', **report}), 200
+    return render_template('admin_product_import.html', report=report, fields=PRODUCT_EXPORT_FIELDS)
+
+
+@app.cli.command("import-products")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='File format; inferred from the extension when omitted.')
+@click.option('--dry-run', is_flag=True, help='Validate and report without writing.')
+@click.option('--batch-size', type=int, default=None, help='Rows per upsert batch (default 1000).')
+def import_products_command(path, fmt, dry_run, batch_size):
+    """Bulk insert or update products from a CSV or JSONL file, matched by sku."""
+    import gzip
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    started = time.monotonic()
+    with app.app_context(), opener(path, 'rb') as fh:
+        report = import_products(fh, _product_import_format(path, fmt), dry_run=dry_run, batch_size=batch_size)
+    verb = 'Would insert' if dry_run else 'Inserted'
+    print(f"{report['rows']} rows in {time.monotonic() - started:.1f}s: {verb} {report['inserted']}, "
+          f"{'would update' if dry_run else 'updated'} {report['updated']}, {report['failed']} failed.")
+    for err in report['errors']:
+        print(f"  line {err['line']} (sku {err['sku'] or '-'}): {'; '.join(err['errors'])}")
+    if report['errors_truncated']:
+        print(f"  ... only the first {PRODUCT_IMPORT_MAX_ERRORS} errors are listed")
+
+
+@app.cli.command("export-products")
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='File format; inferred from the extension when omitted.')
+def export_products_command(path, fmt):
+    """Write every product to a CSV or JSONL file that import-products can read back."""
+    fmt = _product_import_format(path, fmt)
+    count = 0
+    with app.app_context(), open(path, 'w', encoding='utf-8', newline='') as out:
+        for chunk in generate_products_export(iter_products_for_export(), fmt):
+            out.write(chunk)
+        count = Product.query.count()
+    print(f"Exported {count} products to {path}.")
+
+
+PRODUCT_BULK_ACTIONS = ('price_percent', 'price_amount', 'set_old_price', 'featured', 'delete')
+PRODUCT_BULK_MAX_IDS = 5000
+# Bumped whenever the catalog changes outside the ORM; see invalidate_catalog_cache
+catalog_version = 0
+
+
+def invalidate_catalog_cache():
+    """Mark cached catalog state stale after a set-based change.
+
+    Bulk UPDATE/DELETE statements bypass the session, so Product objects already
+    loaded in it are expired here, and `catalog_version` changes so anything keyed
+    on it rebuilds. Call once per operation, not per product.
+    """
+    global catalog_version
+    catalog_version += 1
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Product):
+            db.session.expire(obj)
+    return catalog_version
+
+
+def _bulk_decimal(value, name):
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'))
+    except Exception:
+        raise ValueError(f'{name} must be a number')
+    if not amount.is_finite():
+        raise ValueError(f'{name} must be a number')
+    return amount
+
+
+def _bulk_product_values(action, value, keep_old_price):
+    """The SET clause for a bulk update action, as SQL expressions over the current row."""
+    from sqlalchemy import case, func, literal
+    values = {}
+    if action == 'price_percent':
+        percent = _bulk_decimal(value, 'value')
+        if percent < -100 or percent > 1000:
+            raise ValueError('value must be a percentage between -100 and 1000')
+        values['price_ghc'] = func.round(Product.price_ghc * ((100 + percent) / 100), 2)
+    elif action == 'price_amount':
+        amount = _bulk_decimal(value, 'value')
+        new_price = Product.price_ghc + amount
+        values['price_ghc'] = case((new_price < 0, literal(Decimal('0.00'), type_=Product.price_ghc.type)),
+                                   else_=new_price)
+    elif action == 'set_old_price':
+        if value in (None, ''):
+            values['old_price_ghc'] = None
+        elif value == 'price':
+            values['old_price_ghc'] = Product.price_ghc
+        else:
+            amount = _bulk_decimal(value, 'value')
+            if amount < 0:
+                raise ValueError('value cannot be negative')
+            values['old_price_ghc'] = amount
+    elif action == 'featured':
+        if value == 'toggle':
+            values['featured'] = case((Product.featured.is_(True), False), else_=True)
+        elif isinstance(value, bool) or value in ('yes', 'no'):
+            values['featured'] = value if isinstance(value, bool) else value == 'yes'
+        else:
+            raise ValueError("value must be true, false or 'toggle'")
+    if keep_old_price and action in ('price_percent', 'price_amount'):
+        # SET expressions read the pre-update row, so this keeps the price being replaced
+        values['old_price_ghc'] = Product.price_ghc
+    return values
+
+
+def bulk_update_products(action, value=None, ids=None, filters=None, keep_old_price=False, actor=None) -> dict:
+    """Apply one set-based change to many products in a single statement.
+
+    Products are selected by explicit `ids` or by the admin dashboard `filters`
+    (q, featured). Actions: price_percent (e.g. -20 for 20% off), price_amount
+    (added to the price, floored at zero), set_old_price (a number, 'price' to copy
+    the current price, or empty to clear), featured (true/false/'toggle') and
+    delete. `keep_old_price` moves the current price into old_price_ghc in the same
+    UPDATE, which is what a sale needs. Writes one AdminAuditLog row, invalidates
+    the catalog cache once and raises ValueError for invalid input.
+    """
+    from sqlalchemy import select, update, delete
+    if action not in PRODUCT_BULK_ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(PRODUCT_BULK_ACTIONS)}")
+    if ids is not None:
+        if not isinstance(ids, (list, tuple)):
+            raise ValueError('ids must be a list of product ids')
+        try:
+            ids = sorted({int(i) for i in ids})
+        except (TypeError, ValueError):
+            raise ValueError('ids must be a list of product ids')
+        if not ids:
+            raise ValueError('ids is empty')
+        if len(ids) > PRODUCT_BULK_MAX_IDS:
+            raise ValueError(f'at most {PRODUCT_BULK_MAX_IDS} ids per request; use a filter instead')
+        criteria, selection = [Product.id.in_(ids)], {'ids': ids}
+    elif filters is not None:
+        criteria, normalized = product_filters_from_args(filters)
+        if not criteria and action == 'delete':
+            raise ValueError('refusing to delete every product; give ids or a narrower filter')
+        selection = {'filter': normalized}
+    else:
+        raise ValueError('give either ids or filter')
+
+    try:
+        if action == 'delete':
+            chosen = select(Product.id).where(*criteria).scalar_subquery()
+            db.session.execute(slider_product.delete().where(slider_product.c.product_id.in_(chosen)))
+            affected = db.session.execute(delete(Product).where(*criteria),
+                                          execution_options={'synchronize_session': False}).rowcount
+        else:
+            values = _bulk_product_values(action, value, keep_old_price)
+            affected = db.session.execute(update(Product).where(*criteria).values(**values),
+                                          execution_options={'synchronize_session': False}).rowcount
+        detail = {**selection, 'value': value}
+        if keep_old_price and action in ('price_percent', 'price_amount'):
+            detail['keep_old_price'] = True
+        entry = AdminAuditLog(actor=actor, action=f'product.{action}', target='product',
+                              affected=affected, detail=_json.dumps(detail, default=str))
+        db.session.add(entry)
+        db.session.commit()
+    except ValueError:
+        db.session.rollback()
+        raise
+    except Exception:
+        _safe_db_rollback_and_close()
+        raise
+    invalidate_catalog_cache()
+    return {'action': action, 'affected': affected, 'audit_id': entry.id, 'catalog_version': catalog_version}
+
+
+@app.route('/admin/products/bulk', methods=['POST'])
+@login_required
+@admin_required
+def admin_products_bulk():
+    """Apply a bulk product operation from a JSON body: {action, value, ids | filter, keep_old_price}."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    payload = request.get_json(silent=True) or {}
+    filters = payload.get('filter')
+    if filters is not None and not isinstance(filters, dict):
+        return jsonify({'status': 'error', 'message': 'filter must be an object'}), 400
+    try:
+        result = bulk_update_products(payload.get('action'), value=payload.get('value'),
+                                      ids=payload.get('ids'), filters=filters,
+                                      keep_old_price=bool(payload.get('keep_old_price')),
+                                      actor=getattr(current_user, 'username', None))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        app.logger.exception('Bulk product operation failed')
+        return jsonify({'status': 'error', 'message': f'Bulk operation failed: {e}'}), 500
+    return jsonify({'status': 'success', **result}), 200
+
+
+def _sales_range_from_args(args, default_days=30):
+    from datetime import timedelta
+    end = _parse_day(args.get('end'))
+    end = end.date() if end else utc_now().date()
+    start = _parse_day(args.get('start'))
+    start = start.date() if start else end - timedelta(days=default_days - 1)
+    if start > end:
+        start, end = end, start
+    try:
+        top = min(max(int(args.get('top', 10)), 1), 100)
+    except ValueError:
+        top = 10
+    return start, end, top
+
+
+@app.route('/admin/sales')
+@login_required
+@admin_required
+def admin_sales():
+    """Sales dashboard over an arbitrary date range, read from the rollup tables."""
+    if not getattr(current_user, 'is_admin', False):
+        flash('Admin access required. Please login as admin.', 'danger')
+        return redirect(url_for('index'))
+    start, end, top = _sales_range_from_args(request.args)
+    return render_template('admin_sales.html', summary=sales_summary(start, end, top))
+
+
+@app.route('/admin/sales/api')
+@login_required
+@admin_required
+def admin_sales_api():
+    """JSON form of the sales dashboard (`start`, `end`, `top` query args)."""
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    start, end, top = _sales_range_from_args(request.args)
+    return jsonify({'status': 'success', **sales_summary(start, end, top)}), 200
+
+
+@app.route('/admin/analytics/api/<report>')
+@login_required
+@admin_required
+def admin_analytics_api(report):
+    """Sales analytics as JSON: /admin/analytics/api/daily|weekly|cohorts|discounts.
+
+    Query args: `start`, `end` (default: last 90 days, 365 for cohorts), `window`,
+    `period` (month/week) and `periods`.
+    """
+    if not getattr(current_user, 'is_admin', False):
+        return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+    if report not in ANALYTICS_REPORTS:
+        return jsonify({'status': 'error', 'message': f'Unknown report: {report}'}), 404
+    start, end, _ = _sales_range_from_args(request.args, default_days=365 if report == 'cohorts' else 90)
+    try:
+        window = int(request.args['window']) if request.args.get('window') else None
+        periods = min(max(int(request.args.get('periods', 12)), 1), 104)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'window and periods must be integers'}), 400
+    period = request.args.get('period', 'month')
+    if period not in ('month', 'week'):
+        return jsonify({'status': 'error', 'message': 'period must be month or week'}), 400
+    try:
+        data = sales_analytics_report(report, start, end, window=window, period=period, periods=periods)
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    return jsonify({'status': 'success', **data}), 200
 
 
 @app.route('/admin/order/<int:oid>')
@@ -3794,6 +6862,103 @@ def admin_order_detail(oid):
     return render_template('admin_order_detail.html', order=order, items=items)
 
 
+def _order_items_for_email(order_ids):
+    """Return ({order_id: [item dicts for build_order_items_html]}, item rows) for many orders.
+
+    One query loads every item of the orders and one more the images of their
+    products, however many orders there are.
+    """
+    from sqlalchemy import select
+    rows = db.session.execute(
+        select(OrderItem.order_id, OrderItem.product_id, OrderItem.title, OrderItem.qty,
+               OrderItem.price, OrderItem.subtotal)
+        .where(OrderItem.order_id.in_(list(order_ids))).order_by(OrderItem.id)).all()
+    product_ids = {r.product_id for r in rows if r.product_id}
+    images = dict(db.session.execute(
+        select(Product.id, Product.image).where(Product.id.in_(product_ids))).all()) if product_ids else {}
+    by_order = {}
+    for oi in rows:
+        item_dict = {
+            'product': oi.title,
+            'qty': oi.qty,
+            'price': float(oi.price),
+            'subtotal': float(oi.subtotal)
+        }
+        if oi.product_id in images:
+            item_dict['image_path'] = images[oi.product_id] or ''
+        by_order.setdefault(oi.order_id, []).append(item_dict)
+    return by_order, rows
+
+
+def build_order_status_email(order, new_status, items_with_images):
+    """Return (subject, html, plain_text) for an order status change email."""
+    subject = f"[Cyber World Store] Order {order.reference[:8]} — Status: {new_status.upper()}"
+
+    payment_method = (order.payment_method or 'unknown').title()
+
+    # Build HTML based on status
+    status_title = f"Order Status Update: {new_status.upper()}"
+    status_message = ""
+    status_color = "#ffc107"
+    status_emoji = "📝"
+
+    if new_status == 'completed':
+        status_message = "🎉 Great news! Your order has been processed and is on its way. You can expect delivery shortly. Track your package using the reference number below."
+        status_color = "#4caf50"
+        status_emoji = "✅"
+    elif new_status == 'cancelled':
+        status_message = "❌ Your order has been cancelled as requested. If you have questions or need to place a new order, please contact us anytime."
+        status_color = "#f44336"
+        status_emoji = "❌"
+    else:  # pending
+        status_message = "⚙️ Your order is being processed and prepared for shipment. We'll notify you as soon as it ships!"
+        status_color = "#2196f3"
+        status_emoji = "⏳"
+
+    html = '<html><body style="font-family:Arial,sans-serif; line-height:1.6; color:#333;">'
+    html += build_email_header_html(status_title)
+    html += '<div style="max-width:600px; margin:0 auto; padding:20px;">'
+    html += f'<p style="font-size:16px;"><strong>{status_emoji} Status Update for Your Order</strong></p>'
+    html += f'<p>{status_message}</p>'
+    html += f'<div style="background-color:#f5f5f5; padding:15px; border-left:4px solid {status_color}; margin:15px 0; border-radius:4px;">'
+    html += f'<div style="font-size:12px; color:#666;">ORDER REFERENCE</div>'
+    html += f'<div style="font-size:20px; font-weight:bold; color:{status_color};">{order.reference}</div>'
+    html += f'<div style="margin-top:10px; font-size:14px;">'
+    html += f'<strong>Status:</strong> <span style="color:{status_color}; font-weight:bold;">{new_status.upper()}</span><br>'
+    html += f'<strong>Amount:</strong> GH₵{order.total:.2f}<br>'
+    html += f'<strong>Payment Method:</strong> {payment_method}'
+    html += '</div></div>'
+
+    # Show order items if available
+    if items_with_images:
+        html += '<h3 style="color:#333; margin:20px 0 15px 0; font-size:16px;">📦 Order Items</h3>'
+        html += build_order_items_html(items_with_images)
+
+    # Add action based on status
+    if new_status == 'completed':
+        html += '<div style="background-color:#e8f5e9; padding:15px; border-radius:4px; margin:20px 0;">'
+        html += '<p style="margin:0;"><strong>🚚 Shipment Information</strong><br>'
+        html += 'Your order is on its way! Track your package in your account dashboard using the order reference above.</p>'
+        html += '</div>'
+    elif new_status == 'cancelled':
+        html += '<div style="background-color:#ffebee; padding:15px; border-radius:4px; margin:20px 0;">'
+        html += '<p style="margin:0;"><strong>💬 Need Help?</strong><br>'
+        html += 'If this cancellation was unexpected or you have questions, please contact our support team immediately.</p>'
+        html += '</div>'
+    else:
+        html += '<div style="background-color:#e3f2fd; padding:15px; border-radius:4px; margin:20px 0;">'
+        html += '<p style="margin:0;"><strong>⏱️ Processing</strong><br>'
+        html += 'We\'re preparing your items for shipment. You\'ll receive another notification when it ships.</p>'
+        html += '</div>'
+
+    html += build_email_footer_html()
+    html += '</div></body></html>'
+
+    plain_text = f"Order Status Update\n\nHi {order.name or 'Valued Customer'},\n\nYour order status has been updated.\n\nOrder Reference: {order.reference}\nNew Status: {new_status.upper()}\nAmount: GH₵{order.total:.2f}\n\n{status_message}\n\nQuestions? Contact: cyberworldstore360@gmail.com"
+
+    return subject, html, plain_text
+
+
 @app.route('/admin/order/<int:oid>/update_status', methods=['POST'])
 @login_required
 @admin_required
@@ -3813,85 +6978,8 @@ def admin_order_update_status(oid):
         # notify user about status change
         try:
             if is_valid_email(order.email):
-                subject = f"[Cyber World Store] Order {order.reference[:8]} — Status: {new_status.upper()}"
-                
-                # Get order items for display
-                order_items = OrderItem.query.filter_by(order_id=order.id).all()
-                items_with_images = []
-                for oi in order_items:
-                    item_dict = {
-                        'product': oi.title,
-                        'qty': oi.qty,
-                        'price': float(oi.price),
-                        'subtotal': float(oi.subtotal)
-                    }
-                    if oi.product_id:
-                        p = db.session.get(Product, oi.product_id)
-                        if p:
-                            item_dict['image_path'] = p.image if p.image else ''
-                    items_with_images.append(item_dict)
-                
-                # Build HTML based on status
-                status_title = f"Order Status Update: {new_status.upper()}"
-                status_message = ""
-                status_color = "#ffc107"
-                status_emoji = "📝"
-                
-                if new_status == 'completed':
-                    status_message = "🎉 Great news! Your order has been processed and is on its way. You can expect delivery shortly. Track your package using the reference number below."
-                    status_color = "#4caf50"
-                    status_emoji = "✅"
-                elif new_status == 'cancelled':
-                    status_message = "❌ Your order has been cancelled as requested. If you have questions or need to place a new order, please contact us anytime."
-                    status_color = "#f44336"
-                    status_emoji = "❌"
-                else:  # pending
-                    status_message = "⚙️ Your order is being processed and prepared for shipment. We'll notify you as soon as it ships!"
-                    status_color = "#2196f3"
-                    status_emoji = "⏳"
-                
-                html = '<html><body style="font-family:Arial,sans-serif; line-height:1.6; color:#333;">'
-                html += build_email_header_html(status_title)
-                html += '<div style="max-width:600px; margin:0 auto; padding:20px;">'
-                html += f'<p style="font-size:16px;"><strong>{status_emoji} Status Update for Your Order</strong></p>'
-                html += f'<p>{status_message}</p>'
-                html += f'<div style="background-color:#f5f5f5; padding:15px; border-left:4px solid {status_color}; margin:15px 0; border-radius:4px;">'
-                html += f'<div style="font-size:12px; color:#666;">ORDER REFERENCE</div>'
-                html += f'<div style="font-size:20px; font-weight:bold; color:{status_color};">{order.reference}</div>'
-                html += f'<div style="margin-top:10px; font-size:14px;">'
-                html += f'<strong>Status:</strong> <span style="color:{status_color}; font-weight:bold;">{new_status.upper()}</span><br>'
-                html += f'<strong>Amount:</strong> GH₵{order.total:.2f}<br>'
-                html += f'<strong>Payment Method:</strong> {order.payment_method.title()}'
-                html += '</div></div>'
-                
-                # Show order items if available
-                if items_with_images:
-                    html += '<h3 style="color:#333; margin:20px 0 15px 0; font-size:16px;">📦 Order Items</h3>'
-                    html += build_order_items_html(items_with_images)
-                
-                # Add action based on status
-                if new_status == 'completed':
-                    html += '<div style="background-color:#e8f5e9; padding:15px; border-radius:4px; margin:20px 0;">'
-                    html += '<p style="margin:0;"><strong>🚚 Shipment Information</strong><br>'
-                    html += 'Your order is on its way! Track your package in your account dashboard using the order reference above.</p>'
-                    html += '</div>'
-                elif new_status == 'cancelled':
-                    html += '<div style="background-color:#ffebee; padding:15px; border-radius:4px; margin:20px 0;">'
-                    html += '<p style="margin:0;"><strong>💬 Need Help?</strong><br>'
-                    html += 'If this cancellation was unexpected or you have questions, please contact our support team immediately.</p>'
-                    html += '</div>'
-                else:
-                    html += '<div style="background-color:#e3f2fd; padding:15px; border-radius:4px; margin:20px 0;">'
-                    html += '<p style="margin:0;"><strong>⏱️ Processing</strong><br>'
-                    html += 'We\'re preparing your items for shipment. You\'ll receive another notification when it ships.</p>'
-                    html += '</div>'
-                
-                html += build_email_footer_html()
-                html += '</div></body></html>'
-                
-                plain_text = f"Order Status Update\n\nHi {order.name or 'Valued Customer'},\n\nYour order status has been updated.\n\nOrder Reference: {order.reference}\nNew Status: {new_status.upper()}\nAmount: GH₵{order.total:.2f}\n\n{status_message}\n\nQuestions? Contact: cyberworldstore360@gmail.com"
-                
-                send_html_email_async(order.email, subject, html, plain_text)
+                items = _order_items_for_email([order.id])[0].get(order.id, [])
+                send_html_email_async(order.email, *build_order_status_email(order, new_status, items))
         except Exception:
             pass
 
@@ -3904,6 +6992,151 @@ def admin_order_update_status(oid):
         flash(f'Failed to update order status: {e}', 'danger')
     return redirect(url_for('admin_order_detail', oid=oid))
 
+ORDER_BULK_MAX = 2000
+
+
+def order_references_from_csv(stream):
+    """Order references from an uploaded CSV: the `reference` column, or the first column without a header."""
+    import io
+    import csv
+    refs = []
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    column = 0
+    try:
+        for row_no, row in enumerate(reader):
+            if row_no == 0:
+                header = [c.strip().lower() for c in row]
+                if 'reference' in header:
+                    column = header.index('reference')
+                    continue
+            if len(row) > column and row[column].strip():
+                refs.append(row[column].strip())
+    except csv.Error as e:
+        # A malformed upload (an oversized field, or a NUL byte before Python 3.11)
+        raise ValueError(f'Could not read the CSV file: {e}')
+    return list(dict.fromkeys(refs))
+
+
+def bulk_update_order_status(new_status, ids=None, references=None, actor=None, notify=True) -> dict:
+    """Set the status of many orders with one UPDATE and one bulk OrderLog insert.
+
+    Orders are picked by id and/or reference; those already in `new_status` are
+    left alone. Sales rollups are adjusted for orders moving into or out of
+    'cancelled' (the flush hook does not see bulk statements), and the status
+    emails are built from two queries and queued as a single batch after commit.
+    """
+    from sqlalchemy import select, update, insert, or_
+    if new_status not in ORDER_STATUSES:
+        raise ValueError('Invalid status.')
+    try:
+        ids = sorted({int(i) for i in (ids or [])})
+    except (TypeError, ValueError):
+        raise ValueError('Order ids must be numbers.')
+    references = list(dict.fromkeys(r.strip() for r in (references or []) if r and r.strip()))
+    if not ids and not references:
+        raise ValueError('Select orders or upload a CSV of order references.')
+    if len(ids) + len(references) > ORDER_BULK_MAX:
+        raise ValueError(f'At most {ORDER_BULK_MAX} orders can be updated at once.')
+
+    match = []
+    if ids:
+        match.append(Order.id.in_(ids))
+    if references:
+        match.append(Order.reference.in_(references))
+    try:
+        orders = db.session.execute(select(Order).where(or_(*match)).with_for_update()).scalars().all()
+        found = {o.reference for o in orders}
+        changing = [o for o in orders if o.status != new_status]
+        messages = []
+        if changing:
+            changed_ids = [o.id for o in changing]
+            items_by_order, item_rows = _order_items_for_email(changed_ids)
+            old_status = {o.id: o.status for o in changing}
+            db.session.execute(update(Order).where(Order.id.in_(changed_ids)).values(status=new_status),
+                               execution_options={'synchronize_session': False})
+            db.session.execute(insert(OrderLog), [
+                {'order_id': o.id, 'changed_by': actor, 'old_status': old_status[o.id],
+                 'new_status': new_status, 'note': 'Bulk status update', 'created_at': utc_now()}
+                for o in changing])
+
+            items_of = {}
+            for it in item_rows:
+                items_of.setdefault(it.order_id, []).append(it)
+            daily, products = {}, {}
+            for o in changing:
+                was = order_counts_as_sale(o.paid, old_status[o.id])
+                now = order_counts_as_sale(o.paid, new_status)
+                if was == now:
+                    continue
+                sign, day = (1 if now else -1), _rollup_day(o.created_at)
+                _add_order_delta(daily, day, o, sign)
+                for it in items_of.get(o.id, []):
+                    _add_item_delta(daily, products, day, it.product_id, it.title, it.qty, it.subtotal, sign)
+            conn = db.session.connection()
+            if (daily or products) and _rollups_available(conn):
+                _apply_sales_rollups(conn, daily, products)
+
+            if notify:
+                messages = [(o.email, *build_order_status_email(o, new_status, items_by_order.get(o.id, [])))
+                            for o in changing if is_valid_email(o.email)]
+        db.session.commit()
+    except Exception:
+        _safe_db_rollback_and_close()
+        raise
+
+    notified = send_html_emails_async(messages) if messages else 0
+    return {
+        'status': new_status,
+        'matched': len(orders),
+        'updated': len(changing),
+        'unchanged': len(orders) - len(changing),
+        'missing': [r for r in references if r not in found],
+        'notified': notified,
+    }
+
+
+@app.route('/admin/orders/bulk_status', methods=['POST'])
+@login_required
+@admin_required
+def admin_orders_bulk_status():
+    """Set the status of the orders ticked in the list and/or listed in an uploaded CSV of references."""
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if not getattr(current_user, 'is_admin', False):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
+        flash('Admin access required. Please login as admin.', 'danger')
+        return redirect(url_for('index'))
+    target = request.form.get('next') or ''
+    back = target if target.startswith('/admin/orders') else url_for('admin_orders')
+    upload = request.files.get('file')
+    try:
+        references = order_references_from_csv(upload.stream) if upload and upload.filename else []
+        result = bulk_update_order_status(request.form.get('status'), ids=request.form.getlist('order_ids'),
+                                          references=references,
+                                          actor=getattr(current_user, 'username', None) or 'admin',
+                                          notify=request.form.get('notify', '1') != '0')
+    except ValueError as e:
+        if wants_json:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(back)
+    except Exception as e:
+        app.logger.exception('Bulk order status update failed')
+        if wants_json:
+            return jsonify({'status': 'error', 'message': f'Failed to update order status: {e}'}), 500
+        flash(f'Failed to update order status: {e}', 'danger')
+        return redirect(back)
+    if wants_json:
+        return jsonify({'status': 'success', 'result': result}), 200
+    flash(f"{result['updated']} orders marked {result['status']} ({result['unchanged']} already were); "
+          f"{result['notified']} customers notified.", 'success')
+    if result['missing']:
+        shown = ', '.join(r[:12] for r in result['missing'][:10])
+        more = f" and {len(result['missing']) - 10} more" if len(result['missing']) > 10 else ''
+        flash(f"No order found for {len(result['missing'])} references: {shown}{more}", 'warning')
+    return redirect(back)
+
+
 @app.route('/admin/delete/<int:pid>', methods=['POST'])
 @login_required
 @admin_required
@@ -3927,6 +7160,105 @@ def admin_delete(pid):
         flash(f'Error deleting product: {str(e)}', 'danger')
     return redirect(url_for('admin_index'))
 
+ADMIN_WALLETS_PER_PAGE = 50
+_WALLET_SORTS = {'balance': 'decimal', 'updated_at': 'datetime', 'email': None}
+
+
+def _wallet_sort_column(sort):
+    return {'balance': Wallet.balance, 'updated_at': Wallet.updated_at}.get(sort, User.email)
+
+
+def paginate_wallets(args, per_page=ADMIN_WALLETS_PER_PAGE):
+    """One keyset page of customers with their wallets loaded in the same query.
+
+    Wallets are populated via contains_eager, so rendering a page issues no
+    per-row queries. `q` is an email prefix; sort is balance, updated_at or email.
+
+    The balance and updated_at sorts order on the raw wallet column, so
+    ix_wallet_balance / ix_wallet_updated_at can serve the range scan. Customers
+    with nothing to sort on (no wallet yet) are a separate run ordered by id,
+    placed below the lowest value; their cursors carry a null value, and a page
+    that spans both runs costs a second query.
+    """
+    from sqlalchemy import tuple_, literal
+    from sqlalchemy.orm import contains_eager
+    sort = args.get('sort') if args.get('sort') in _WALLET_SORTS else 'balance'
+    direction = 'asc' if args.get('dir') == 'asc' else 'desc'
+    column = _wallet_sort_column(sort)
+    criteria, filters = [], {}
+    q = (args.get('q') or '').strip()
+    if q:
+        criteria.append(User.email.like(_like_prefix(q), escape='\\'))
+        filters['q'] = q
+
+    after, before = args.get('after'), args.get('before')
+    backwards = bool(before) and not after
+    cursor = _decode_keyset(before if backwards else after, _WALLET_SORTS[sort]) if (after or before) else None
+    ascending = (direction == 'asc') != backwards
+
+    # (query, keyset columns) runs in scan order
+    if sort == 'email':
+        runs = [(User.query.outerjoin(Wallet, Wallet.user_id == User.id), (User.email, User.id))]
+    else:
+        valued = (User.query.join(Wallet, Wallet.user_id == User.id).filter(column.isnot(None)),
+                  (column, Wallet.user_id))
+        missing = (User.query.outerjoin(Wallet, Wallet.user_id == User.id).filter(column.is_(None)), (User.id,))
+        runs = [missing, valued] if ascending else [valued, missing]
+        if cursor is not None:
+            runs = runs[runs.index(missing if cursor[0] is None else valued):]
+
+    users = []
+    for i, (query, key) in enumerate(runs):
+        query = query.filter(*criteria).options(contains_eager(User.wallet))
+        if cursor is not None and i == 0:
+            values = cursor[-len(key):]
+            bound = tuple_(*(literal(v, type_=c.type) for c, v in zip(key, values)))
+            query = query.filter(tuple_(*key) > bound if ascending else tuple_(*key) < bound)
+        order_by = [c.asc() if ascending else c.desc() for c in key]
+        users.extend(query.order_by(*order_by).limit(per_page + 1 - len(users)).all())
+        if len(users) > per_page:
+            break
+
+    has_more = len(users) > per_page
+    users = users[:per_page]
+    if backwards:
+        users.reverse()
+    has_next = has_more if not backwards else True
+    has_prev = (cursor is not None) if not backwards else has_more
+
+    def cursor_for(user):
+        if sort == 'email':
+            return _encode_keyset(user.email, user.id)
+        value = getattr(user.wallet, sort, None) if user.wallet else None
+        if isinstance(value, datetime):
+            value = value.replace(tzinfo=None)
+        return _encode_keyset(value, user.id)
+
+    return {
+        'users': users,
+        'filters': filters,
+        'sort': sort,
+        'dir': direction,
+        'per_page': per_page,
+        'next_cursor': cursor_for(users[-1]) if users and has_next else None,
+        'prev_cursor': cursor_for(users[0]) if users and has_prev else None,
+    }
+
+
+def wallet_liabilities() -> dict:
+    """Total balance owed to customers across all wallets, computed in SQL."""
+    from sqlalchemy import select, func, case
+    total, wallets, funded = db.session.execute(
+        select(func.coalesce(func.sum(Wallet.balance), 0), func.count(Wallet.id),
+               func.coalesce(func.sum(case((Wallet.balance > 0, 1), else_=0)), 0))).one()
+    return {'total': Decimal(str(total)), 'wallets': int(wallets), 'funded_wallets': int(funded)}
+
+
+def _wallets_return_url():
+    target = request.form.get('next') or ''
+    return target if target.startswith('/admin/wallets') else url_for('admin_wallets')
+
+
 @app.route('/admin/wallets')
 @login_required
 @admin_required
@@ -3936,9 +7268,12 @@ def admin_wallets():
     if not getattr(current_user, 'is_admin', False):
         flash('Admin access required.', 'danger')
         return redirect(url_for('index'))
-    
-    users = User.query.all()
-    return render_template('admin_wallets.html', users=users)
+    try:
+        per_page = min(max(int(request.args.get('per_page', ADMIN_WALLETS_PER_PAGE)), 1), 200)
+    except ValueError:
+        per_page = ADMIN_WALLETS_PER_PAGE
+    page = paginate_wallets(request.args, per_page=per_page)
+    return render_template('admin_wallets.html', liabilities=wallet_liabilities(), **page)
 
 @app.route('/admin/wallet/credit/<int:user_id>', methods=['POST'])
 @login_required
@@ -3970,7 +7305,7 @@ def admin_credit_wallet(user_id):
             pass
         flash(f'Error crediting wallet: {str(e)}', 'danger')
     
-    return redirect(url_for('admin_wallets'))
+    return redirect(_wallets_return_url())
 
 @app.route('/admin/wallet/debit/<int:user_id>', methods=['POST'])
 @login_required
@@ -4002,7 +7337,7 @@ def admin_debit_wallet(user_id):
             pass
         flash(f'Error debiting wallet: {str(e)}', 'danger')
     
-    return redirect(url_for('admin_wallets'))
+    return redirect(_wallets_return_url())
 
 @app.route('/admin/settings', methods=['GET', 'POST'])
 @login_required
@@ -4036,223 +7371,39 @@ def admin_settings():
         if request.form.get('site_announcement') is not None:
             settings.site_announcement = request.form.get('site_announcement')
         
-        # Handle logo upload (prefer S3 if configured, otherwise store as base64 in DB)
-        if 'logo_file' in request.files and request.files['logo_file']:
-            file = request.files['logo_file']
-            if file and file.filename and allowed_file(file.filename):
+        # Handle logo, banner and background uploads through the storage backend
+        for slot, label in (('logo', 'Logo'), ('banner1', 'Banner 1'), ('banner2', 'Banner 2'), ('bg', 'Background')):
+            file = request.files.get(f'{slot}_file')
+            direct_token = request.form.get(f'{slot}_file_direct_token')
+            if direct_token:
                 try:
-                    mime_type = get_mime_type(file.filename)
-                    # Unified save with local or S3 fallback
-                    filename = secure_filename(file.filename)
-                    filename = f"logo_{int(time.time())}_{filename}"
-                    try:
-                        saved = _save_uploaded_file(file, filename, mime_type=mime_type)
-                        if isinstance(saved, str) and saved.startswith('http'):
-                            # S3 URL returned; check DB length limits
-                            if len(saved) > 300:
-                                file.seek(0)
-                                b64_data = encode_image_to_base64(file)
-                                settings.logo_image_data = b64_data
-                                settings.logo_image_mime = mime_type
-                                settings.logo_image = f"/database/logo_from_{secure_filename(file.filename)}"
-                                try:
-                                    app.logger.warning('S3 URL too long for DB; stored logo as DB fallback len=%s', len(saved))
-                                except Exception:
-                                    pass
-                                flash('Logo saved to database (fallback) due to long S3 URL', 'success')
-                            else:
-                                settings.logo_image = saved
-                                settings.logo_image_data = None
-                                settings.logo_image_mime = mime_type
-                                flash('Logo uploaded to S3 successfully!', 'success')
-                        elif isinstance(saved, str) and saved.startswith('/uploads/images'):
-                            settings.logo_image = saved
-                            settings.logo_image_data = None
-                            settings.logo_image_mime = mime_type
-                            flash('Logo saved to uploads successfully!', 'success')
-                        else:
-                            # Fallback to database storage
-                            file.seek(0)
-                            b64_data = encode_image_to_base64(file)
-                            settings.logo_image_data = b64_data
-                            settings.logo_image_mime = mime_type
-                            settings.logo_image = f"/database/logo_from_{secure_filename(file.filename)}"
-                            flash('Logo saved to database (fallback) successfully!', 'success')
-                    except Exception:
-                        # Fallback to DB if saving/uploading failed
-                        file.seek(0)
-                        b64_data = encode_image_to_base64(file)
-                        settings.logo_image_data = b64_data
-                        settings.logo_image_mime = mime_type
-                        settings.logo_image = f"/database/logo_from_{secure_filename(file.filename)}"
-                        flash('Logo saved to database (fallback) successfully!', 'success')
+                    url, mime_type = _verify_direct_upload(direct_token)
+                    _assign_settings_image(settings, slot, url, mime_type)
+                    flash(f'{label} saved successfully!', 'success')
                 except Exception as e:
-                    try:
-                        app.logger.exception('Logo upload failed')
-                    except Exception:
-                        pass
-                    # Ensure DB session is clean after an upload failure
-                    try:
-                        _safe_db_rollback_and_close()
-                    except Exception:
-                        pass
-                    flash(f'Logo upload failed: {str(e)}', 'warning')
-        
-        # Handle banner 1 upload (prefer S3 if configured, otherwise store as base64 in DB)
-        if 'banner1_file' in request.files and request.files['banner1_file']:
-            file = request.files['banner1_file']
-            if file and file.filename and allowed_file(file.filename):
-                try:
-                    mime_type = get_mime_type(file.filename)
-                    filename = secure_filename(file.filename)
-                    filename = f"banner1_{int(time.time())}_{filename}"
-                    try:
-                        saved = _save_uploaded_file(file, filename, mime_type=mime_type)
-                        if isinstance(saved, str) and saved.startswith('http'):
-                            if len(saved) > 300:
-                                file.seek(0)
-                                b64_data = encode_image_to_base64(file)
-                                settings.banner1_image_data = b64_data
-                                settings.banner1_image_mime = mime_type
-                                settings.banner1_image = f"/database/banner1_from_{secure_filename(file.filename)}"
-                                try:
-                                    app.logger.warning('S3 URL too long for DB, stored banner1 as DB fallback len=%s', len(saved))
-                                except Exception:
-                                    pass
-                                flash('Banner 1 saved to database (fallback) due to long S3 URL', 'success')
-                            else:
-                                settings.banner1_image = saved
-                                settings.banner1_image_data = None
-                                settings.banner1_image_mime = mime_type
-                                flash('Banner 1 uploaded to S3 successfully!', 'success')
-                        elif isinstance(saved, str) and saved.startswith('/uploads/images'):
-                            settings.banner1_image = saved
-                            settings.banner1_image_data = None
-                            settings.banner1_image_mime = mime_type
-                            flash('Banner 1 saved to uploads successfully!', 'success')
-                        else:
-                            file.seek(0)
-                            b64_data = encode_image_to_base64(file)
-                            settings.banner1_image_data = b64_data
-                            settings.banner1_image_mime = mime_type
-                            settings.banner1_image = f"/database/banner1_from_{secure_filename(file.filename)}"
-                            flash('Banner 1 saved to database (fallback) successfully!', 'success')
-                    except Exception:
-                        file.seek(0)
-                        b64_data = encode_image_to_base64(file)
-                        settings.banner1_image_data = b64_data
-                        settings.banner1_image_mime = mime_type
-                        settings.banner1_image = f"/database/banner1_from_{secure_filename(file.filename)}"
-                        flash('Banner 1 saved to database (fallback) successfully!', 'success')
-                except Exception as e:
-                    try:
-                        app.logger.exception('Banner 1 upload failed')
-                    except Exception:
-                        pass
-                    try:
-                        _safe_db_rollback_and_close()
-                    except Exception:
-                        pass
-                    flash(f'Banner 1 upload failed: {str(e)}', 'warning')
-        
-        # Handle banner 2 upload (prefer S3 if configured, otherwise store as base64 in DB)
-        if 'banner2_file' in request.files and request.files['banner2_file']:
-            file = request.files['banner2_file']
-            if file and file.filename and allowed_file(file.filename):
+                    flash(f'{label} upload failed: {str(e)}', 'warning')
+            elif file and file.filename and allowed_file(file.filename):
                 try:
-                    mime_type = get_mime_type(file.filename)
-                    if is_s3_configured():
-                        key = f"banner2_{int(time.time())}_{secure_filename(file.filename)}"
-                        url = upload_to_s3(file, key, mime_type=mime_type)
-                        if url:
-                            if len(url) > 300:
-                                file.seek(0)
-                                b64_data = encode_image_to_base64(file)
-                                settings.banner2_image_data = b64_data
-                                settings.banner2_image_mime = mime_type
-                                settings.banner2_image = f"/database/banner2_from_{secure_filename(file.filename)}"
-                                try:
-                                    app.logger.warning('S3 URL too long for DB, stored banner2 as DB fallback len=%s', len(url))
-                                except Exception:
-                                    pass
-                                flash('Banner 2 saved to database (fallback) due to long S3 URL', 'success')
-                            else:
-                                settings.banner2_image = url
-                            settings.banner2_image_data = None
-                            settings.banner2_image_mime = mime_type
-                            flash('Banner 2 uploaded to S3 successfully!', 'success')
-                        else:
-                            b64_data = encode_image_to_base64(file)
-                            settings.banner2_image_data = b64_data
-                            settings.banner2_image_mime = mime_type
-                            settings.banner2_image = f"/database/banner2_from_{secure_filename(file.filename)}"
-                            flash('Banner 2 saved to database (fallback) successfully!', 'success')
-                    else:
-                        b64_data = encode_image_to_base64(file)
-                        settings.banner2_image_data = b64_data
-                        settings.banner2_image_mime = mime_type
-                        settings.banner2_image = f"/database/banner2_from_{secure_filename(file.filename)}"
-                        flash('Banner 2 saved to database successfully!', 'success')
-                except Exception as e:
                     try:
-                        app.logger.exception('Banner 2 upload failed')
-                    except Exception:
-                        pass
-                    try:
-                        _safe_db_rollback_and_close()
-                    except Exception:
-                        pass
-                    flash(f'Banner 2 upload failed: {str(e)}', 'warning')
-        
-        # Handle background upload (prefer S3 if configured, otherwise store as base64 in DB)
-        if 'bg_file' in request.files and request.files['bg_file']:
-            file = request.files['bg_file']
-            if file and file.filename and allowed_file(file.filename):
-                try:
-                    mime_type = get_mime_type(file.filename)
-                    if is_s3_configured():
-                        key = f"bg_{int(time.time())}_{secure_filename(file.filename)}"
-                        url = upload_to_s3(file, key, mime_type=mime_type)
-                        if url:
-                            if len(url) > 300:
-                                file.seek(0)
-                                b64_data = encode_image_to_base64(file)
-                                settings.bg_image_data = b64_data
-                                settings.bg_image_mime = mime_type
-                                settings.bg_image = f"/database/bg_from_{secure_filename(file.filename)}"
-                                try:
-                                    app.logger.warning('S3 URL too long for DB, stored bg as DB fallback len=%s', len(url))
-                                except Exception:
-                                    pass
-                                flash('Background saved to database (fallback) due to long S3 URL', 'success')
-                            else:
-                                settings.bg_image = url
-                            settings.bg_image_data = None
-                            settings.bg_image_mime = mime_type
-                            flash('Background uploaded to S3 successfully!', 'success')
-                        else:
-                            b64_data = encode_image_to_base64(file)
-                            settings.bg_image_data = b64_data
-                            settings.bg_image_mime = mime_type
-                            settings.bg_image = f"/database/bg_from_{secure_filename(file.filename)}"
-                            flash('Background saved to database (fallback) successfully!', 'success')
-                    else:
-                        b64_data = encode_image_to_base64(file)
-                        settings.bg_image_data = b64_data
-                        settings.bg_image_mime = mime_type
-                        settings.bg_image = f"/database/bg_from_{secure_filename(file.filename)}"
-                        flash('Background saved to database successfully!', 'success')
+                        job = enqueue_image_job(file, 'settings', slot=slot)
+                        _remember_image_job(job)
+                        flash(f'{label} uploaded; processing in the background.', 'success')
+                    except OSError:
+                        # Staging folder unavailable: store synchronously
+                        _store_settings_image(settings, slot, file)
+                        flash(f'{label} saved successfully!', 'success')
                 except Exception as e:
                     try:
-                        app.logger.exception('Background upload failed')
+                        app.logger.exception('%s upload failed', label)
                     except Exception:
                         pass
+                    # Ensure DB session is clean after an upload failure
                     try:
                         _safe_db_rollback_and_close()
                     except Exception:
                         pass
-                    flash(f'Background upload failed: {str(e)}', 'warning')
-        
+                    flash(f'{label} upload failed: {str(e)}', 'warning')
+
         # Logo size/position settings (NOT inside if block—applies always)
         try:
             lh = request.form.get('logo_height')
@@ -4293,7 +7444,7 @@ def admin_settings():
         try:
             db.session.flush()
         except Exception as e:
-            # Log traceback, rollback, persist to /tmp/last_error and re-raise
+            # Log and record the traceback, roll back and return a 500
             import traceback
             tb = traceback.format_exc()
             try:
@@ -4305,19 +7456,12 @@ def admin_settings():
                     sys.stderr.write(tb + "\n")
                 except Exception:
                     pass
-            try:
-                last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-                with open(last_err_path, 'w', encoding='utf-8') as fh:
-                    fh.write(f'Time: {utc_now().isoformat()}\n')
-                    fh.write(str(e) + '\n\n')
-                    fh.write(tb)
-            except Exception:
-                pass
+            _record_error(e, tb)
             try:
                 _safe_db_rollback_and_close()
             except Exception:
                 pass
-            # Return 500 with rendered admin_settings so tests can verify last_error.txt was written
+            # Return 500 with rendered admin_settings; the traceback is listed at /__last_error
             try:
                 return render_template('admin_settings.html', settings=settings), 500
             except Exception:
@@ -4350,15 +7494,8 @@ def admin_settings():
                     sys.stderr.write(tb + "\n")
                 except Exception:
                     pass
-            # Persist last traceback for ease of debugging on serverless hosts
-            try:
-                last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-                with open(last_err_path, 'w', encoding='utf-8') as fh:
-                    fh.write(f"Time: {utc_now().isoformat()}\n")
-                    fh.write(str(e_local) + '\n\n')
-                    fh.write(tb)
-            except Exception:
-                pass
+            # Keep the traceback for /__last_error
+            _record_error(e_local, tb)
             # Safely derive a short error message for the user without assuming `e_local` is available
             try:
                 err_msg = str(e_local) if 'e_local' in locals() else 'An internal error occurred'
@@ -4501,6 +7638,85 @@ def admin_settings_api():
             pass
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/admin/segments')
+@login_required
+@admin_required
+def admin_segments():
+    """Customer RFM segments, with actions to refresh them and issue coupons per segment."""
+    if not getattr(current_user, 'is_admin', False):
+        flash('Admin access required.', 'danger')
+        return redirect(url_for('index'))
+    last_run = SegmentRun.query.order_by(SegmentRun.id.desc()).first()
+    return render_template('admin_segments.html', counts=customer_segment_counts(),
+                           segments=CUSTOMER_SEGMENTS, last_run=last_run)
+
+
+@app.route('/admin/segments/refresh', methods=['POST'])
+@login_required
+@admin_required
+def admin_segments_refresh():
+    if not getattr(current_user, 'is_admin', False):
+        flash('Admin access required.', 'danger')
+        return redirect(url_for('index'))
+    try:
+        result = refresh_customer_segments(full=bool(request.form.get('full')))
+        flash(f"Segments refreshed: {result['customers_updated']} customers updated.", 'success')
+    except Exception as e:
+        try:
+            app.logger.exception('Segment refresh failed: %s', e)
+        except Exception:
+            pass
+        flash(f'Error refreshing segments: {str(e)}', 'danger')
+    return redirect(url_for('admin_segments'))
+
+
+@app.route('/admin/segments/coupons', methods=['POST'])
+@login_required
+@admin_required
+def admin_segment_coupons():
+    """Create one single-use coupon per customer in a segment and download the codes as CSV."""
+    if not getattr(current_user, 'is_admin', False):
+        flash('Admin access required.', 'danger')
+        return redirect(url_for('index'))
+    segment = request.form.get('segment', '')
+    discount_type = request.form.get('discount_type', 'percent')
+    import re
+    prefix = re.sub(r'[^A-Z0-9]', '', (request.form.get('prefix') or segment).upper())[:20] or 'SEG'
+    try:
+        if segment not in dict(CUSTOMER_SEGMENTS):
+            raise ValueError('Choose a segment')
+        if discount_type not in ('percent', 'fixed'):
+            raise ValueError('Invalid discount type')
+        discount_value = Decimal(request.form.get('discount_value', '0'))
+        if discount_value <= 0:
+            raise ValueError('Discount value must be positive')
+        max_discount = request.form.get('max_discount', '')
+        expiry_days = request.form.get('expiry_days', '')
+        expiry_date = None
+        if expiry_days:
+            from datetime import timedelta
+            expiry_date = utc_now().replace(tzinfo=None) + timedelta(days=int(expiry_days))
+        issued = issue_segment_coupons(
+            segment, discount_type, discount_value, expiry_date=expiry_date, prefix=prefix,
+            min_amount=Decimal(request.form.get('min_amount') or '0'),
+            max_discount=Decimal(max_discount) if max_discount else None)
+    except Exception as e:
+        flash(f'Error issuing coupons: {str(e)}', 'danger')
+        return redirect(url_for('admin_segments'))
+    if not issued:
+        flash(f'No customers in segment "{segment}".', 'info')
+        return redirect(url_for('admin_segments'))
+    import csv
+    from io import StringIO
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['email', 'code'])
+    writer.writerows(issued)
+    filename = f"coupons-{segment}-{utc_now():%Y%m%d}.csv"
+    return Response(buf.getvalue(), mimetype='text/csv',
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
 @app.route('/admin/coupons')
 @login_required
 @admin_required
@@ -4751,53 +7967,6 @@ def admin_slider_delete(sid):
     
     return redirect(url_for('admin_sliders'))
 
-# serve uploaded images from UPLOAD_FOLDER (which is /tmp on Vercel or ./static/images locally)
-@app.route('/static/images/<path:fname>')
-def static_images(fname):
-    try:
-        upload_folder = app.config.get('UPLOAD_FOLDER') or str(UPLOAD_FOLDER)
-        file_path = Path(upload_folder) / fname
-        if not file_path.exists():
-            raise FileNotFoundError(f"{file_path} not found")
-        # Read file into memory so we don't keep OS file handles open on Windows
-        with open(file_path, 'rb') as fh:
-            data = fh.read()
-        import mimetypes as _mimetypes
-        mimetype = _mimetypes.guess_type(str(file_path))[0] or 'application/octet-stream'
-        resp = app.response_class(data, mimetype=mimetype)
-        # Add Cache-Control header for public caches (1 hour) and avoid content sniffing
-        resp.headers['Cache-Control'] = 'public, max-age=3600'
-        resp.headers['X-Content-Type-Options'] = 'nosniff'
-        return resp
-    except Exception as e:
-        # If image not found, return 404
-        app.logger.warning("Image not found: %s (%s)", fname, e)
-        abort(404)
-
-
-@app.route('/uploads/images/<path:fname>')
-def uploads_images(fname):
-    """Serve user-uploaded images from `UPLOAD_FOLDER`. This route ensures a
-    consistent public URL (`/uploads/images/*`) regardless of whether the
-    upload folder is local or `/tmp` on serverless hosts (Vercel)."""
-    try:
-        upload_folder = app.config.get('UPLOAD_FOLDER') or str(UPLOAD_FOLDER)
-        file_path = Path(upload_folder) / fname
-        if not file_path.exists():
-            raise FileNotFoundError(f"{file_path} not found")
-        # Read file into memory so file handles are released immediately (Windows-safe)
-        with open(file_path, 'rb') as fh:
-            data = fh.read()
-        import mimetypes as _mimetypes
-        mimetype = _mimetypes.guess_type(str(file_path))[0] or 'application/octet-stream'
-        resp = app.response_class(data, mimetype=mimetype)
-        resp.headers['Cache-Control'] = 'public, max-age=3600'
-        resp.headers['X-Content-Type-Options'] = 'nosniff'
-        return resp
-    except Exception as e:
-        app.logger.warning("Uploaded image not found: %s (%s)", fname, e)
-        abort(404)
-
 @app.route('/image/<image_type>')
 def serve_image(image_type):
     """Serve base64-encoded images from database (for persistent storage on Vercel)"""
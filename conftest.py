@@ -80,3 +80,23 @@ def no_network(monkeypatch):
 
     monkeypatch.setattr(_requests, 'post', fake_post, raising=False)
     monkeypatch.setattr(_requests, 'get', fake_get, raising=False)
+
+
+@pytest.fixture
+def admin_client(request):
+    """A test client logged in as an admin of the calling test module's app.
+
+    Test modules load their own copy of app.py as `mod`; the admin is created in
+    that app's database if missing.
+    """
+    mod = request.module.mod
+    with mod.app.app_context():
+        mod.db.create_all()
+        if not mod.AdminUser.query.filter_by(username='testadmin').first():
+            admin = mod.AdminUser(username='testadmin')
+            admin.set_password('secret')
+            mod.db.session.add(admin)
+            mod.db.session.commit()
+    client = mod.app.test_client()
+    client.post('/admin/login', data={'username': 'testadmin', 'password': 'secret'})
+    return client
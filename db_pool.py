@@ -0,0 +1,512 @@
+"""SQLAlchemy connection pool profiles and pool metrics.
+
+Three named profiles cover the ways the app is deployed:
+
+- ``serverless`` (Vercel): every instance would otherwise keep up to 15 idle
+  connections to Neon. Keeps a tiny ``QueuePool`` (``DB_POOL_SIZE``, default 1)
+  with no overflow, ``pool_pre_ping`` and a short ``pool_recycle`` so frozen
+  instances never hand out a connection the server already dropped; the one
+  connection is the one the start-up warm-up opened. With ``DB_WARMUP=0`` the
+  default is ``NullPool`` (open per checkout, close on return), as is
+  ``DB_POOL_SIZE=0``.
+- ``server`` (gunicorn, Docker): a ``QueuePool`` sized to the worker's threads,
+  with ``pool_pre_ping``, ``pool_recycle`` below typical server idle timeouts and
+  a bounded ``pool_timeout``.
+- ``sqlite``: ``StaticPool`` for in-memory databases (tests), so every session
+  sees the same database; file databases keep SQLAlchemy's default pool.
+
+The profile comes from ``DB_POOL_PROFILE`` or is detected from the URI and the
+``VERCEL`` environment. `timed_engine_options` swaps the chosen pool class for
+a subclass that records checkout latency and how many connections are in use
+(see `PoolMetrics`) before the engine is built; `instrument_engine` then times
+every new connection (TCP + TLS + auth), see `ConnectMetrics`.
+
+`configure_sqlite` tunes file-backed SQLite for concurrent use (WAL, pragmas, an
+optional in-process write lock), see its docstring for the settings.
+
+`build_ssl_context` returns the one SSL context the DB driver should use for the
+life of the process; it resumes TLS sessions, so reconnects after the first skip
+the full handshake. `warm_up` opens and validates a connection ahead of the
+first request.
+"""
+import ssl
+import threading
+import time
+from collections import deque
+
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+POOL_PROFILES = ('serverless', 'server', 'sqlite')
+SLOW_CHECKOUT_SECONDS = 0.1
+
+
+def _env_int(environ, name, default):
+    try:
+        return int(environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def detect_pool_profile(uri: str, environ) -> str:
+    """`DB_POOL_PROFILE` when set to a known profile, otherwise inferred from the URI and platform."""
+    requested = (environ.get('DB_POOL_PROFILE') or '').strip().lower()
+    if requested in POOL_PROFILES:
+        return requested
+    if (uri or '').startswith('sqlite'):
+        return 'sqlite'
+    if environ.get('VERCEL') or environ.get('VERCEL_URL') or environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        return 'serverless'
+    return 'server'
+
+
+def _worker_threads(environ) -> int:
+    """Threads per gunicorn worker (GUNICORN_THREADS, or --threads in GUNICORN_CMD_ARGS)."""
+    threads = _env_int(environ, 'GUNICORN_THREADS', 0)
+    if not threads:
+        args = (environ.get('GUNICORN_CMD_ARGS') or '').split()
+        for i, arg in enumerate(args):
+            if arg.startswith('--threads='):
+                threads = _env_int({'t': arg.split('=', 1)[1]}, 't', 0)
+            elif arg == '--threads' and i + 1 < len(args):
+                threads = _env_int({'t': args[i + 1]}, 't', 0)
+    return max(threads, 1)
+
+
+def warmup_enabled(profile: str, environ) -> bool:
+    """Whether a DB connection is opened at start-up: `DB_WARMUP`, on by default for serverless."""
+    mode = (environ.get('DB_WARMUP') or '').strip().lower()
+    if not mode:
+        return profile == 'serverless'
+    return mode not in ('0', 'false', 'no', 'off')
+
+
+def engine_options_for_profile(profile: str, uri: str, environ) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS pool settings for `profile` (without connect_args)."""
+    if profile == 'serverless':
+        # A NullPool would close the warmed-up connection as soon as it is returned
+        size = _env_int(environ, 'DB_POOL_SIZE', 1 if warmup_enabled(profile, environ) else 0)
+        if size <= 0:
+            return {'poolclass': NullPool}
+        return {
+            'poolclass': QueuePool,
+            'pool_size': size,
+            'max_overflow': 0,
+            'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 5),
+            'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 300),
+            'pool_pre_ping': True,
+        }
+    if profile == 'sqlite':
+        if ':memory:' in uri or uri.rstrip('/') in ('sqlite:', 'sqlite:/'):
+            return {'poolclass': StaticPool}
+        return {}
+    # Image and email worker threads also check out connections, hence the headroom
+    return {
+        'poolclass': QueuePool,
+        'pool_size': _env_int(environ, 'DB_POOL_SIZE', max(_worker_threads(environ) + 2, 5)),
+        'max_overflow': _env_int(environ, 'DB_MAX_OVERFLOW', 5),
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+class PoolMetrics:
+    """Process-wide pool counters: checkout latency, connections in use and failures.
+
+    Latency percentiles come from the last `window` checkouts. Saturation is the
+    share of the pool's capacity (pool_size + max_overflow) in use; pools without
+    a limit (NullPool) report None.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self.checkouts = 0
+            self.checkout_seconds = 0.0
+            self.max_checkout_seconds = 0.0
+            self.slow_checkouts = 0
+            self.failures = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.capacity = None
+
+    def record_checkout(self, seconds: float, capacity=None):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds += seconds
+            self.max_checkout_seconds = max(self.max_checkout_seconds, seconds)
+            if seconds >= SLOW_CHECKOUT_SECONDS:
+                self.slow_checkouts += 1
+            self._recent.append(seconds)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.capacity = capacity
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def record_return(self):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            capacity = self.capacity
+
+            def pct(q):
+                return round(recent[min(int(q * len(recent)), len(recent) - 1)] * 1000, 3) if recent else 0.0
+
+            return {
+                'checkouts': self.checkouts,
+                'checkout_ms_avg': round(self.checkout_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'checkout_ms_p50': pct(0.5),
+                'checkout_ms_p95': pct(0.95),
+                'checkout_ms_max': round(self.max_checkout_seconds * 1000, 3),
+                'slow_checkouts': self.slow_checkouts,
+                'failures': self.failures,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'capacity': capacity,
+                'saturation': round(self.in_use / capacity, 3) if capacity else None,
+                'peak_saturation': round(self.peak_in_use / capacity, 3) if capacity else None,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def _pool_capacity(pool):
+    if isinstance(pool, QueuePool):
+        overflow = getattr(pool, '_max_overflow', 0)
+        return None if overflow < 0 else pool.size() + overflow
+    if isinstance(pool, StaticPool):
+        return 1
+    return None
+
+
+_timed_classes = {}
+
+
+def timed_pool_class(base):
+    """A subclass of pool class `base` that times `_do_get` (waiting for, or opening,
+    a connection) and counts returns, reporting both to `pool_metrics`."""
+    if getattr(base, '_pool_metrics_timed', False):
+        return base
+    if base in _timed_classes:
+        return _timed_classes[base]
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = base._do_get(self)
+        except Exception:
+            pool_metrics.record_failure()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - started, _pool_capacity(self))
+        return conn
+
+    def _do_return_conn(self, record):
+        pool_metrics.record_return()
+        return base._do_return_conn(self, record)
+
+    _timed_classes[base] = type(f'Timed{base.__name__}', (base,),
+                                {'_do_get': _do_get, '_do_return_conn': _do_return_conn,
+                                 '_pool_metrics_timed': True})
+    return _timed_classes[base]
+
+
+def timed_engine_options(options: dict, uri: str) -> dict:
+    """Set `options['poolclass']` (engine options, before the engine is created) to the
+    timed subclass of the configured pool class, or of the dialect's default for `uri`.
+
+    An explicit `pool` instance is left alone. `Pool.recreate` (engine.dispose)
+    builds the new pool from the same class, so it stays timed.
+
+    Flask-SQLAlchemy replaces `poolclass` with a plain StaticPool for in-memory
+    SQLite after these options are read; `instrument_engine` times such a pool.
+    """
+    if 'pool' in options:
+        return options
+    base = options.get('poolclass')
+    if base is None:
+        from sqlalchemy.engine import make_url
+        url = make_url(uri)
+        base = url.get_dialect().get_pool_class(url)
+    options['poolclass'] = timed_pool_class(base)
+    return options
+
+
+def time_pool(pool):
+    """Make an existing `pool` report to `pool_metrics`, for pools built without
+    `timed_engine_options` (the timed subclass only adds methods, so the class is
+    swapped in place)."""
+    if not getattr(pool, '_pool_metrics_timed', False):
+        pool.__class__ = timed_pool_class(type(pool))
+    return pool
+
+
+def instrument_engine(engine):
+    """Report `engine`'s new connections to `connect_metrics` and its pool checkouts
+    to `pool_metrics`.
+
+    The pool is normally timed from creation (see `timed_engine_options`); one
+    whose class was chosen elsewhere is timed here, see `time_pool`.
+    """
+    time_pool(engine.pool)
+    return instrument_connects(engine)
+
+
+def pool_status(engine) -> dict:
+    """`pool_metrics` plus the pool's own configuration, for diagnostics."""
+    pool = engine.pool
+    info = {'pool_class': type(pool).__name__.replace('Timed', '', 1)}
+    if isinstance(pool, QueuePool):
+        info.update(pool_size=pool.size(), max_overflow=getattr(pool, '_max_overflow', None),
+                    checked_out=pool.checkedout(), overflow=pool.overflow())
+    info['pool_recycle'] = getattr(pool, '_recycle', None)
+    info['pool_pre_ping'] = bool(getattr(pool, '_pre_ping', False))
+    return {**info, **pool_metrics.snapshot(), **connect_metrics.snapshot()}
+
+
+class ConnectMetrics:
+    """Timing of new DB connections and of their TLS handshakes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.connect_seconds = 0.0
+            self.last_connect_seconds = None
+            self.max_connect_seconds = 0.0
+            self.tls_handshakes = 0
+            self.tls_resumed = 0
+            self.tls_seconds = 0.0
+            self.last_tls_seconds = None
+
+    def record_connect(self, seconds: float):
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+            self.last_connect_seconds = seconds
+            self.max_connect_seconds = max(self.max_connect_seconds, seconds)
+
+    def record_tls(self, seconds: float, resumed: bool):
+        with self._lock:
+            self.tls_handshakes += 1
+            self.tls_resumed += int(bool(resumed))
+            self.tls_seconds += seconds
+            self.last_tls_seconds = seconds
+
+    def snapshot(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'connect_ms_avg': ms(self.connect_seconds / self.connects) if self.connects else None,
+                'connect_ms_last': ms(self.last_connect_seconds),
+                'connect_ms_max': ms(self.max_connect_seconds) if self.connects else None,
+                'tls_handshakes': self.tls_handshakes,
+                'tls_resumed': self.tls_resumed,
+                'tls_ms_avg': ms(self.tls_seconds / self.tls_handshakes) if self.tls_handshakes else None,
+                'tls_ms_last': ms(self.last_tls_seconds),
+            }
+
+
+connect_metrics = ConnectMetrics()
+
+
+class _ResumingSSLSocket(ssl.SSLSocket):
+    """Times its handshake and hands its TLS session back to the context for reuse."""
+
+    def do_handshake(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().do_handshake(*args, **kwargs)
+        connect_metrics.record_tls(time.perf_counter() - started, self.session_reused)
+        self.context.remember_session(self)
+        return result
+
+    def _real_close(self):
+        # TLS 1.3 tickets arrive after the handshake, so take the session again on close
+        self.context.remember_session(self)
+        super()._real_close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """Client SSL context that offers the last session seen for a host on the next connect."""
+
+    sslsocket_class = _ResumingSSLSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        self = super().__new__(cls, protocol, *args, **kwargs)
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        return self
+
+    def remember_session(self, sock):
+        try:
+            session = sock.session
+        except (ValueError, AttributeError):
+            session = None
+        host = getattr(sock, 'server_hostname', None)
+        if session is not None and host:
+            with self._sessions_lock:
+                self._sessions[host] = session
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None and server_hostname:
+            with self._sessions_lock:
+                session = self._sessions.get(server_hostname)
+        return super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+
+
+def build_ssl_context(cafile=None):
+    """The process-wide DB SSL context: `ssl.create_default_context()` settings plus session resumption."""
+    ctx = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    if cafile:
+        ctx.load_verify_locations(cafile)
+    else:
+        ctx.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    return ctx
+
+
+def _on_do_connect(dialect, conn_rec, cargs, cparams):
+    conn_rec.info['_connect_started'] = time.perf_counter()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    started = connection_record.info.pop('_connect_started', None)
+    if started is not None:
+        connect_metrics.record_connect(time.perf_counter() - started)
+
+
+def instrument_connects(engine):
+    """Time each new DBAPI connection, from `do_connect` to the pool's `connect` event."""
+    from sqlalchemy import event
+    if not event.contains(engine, 'do_connect', _on_do_connect):
+        event.listen(engine, 'do_connect', _on_do_connect)
+        event.listen(engine, 'connect', _on_connect)
+    return engine
+
+
+def warm_up(engine) -> dict:
+    """Open one connection, run SELECT 1 and return it to the pool; returns the outcome and timing."""
+    from sqlalchemy import text
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    except Exception as exc:
+        return {'ok': False, 'ms': round((time.perf_counter() - started) * 1000, 3), 'error': str(exc)[:200]}
+    return {'ok': True, 'ms': round((time.perf_counter() - started) * 1000, 3), 'error': None}
+
+
+def sqlite_pragmas(environ) -> dict:
+    """PRAGMAs applied to every new SQLite connection, with env overrides.
+
+    WAL lets readers run while a write is in progress; synchronous=NORMAL is safe
+    with WAL (a power loss can only drop the last commits, never corrupt);
+    busy_timeout makes a blocked writer wait instead of failing with "database is
+    locked"; cache_size is negative KiB.
+    """
+    return {
+        'journal_mode': (environ.get('SQLITE_JOURNAL_MODE') or 'WAL').upper(),
+        'synchronous': (environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL').upper(),
+        'busy_timeout': _env_int(environ, 'SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'foreign_keys': 'ON',
+        'cache_size': -_env_int(environ, 'SQLITE_CACHE_SIZE_KB', 20000),
+        'mmap_size': _env_int(environ, 'SQLITE_MMAP_SIZE', 128 * 1024 * 1024),
+    }
+
+
+class SQLiteWriteLock:
+    """Serializes write transactions from this process's threads.
+
+    SQLite allows one writer at a time; without this, concurrent writers find the
+    database locked and sleep in SQLite's busy handler (backing off up to 100ms
+    per retry). With it they queue on a lock taken at the first INSERT, UPDATE or
+    DELETE of a transaction and released when it commits or rolls back. Waiting
+    is bounded by `timeout`, after which the statement proceeds and SQLite's own
+    busy_timeout applies, so a thread that writes on two connections cannot hang.
+    """
+
+    _WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('_sqlite_write_lock') or not statement.lstrip()[:7].upper().startswith(self._WRITE_PREFIXES):
+            return
+        started = time.perf_counter()
+        if self._lock.acquire(timeout=self.timeout):
+            conn.info['_sqlite_write_lock'] = True
+            self.acquired += 1
+        else:
+            self.timeouts += 1
+        self.wait_seconds += time.perf_counter() - started
+
+    def _release(self, info):
+        if info.pop('_sqlite_write_lock', False):
+            self._lock.release()
+
+    def release(self, conn):
+        self._release(conn.info)
+
+    def release_record(self, dbapi_connection, connection_record, reset_state=None):
+        # Also used for 'invalidate', whose third argument is the exception
+        self._release(connection_record.info)
+
+    def snapshot(self) -> dict:
+        return {'write_locks': self.acquired, 'write_lock_timeouts': self.timeouts,
+                'write_lock_wait_ms': round(self.wait_seconds * 1000, 3)}
+
+
+def configure_sqlite(engine, environ, serialize_writes=None):
+    """Apply `sqlite_pragmas` on every new connection to `engine` and optionally serialize writes.
+
+    SQLITE_TUNING=0 turns the pragmas off; SQLITE_SERIALIZE_WRITES=1 (or
+    `serialize_writes=True`) installs a `SQLiteWriteLock`, which is returned.
+    """
+    from sqlalchemy import event
+    if engine.dialect.name != 'sqlite':
+        return None
+    if (environ.get('SQLITE_TUNING') or '1').strip().lower() not in ('0', 'false', 'no', 'off'):
+        pragmas = sqlite_pragmas(environ)
+
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+            finally:
+                cursor.close()
+
+        event.listen(engine, 'connect', _apply_pragmas)
+    if serialize_writes is None:
+        serialize_writes = (environ.get('SQLITE_SERIALIZE_WRITES') or '').strip().lower() in ('1', 'true', 'yes', 'on')
+    if not serialize_writes:
+        return None
+    lock = SQLiteWriteLock(timeout=_env_int(environ, 'SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000)
+    event.listen(engine, 'before_cursor_execute', lock.before_execute)
+    event.listen(engine, 'commit', lock.release)
+    event.listen(engine, 'rollback', lock.release)
+    # Connections returned to the pool without an explicit commit/rollback
+    event.listen(engine.pool, 'reset', lock.release_record)
+    event.listen(engine.pool, 'invalidate', lock.release_record)
+    return lock
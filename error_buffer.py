@@ -0,0 +1,113 @@
+"""Recent exceptions kept in memory, grouped by fingerprint.
+
+`ErrorBuffer.record()` is cheap enough for an error path: it hashes the
+exception type and the functions on its traceback into a *fingerprint*, bumps
+that group's count and remembers the latest occurrence (time, route, request
+id, message, traceback). Groups are kept most-recently-seen last and the
+oldest is evicted beyond `size`, so a burst of distinct failures cannot grow
+memory; a `recent` ring keeps the last `size` individual occurrences.
+
+Line numbers are left out of the fingerprint so the same failure keeps its
+group across deploys; the message is left out because it usually carries
+values (ids, amounts) that differ per occurrence.
+
+With `track_pending`, groups touched since the last `take_pending()` are
+tracked with their count delta so the app can persist them in batches (see
+``ErrorGroup`` in app.py); without it nothing is kept for a flush that never comes.
+"""
+import os
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+
+def fingerprint(exc) -> str:
+    """Stable id for an exception: its type plus the (file, function) of each traceback frame."""
+    parts = [type(exc).__module__ + '.' + type(exc).__qualname__]
+    for frame in traceback.extract_tb(exc.__traceback__):
+        parts.append(f'{os.path.basename(frame.filename)}:{frame.name}')
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+class ErrorBuffer:
+    """The last `size` distinct errors (by fingerprint) and occurrences. Thread-safe."""
+
+    def __init__(self, size: int = 100, track_pending: bool = True):
+        self.size = size
+        self.track_pending = track_pending
+        self._groups = OrderedDict()  # fingerprint -> group dict, least recently seen first
+        self._recent = deque(maxlen=size)
+        self._pending = {}  # fingerprint -> occurrences not yet persisted
+        self._lock = threading.Lock()
+
+    def record(self, exc, route: str = None, request_id: str = None, tb: str = None) -> dict:
+        """Add one occurrence of `exc`; returns a copy of its group."""
+        key = fingerprint(exc)
+        if tb is None:
+            tb = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            group = self._groups.pop(key, None)
+            if group is None:
+                group = {'fingerprint': key, 'type': type(exc).__name__, 'count': 0, 'first_seen': now}
+            group.update(count=group['count'] + 1, last_seen=now, message=str(exc)[:1000], route=route,
+                         request_id=request_id, traceback=tb)
+            self._groups[key] = group
+            while len(self._groups) > self.size:
+                self._groups.popitem(last=False)
+            self._recent.append({'at': now, 'fingerprint': key, 'route': route, 'request_id': request_id})
+            if self.track_pending:
+                self._pending[key] = self._pending.get(key, 0) + 1
+            return dict(group)
+
+    def grouped(self) -> list:
+        """Groups, most recently seen first."""
+        with self._lock:
+            return [dict(g) for g in reversed(self._groups.values())]
+
+    def recent(self) -> list:
+        """Individual occurrences, newest first."""
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def take_pending(self) -> list:
+        """Groups recorded since the last call, each with `new` = occurrences since then."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            return [dict(self._groups[key], new=new) for key, new in pending.items() if key in self._groups]
+
+    def restore_pending(self, batch: list):
+        """Put back a batch from `take_pending` that could not be persisted."""
+        with self._lock:
+            for group in batch:
+                key = group['fingerprint']
+                self._pending[key] = self._pending.get(key, 0) + group['new']
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._recent.clear()
+            self._pending.clear()
+
+    def __len__(self):
+        return len(self._groups)
+
+
+def _iso(value) -> str:
+    return value.isoformat() if value else '-'
+
+
+def format_groups(groups: list) -> str:
+    """Plain-text listing of `grouped()`: one header per group, then its latest traceback."""
+    blocks = []
+    for g in groups:
+        blocks.append('\n'.join([
+            f"{g['count']}x {g['type']}: {g['message']}",
+            f"  fingerprint={g['fingerprint']} route={g['route'] or '-'} request_id={g['request_id'] or '-'}",
+            f"  first={_iso(g['first_seen'])} last={_iso(g['last_seen'])}",
+            '',
+            g['traceback'] or '',
+        ]))
+    return '\n\n'.join(blocks)
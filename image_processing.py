@@ -0,0 +1,120 @@
+"""Validate and optimize uploaded images.
+
+`process_image` checks that the bytes really are an image and, when Pillow is
+installed, applies the EXIF orientation, strips metadata, recompresses the image
+and builds smaller derivatives (thumbnails). Without Pillow the image is only
+validated by its magic bytes and stored unchanged.
+"""
+import io
+import importlib
+
+# Longest edge, in pixels, for each derivative
+DERIVATIVE_SIZES = {'thumb': 320, 'medium': 960}
+# Refuse images that would decode to more than this many pixels (decompression bombs)
+MAX_PIXELS = 40_000_000
+JPEG_QUALITY = 85
+
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+_PIL_FORMATS = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'GIF': 'image/gif'}
+
+
+class ImageValidationError(ValueError):
+    """Raised when uploaded bytes are not an acceptable image."""
+
+
+class ProcessedImage:
+    """The optimized image plus its derivatives (name -> bytes)."""
+
+    def __init__(self, data, mime_type, width=None, height=None, derivatives=None):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.derivatives = derivatives or {}
+
+
+def sniff_mime(data: bytes):
+    """Return the image MIME type implied by the leading bytes, or None."""
+    for signature, mime in _SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    return None
+
+
+def _load_pil():
+    try:
+        return importlib.import_module('PIL.Image'), importlib.import_module('PIL.ImageOps')
+    except Exception:
+        return None, None
+
+
+def _encode(img, fmt, source_info=None):
+    out = io.BytesIO()
+    if fmt == 'JPEG':
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == 'PNG':
+        img.save(out, 'PNG', optimize=True)
+    else:
+        kwargs = {}
+        if source_info and 'transparency' in source_info:
+            kwargs['transparency'] = source_info['transparency']
+        img.save(out, fmt, optimize=True, **kwargs)
+    return out.getvalue()
+
+
+def process_image(data: bytes, derivative_sizes=None) -> ProcessedImage:
+    """Validate `data` and return a `ProcessedImage`. Raises `ImageValidationError`."""
+    if not data:
+        raise ImageValidationError('Empty upload')
+    mime_type = sniff_mime(data)
+    if mime_type is None:
+        raise ImageValidationError('File is not a PNG, JPEG or GIF image')
+    Image, ImageOps = _load_pil()
+    if Image is None:
+        return ProcessedImage(data, mime_type)
+
+    sizes = DERIVATIVE_SIZES if derivative_sizes is None else derivative_sizes
+    try:
+        probe = Image.open(io.BytesIO(data))
+        fmt = probe.format
+        width, height = probe.size
+        if width * height > MAX_PIXELS:
+            raise ImageValidationError(f'Image is too large ({width}x{height})')
+        probe.verify()
+        # verify() leaves the image unusable; reopen to decode
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except ImageValidationError:
+        raise
+    except Exception as exc:
+        raise ImageValidationError(f'Corrupt or unsupported image: {exc}') from exc
+    if fmt not in _PIL_FORMATS:
+        raise ImageValidationError(f'Unsupported image format: {fmt}')
+
+    if getattr(img, 'n_frames', 1) > 1:
+        # Keep animations intact; GIF carries no EXIF to strip
+        return ProcessedImage(data, _PIL_FORMATS[fmt], width, height)
+
+    info = dict(img.info)
+    img = ImageOps.exif_transpose(img)
+    optimized = _encode(img, fmt, info)
+    if len(optimized) >= len(data) and not info.get('exif'):
+        # Nothing to strip and recompression did not help
+        optimized = data
+    width, height = img.size
+
+    derivatives = {}
+    for name, edge in sizes.items():
+        if max(width, height) <= edge:
+            continue
+        thumb = img.copy()
+        thumb.thumbnail((edge, edge), Image.LANCZOS)
+        derivatives[name] = _encode(thumb, fmt, info)
+    return ProcessedImage(optimized, _PIL_FORMATS[fmt], width, height, derivatives)
@@ -0,0 +1,448 @@
+"""Prometheus metrics in the text exposition format, aggregated across worker processes.
+
+`Counter`, `Gauge` and `Histogram` keep their values in memory, keyed by label
+values, in a `Registry`. `Registry.render()` returns the Prometheus text
+format (version 0.0.4) for a ``/metrics`` endpoint.
+
+Each gunicorn worker is a separate process with its own values, so a scrape
+that lands on one worker would only see that worker's share. When
+``METRICS_DIR`` (or ``PROMETHEUS_MULTIPROC_DIR``) names a directory shared by
+the workers of a host, every process writes its values to
+``<dir>/metrics-<pid>.json``:
+
+- after a request, at most every ``METRICS_FLUSH_INTERVAL`` seconds (default 5);
+- at exit;
+- whenever it serves a scrape.
+
+A scrape then merges every file:
+
+- Counters and histograms are summed across all files, including those of
+  exited workers, so totals never go backwards when gunicorn recycles a
+  worker. Files of exited workers are folded into ``metrics-archive.json``
+  so the directory does not grow without bound.
+- Gauges are summed (``livesum``) or maxed (``livemax``) over live processes
+  only.
+- ``local`` gauges are never written to files. Use them for values the
+  scraping process computes itself, such as queue depths read from the
+  database.
+
+Empty the directory when the app is deployed, as with prometheus_client's
+multiprocess mode, or counters carry over from the previous release. Without
+a directory, metrics are per process, which is what a single worker (or a
+test) wants.
+
+`collect` callbacks run before every flush and scrape, to copy values owned
+elsewhere (e.g. `db_pool.pool_metrics`) into metrics. `scrape` callbacks run
+only in the process serving the scrape. `derive` callbacks compute extra
+series (such as hit ratios) from the merged values.
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import weakref
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, so no archive compaction
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ARCHIVE_NAME = 'metrics-archive.json'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if isinstance(value, float) and value != value:
+        return 'NaN'
+    return repr(float(value))
+
+
+def _labels_text(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+_registries = weakref.WeakSet()
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def _export(self) -> dict:
+        with self._lock:
+            values = [[list(k), [list(v[0]), v[1]] if isinstance(v, list) else v] for k, v in self._values.items()]
+        return {'type': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames),
+                'values': values}
+
+
+class Counter(_Metric):
+    """A monotonically increasing total."""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a total counted elsewhere in this process (it must only grow)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. `mode` decides how processes combine: livesum, livemax or local."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, mode='livesum'):
+        if mode not in ('livesum', 'livemax', 'local'):
+            raise ValueError(f'Unknown gauge mode {mode!r}')
+        self.mode = mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _export(self) -> dict:
+        exported = super()._export()
+        exported['mode'] = self.mode
+        return exported
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative `buckets` (upper bounds, seconds by convention)."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, the last one for +Inf, then the sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _export(self) -> dict:
+        exported = super()._export()
+        exported['buckets'] = list(self.buckets)
+        return exported
+
+
+class Registry:
+    """The metrics of one process, with optional aggregation through a shared directory."""
+
+    def __init__(self, directory=None, flush_interval: float = 5.0):
+        self.metrics = {}
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._collectors = []
+        self._scrapers = []
+        self._derivers = []
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        _registries.add(self)
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def collect(self, fn):
+        """Register `fn()` to refresh metrics before every flush and scrape. Usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def scrape(self, fn):
+        """Register `fn()` to run only in the process serving a scrape (for `local` gauges)."""
+        self._scrapers.append(fn)
+        return fn
+
+    def derive(self, fn):
+        """Register `fn(merged)` returning extra families, computed from the merged values."""
+        self._derivers.append(fn)
+        return fn
+
+    def configure(self, directory=None, flush_interval=None):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory or None
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    def reset(self):
+        """Drop every value in this process (after a fork, the parent's values belong to the parent)."""
+        for metric in self.metrics.values():
+            metric.clear()
+        self._last_flush = 0.0
+
+    def _run(self, callbacks):
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+    def export(self) -> dict:
+        """This process's values, JSON-serializable."""
+        return {name: metric._export() for name, metric in self.metrics.items()}
+
+    def _path(self, pid=None) -> str:
+        return os.path.join(self.directory, f'metrics-{pid or os.getpid()}.json')
+
+    def flush(self, force: bool = False) -> bool:
+        """Write this process's values to the shared directory (throttled unless `force`)."""
+        if not self.directory:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return False
+        if not self._flush_lock.acquire(blocking=force):
+            return False
+        try:
+            self._last_flush = now
+            self._run(self._collectors)
+            exported = {name: family for name, family in self.export().items()
+                        if family.get('mode') != 'local'}
+            path = self._path()
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump(exported, fh)
+            os.replace(tmp, path)
+            return True
+        except OSError:
+            return False
+        finally:
+            self._flush_lock.release()
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _files(self):
+        """[(pid or None for the archive, path)] of the per-process files in the directory."""
+        found = []
+        for name in os.listdir(self.directory):
+            if name == ARCHIVE_NAME:
+                found.append((None, os.path.join(self.directory, name)))
+            elif name.startswith('metrics-') and name.endswith('.json'):
+                try:
+                    found.append((int(name[len('metrics-'):-len('.json')]), os.path.join(self.directory, name)))
+                except ValueError:
+                    continue
+        return found
+
+    @contextmanager
+    def _directory_lock(self):
+        """Serialize scrapes on this host, so a file is never read while it is being archived."""
+        if fcntl is None:
+            yield False
+            return
+        with open(os.path.join(self.directory, '.metrics.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield True
+
+    def _compact(self, archived, dead):
+        """Fold the files of exited workers into the archive (counters and histograms only)."""
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        merged = _merge([(archived or {}, False)] + [(data, False) for _path, data in dead])
+        tmp = f'{archive_path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(merged, fh)
+        os.replace(tmp, archive_path)
+        for path, _data in dead:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def merged(self) -> dict:
+        """Values of every process (or just this one without a directory), merged per family."""
+        self._run(self._collectors)
+        self._run(self._scrapers)
+        local = self.export()
+        if not self.directory:
+            return local
+        self.flush(force=True)
+        with self._directory_lock() as locked:
+            sources, dead, archived = [], [], None
+            for pid, path in self._files():
+                data = self._read(path)
+                if data is None:
+                    continue
+                alive = pid is not None and _pid_alive(pid)
+                sources.append((data, alive))
+                if pid is None:
+                    archived = data
+                elif not alive:
+                    dead.append((path, data))
+            merged = _merge(sources)
+            if locked and dead:
+                try:
+                    self._compact(archived, dead)
+                except OSError:
+                    pass
+        # `local` gauges come from this process only
+        for name, family in local.items():
+            if family.get('mode') == 'local':
+                merged[name] = family
+        return merged
+
+    def render(self) -> str:
+        merged = self.merged()
+        for fn in self._derivers:
+            try:
+                merged.update(fn(merged) or {})
+            except Exception:
+                pass
+        lines = []
+        for name in sorted(merged):
+            family = merged[name]
+            lines.append(f"# HELP {name} {family['help']}".replace('\n', ' '))
+            lines.append(f"# TYPE {name} {family['type']}")
+            names = family['labelnames']
+            for labels, value in sorted(family['values'], key=lambda v: v[0]):
+                if family['type'] == 'histogram':
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(family['buckets'] + [float('inf')], counts):
+                        cumulative += count
+                        le = _format_value(bound)
+                        lines.append(f"{name}_bucket{_labels_text(names, labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels_text(names, labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_labels_text(names, labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_labels_text(names, labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(sources) -> dict:
+    """Merge exported families from [(data, alive)]: see the module docstring for the rules."""
+    merged = {}
+    for data, alive in sources:
+        for name, family in data.items():
+            mode = family.get('mode')
+            if family['type'] == 'gauge' and not alive:
+                continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {k: v for k, v in family.items() if k != 'values'}
+                target['_values'] = {}
+            values = target['_values']
+            for labels, value in family['values']:
+                key = tuple(labels)
+                current = values.get(key)
+                if family['type'] == 'histogram':
+                    if current is None or len(current[0]) != len(value[0]):
+                        values[key] = [list(value[0]), value[1]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                elif current is None:
+                    values[key] = value
+                elif mode == 'livemax':
+                    values[key] = max(current, value)
+                else:
+                    values[key] = current + value
+    for family in merged.values():
+        family['values'] = [[list(k), v] for k, v in family.pop('_values').items()]
+    return merged
+
+
+def configure_from_env(environ, registry):
+    """Point `registry` at METRICS_DIR / PROMETHEUS_MULTIPROC_DIR, if set."""
+    directory = environ.get('METRICS_DIR') or environ.get('PROMETHEUS_MULTIPROC_DIR')
+    try:
+        interval = float(environ.get('METRICS_FLUSH_INTERVAL') or 5)
+    except ValueError:
+        interval = 5.0
+    registry.configure(directory, interval)
+    return registry
+
+
+def _after_fork_in_child():
+    for registry in list(_registries):
+        registry.reset()
+
+
+def _flush_all():
+    for registry in list(_registries):
+        registry.flush(force=True)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(_flush_all)
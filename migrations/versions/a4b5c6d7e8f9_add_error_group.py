@@ -0,0 +1,41 @@
+"""Add error_group for persisted error buffer groups
+
+Revision ID: a4b5c6d7e8f9
+Revises: f3a4b5c6d7e8
+Create Date: 2026-10-19 00:00:10.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4b5c6d7e8f9'
+down_revision = 'f3a4b5c6d7e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'error_group' not in insp.get_table_names():
+        op.create_table(
+            'error_group',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('fingerprint', sa.String(length=40), nullable=False, unique=True),
+            sa.Column('exc_type', sa.String(length=120), nullable=True),
+            sa.Column('message', sa.Text(), nullable=True),
+            sa.Column('route', sa.String(length=120), nullable=True),
+            sa.Column('request_id', sa.String(length=64), nullable=True),
+            sa.Column('traceback', sa.Text(), nullable=True),
+            sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('first_seen', sa.DateTime(), nullable=True),
+            sa.Column('last_seen', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_error_group_last_seen', 'error_group', ['last_seen'])
+
+
+def downgrade():
+    op.drop_index('ix_error_group_last_seen', table_name='error_group')
+    op.drop_table('error_group')
@@ -0,0 +1,47 @@
+"""Add daily_sales and product_sales_daily rollup tables
+
+Revision ID: a8b9c0d1e2f3
+Revises: f7a8b9c0d1e2
+Create Date: 2026-10-19 00:00:04.000000
+
+Run `flask backfill-sales-rollups` once after upgrading to load existing orders.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8b9c0d1e2f3'
+down_revision = 'f7a8b9c0d1e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    tables = set(sa.inspect(conn).get_table_names())
+    if 'daily_sales' not in tables:
+        op.create_table(
+            'daily_sales',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('orders_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('revenue', sa.Numeric(14, 2), nullable=False, server_default='0'),
+            sa.Column('discount', sa.Numeric(14, 2), nullable=False, server_default='0'),
+            sa.Column('items_sold', sa.Integer(), nullable=False, server_default='0'),
+            sa.PrimaryKeyConstraint('day'),
+        )
+    if 'product_sales_daily' not in tables:
+        op.create_table(
+            'product_sales_daily',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=255), nullable=True),
+            sa.Column('qty', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('revenue', sa.Numeric(14, 2), nullable=False, server_default='0'),
+            sa.PrimaryKeyConstraint('day', 'product_id'),
+        )
+
+
+def downgrade():
+    op.drop_table('product_sales_daily')
+    op.drop_table('daily_sales')
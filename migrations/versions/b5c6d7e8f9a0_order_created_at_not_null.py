@@ -0,0 +1,30 @@
+"""Make order.created_at NOT NULL for the admin order list keyset
+
+Revision ID: b5c6d7e8f9a0
+Revises: a4b5c6d7e8f9
+Create Date: 2026-10-19 00:00:11.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5c6d7e8f9a0'
+down_revision = 'a4b5c6d7e8f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pages compare (created_at, id) > (:value, :id), which never matches a
+    # NULL created_at; give such rows a timestamp before adding the constraint.
+    order = sa.table('order', sa.column('created_at', sa.DateTime()))
+    op.execute(order.update().where(order.c.created_at.is_(None)).values(created_at=sa.func.current_timestamp()))
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,55 @@
+"""Add customer_segment and segment_run tables
+
+Revision ID: b9c0d1e2f3a4
+Revises: a8b9c0d1e2f3
+Create Date: 2026-10-19 00:00:05.000000
+
+Run `flask refresh-customer-segments --full` once after upgrading.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9c0d1e2f3a4'
+down_revision = 'a8b9c0d1e2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    tables = set(sa.inspect(conn).get_table_names())
+    if 'customer_segment' not in tables:
+        op.create_table(
+            'customer_segment',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('last_order_at', sa.DateTime(), nullable=True),
+            sa.Column('orders_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('monetary', sa.Numeric(14, 2), nullable=False, server_default='0'),
+            sa.Column('recency_score', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('frequency_score', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('monetary_score', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('segment', sa.String(length=30), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('user_id'),
+        )
+        op.create_index('ix_customer_segment_segment', 'customer_segment', ['segment'])
+    if 'segment_run' not in tables:
+        op.create_table(
+            'segment_run',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('full', sa.Boolean(), nullable=True),
+            sa.Column('last_order_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('customers_updated', sa.Integer(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('segment_run')
+    op.drop_index('ix_customer_segment_segment', table_name='customer_segment')
+    op.drop_table('customer_segment')
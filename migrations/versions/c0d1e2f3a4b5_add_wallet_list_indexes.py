@@ -0,0 +1,36 @@
+"""Add indexes for the paginated admin wallet list
+
+Revision ID: c0d1e2f3a4b5
+Revises: b9c0d1e2f3a4
+Create Date: 2026-10-19 00:00:06.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c0d1e2f3a4b5'
+down_revision = 'b9c0d1e2f3a4'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_wallet_user_id', ['user_id']),
+    ('ix_wallet_balance', ['balance']),
+    ('ix_wallet_updated_at', ['updated_at']),
+)
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    existing = {ix['name'] for ix in insp.get_indexes('wallet')}
+    for name, columns in INDEXES:
+        if name not in existing:
+            op.create_index(name, 'wallet', columns, unique=False)
+
+
+def downgrade():
+    for name, _columns in reversed(INDEXES):
+        op.drop_index(name, table_name='wallet')
@@ -0,0 +1,39 @@
+"""Add stored_file table for the database storage backend
+
+Revision ID: c4d5e6f7a8b9
+Revises: b9e7f8f7a2c
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d5e6f7a8b9'
+down_revision = 'b9e7f8f7a2c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'stored_file' in insp.get_table_names():
+        return
+    op.create_table(
+        'stored_file',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=512), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('size', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_stored_file_key', 'stored_file', ['key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_stored_file_key', table_name='stored_file')
+    op.drop_table('stored_file')
@@ -0,0 +1,32 @@
+"""Add product.sku for bulk import upserts
+
+Revision ID: d1e2f3a4b5c6
+Revises: c0d1e2f3a4b5
+Create Date: 2026-10-19 00:00:07.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1e2f3a4b5c6'
+down_revision = 'c0d1e2f3a4b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    columns = {c['name'] for c in insp.get_columns('product')}
+    if 'sku' not in columns:
+        op.add_column('product', sa.Column('sku', sa.String(length=64), nullable=True))
+    existing = {ix['name'] for ix in insp.get_indexes('product')}
+    if 'ix_product_sku' not in existing:
+        op.create_index('ix_product_sku', 'product', ['sku'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_product_sku', table_name='product')
+    op.drop_column('product', 'sku')
@@ -0,0 +1,45 @@
+"""Add image_job table for background image processing
+
+Revision ID: d5e6f7a8b9c0
+Revises: c4d5e6f7a8b9
+Create Date: 2026-10-19 00:00:01.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e6f7a8b9c0'
+down_revision = 'c4d5e6f7a8b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'image_job' in insp.get_table_names():
+        return
+    op.create_table(
+        'image_job',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('target', sa.String(length=20), nullable=False),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('slot', sa.String(length=20), nullable=True),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('staging_path', sa.String(length=1000), nullable=False),
+        sa.Column('result_url', sa.String(length=1000), nullable=True),
+        sa.Column('derivatives', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_image_job_status', 'image_job', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_image_job_status', table_name='image_job')
+    op.drop_table('image_job')
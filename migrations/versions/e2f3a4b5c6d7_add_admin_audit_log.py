@@ -0,0 +1,38 @@
+"""Add admin_audit_log for bulk admin operations
+
+Revision ID: e2f3a4b5c6d7
+Revises: d1e2f3a4b5c6
+Create Date: 2026-10-19 00:00:08.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2f3a4b5c6d7'
+down_revision = 'd1e2f3a4b5c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'admin_audit_log' not in insp.get_table_names():
+        op.create_table(
+            'admin_audit_log',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('actor', sa.String(length=120), nullable=True),
+            sa.Column('action', sa.String(length=40), nullable=False),
+            sa.Column('target', sa.String(length=40), nullable=False),
+            sa.Column('affected', sa.Integer(), nullable=True),
+            sa.Column('detail', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_admin_audit_log_created_at', 'admin_audit_log', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_admin_audit_log_created_at', table_name='admin_audit_log')
+    op.drop_table('admin_audit_log')
@@ -0,0 +1,38 @@
+"""Add composite indexes for the admin order list
+
+Revision ID: e6f7a8b9c0d1
+Revises: d5e6f7a8b9c0
+Create Date: 2026-10-19 00:00:02.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f7a8b9c0d1'
+down_revision = 'd5e6f7a8b9c0'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_order_created_at_id', ['created_at', 'id']),
+    ('ix_order_status_created_at', ['status', 'created_at']),
+    ('ix_order_paid_created_at', ['paid', 'created_at']),
+    ('ix_order_payment_method_created_at', ['payment_method', 'created_at']),
+    ('ix_order_email', ['email']),
+)
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    existing = {ix['name'] for ix in insp.get_indexes('order')}
+    for name, columns in INDEXES:
+        if name not in existing:
+            op.create_index(name, 'order', columns, unique=False)
+
+
+def downgrade():
+    for name, _columns in reversed(INDEXES):
+        op.drop_index(name, table_name='order')
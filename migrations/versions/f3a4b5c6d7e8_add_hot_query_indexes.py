@@ -0,0 +1,59 @@
+"""Add indexes for hot foreign-key lookups and storefront filters
+
+Revision ID: f3a4b5c6d7e8
+Revises: e2f3a4b5c6d7
+Create Date: 2026-10-19 00:00:09.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a4b5c6d7e8'
+down_revision = 'e2f3a4b5c6d7'
+branch_labels = None
+depends_on = None
+
+# order_item(order_id) is already covered by ix_order_item_order_id (f7a8b9c0d1e2)
+# and user(email) by its unique constraint.
+INDEXES = (
+    ('order', 'ix_order_user_id_created_at', ['user_id', 'created_at']),
+    ('order_log', 'ix_order_log_order_id_created_at', ['order_id', 'created_at']),
+    ('product', 'ix_product_featured_created_at', ['featured', 'created_at']),
+    ('product', 'ix_product_created_at_id', ['created_at', 'id']),
+    ('failed_email', 'ix_failed_email_attempts_last_attempt_at', ['attempts', 'last_attempt_at']),
+)
+
+
+def _indexes(insp, table):
+    return {ix['name']: ix for ix in insp.get_indexes(table)}
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    tables = set(insp.get_table_names())
+    for table, name, columns in INDEXES:
+        if table in tables and name not in _indexes(insp, table):
+            op.create_index(name, table, columns, unique=False)
+
+    # One wallet per user (User.wallet is uselist=False): make ix_wallet_user_id unique
+    if 'wallet' in tables:
+        existing = _indexes(insp, 'wallet').get('ix_wallet_user_id')
+        if not (existing and existing.get('unique')):
+            duplicates = conn.execute(sa.text(
+                'SELECT user_id FROM wallet GROUP BY user_id HAVING COUNT(*) > 1 LIMIT 5')).scalars().all()
+            if duplicates:
+                raise RuntimeError(f"Users with more than one wallet row (e.g. user_id {duplicates}); "
+                                   "merge them before running this migration")
+            if existing:
+                op.drop_index('ix_wallet_user_id', table_name='wallet')
+            op.create_index('ix_wallet_user_id', 'wallet', ['user_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_wallet_user_id', table_name='wallet')
+    op.create_index('ix_wallet_user_id', 'wallet', ['user_id'], unique=False)
+    for table, name, _columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
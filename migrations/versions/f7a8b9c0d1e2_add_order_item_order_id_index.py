@@ -0,0 +1,28 @@
+"""Index order_item.order_id for order detail and export joins
+
+Revision ID: f7a8b9c0d1e2
+Revises: e6f7a8b9c0d1
+Create Date: 2026-10-19 00:00:03.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7a8b9c0d1e2'
+down_revision = 'e6f7a8b9c0d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    existing = {ix['name'] for ix in insp.get_indexes('order_item')}
+    if 'ix_order_item_order_id' not in existing:
+        op.create_index('ix_order_item_order_id', 'order_item', ['order_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_order_item_order_id', table_name='order_item')
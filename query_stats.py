@@ -0,0 +1,234 @@
+"""Per-request SQL statistics and N+1 detection.
+
+`instrument(engine)` adds ``before_cursor_execute``/``after_cursor_execute``
+listeners that time every statement and hand it to whichever `QueryStats`
+trackers are active in the current context (see `track`). The app starts a
+tracker per request, so a request ends up knowing how many queries it ran,
+how long they took in total and which statements it repeated. A statement
+*fingerprint* has its literals and bound parameters replaced with ``?`` and
+its ``IN (...)`` lists collapsed, so ``SELECT ... WHERE product.id = ?`` run
+once per cart line counts as one statement repeated N times: the signature of
+an N+1 query.
+
+Trackers nest: a test wrapping a test-client call in `assert_max_queries` sees
+the queries of the request the app tracks inside it. With no tracker active
+the listeners return after one context-variable lookup.
+
+`QueryReport` keeps rolling per-endpoint aggregates and the worst repeated
+statements for the admin performance page.
+"""
+import re
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+_active = contextvars.ContextVar('query_stats_active', default=())
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PARAM = re.compile(r'%\(\w+\)s|%s|\$\d+|\?')
+_PARAM_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Return `statement` with literals and parameters replaced by ``?`` and whitespace collapsed."""
+    text = _STRING_LITERAL.sub('?', statement)
+    text = _PARAM.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _PARAM_LIST.sub('(?...)', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+class QueryStats:
+    """Query count, total DB time and per-fingerprint counts for one unit of work."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = {}  # fingerprint -> [count, seconds]
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        key = fingerprint(statement)
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def repeated(self, threshold: int = 5) -> list:
+        """Fingerprints executed at least `threshold` times, most repeated first."""
+        rows = []
+        for statement, (count, seconds) in self.statements.items():
+            if count >= threshold:
+                rows.append({'statement': statement, 'count': count,
+                             'ms': round(seconds * 1000, 3)})
+        rows.sort(key=lambda r: (-r['count'], -r['ms']))
+        return rows
+
+    def summary(self, threshold: int = 5) -> dict:
+        return {'queries': self.count, 'db_ms': round(self.seconds * 1000, 3),
+                'distinct': len(self.statements), 'repeated': self.repeated(threshold)}
+
+    def describe(self, threshold: int = 2) -> str:
+        lines = [f'{self.count} queries in {self.seconds * 1000:.1f}ms']
+        for row in self.repeated(threshold):
+            lines.append(f"  {row['count']}x {row['statement'][:300]}")
+        return '\n'.join(lines)
+
+
+def start() -> tuple:
+    """Begin tracking in the current context; returns (stats, token) for `stop`."""
+    stats = QueryStats()
+    token = _active.set(_active.get() + (stats,))
+    return stats, token
+
+
+def stop(token):
+    try:
+        _active.reset(token)
+    except ValueError:
+        # Token from another context (e.g. teardown after a context copy); just drop the tracker
+        _active.set(_active.get()[:-1])
+
+
+def current():
+    """The innermost active `QueryStats`, or None."""
+    active = _active.get()
+    return active[-1] if active else None
+
+
+@contextmanager
+def track():
+    """Collect the queries run inside the block: ``with track() as stats: ...``."""
+    stats, token = start()
+    try:
+        yield stats
+    finally:
+        stop(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int, max_repeats: int = None):
+    """Fail if the block runs more than `limit` queries, or any statement more than `max_repeats` times.
+
+        with query_stats.assert_max_queries(6, max_repeats=1):
+            client.get('/cart')
+    """
+    with track() as stats:
+        yield stats
+    problems = []
+    if stats.count > limit:
+        problems.append(f'expected at most {limit} queries')
+    if max_repeats is not None and stats.repeated(max_repeats + 1):
+        problems.append(f'expected no statement repeated more than {max_repeats} times')
+    if problems:
+        raise AssertionError('; '.join(problems) + ', got ' + stats.describe())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get() and context is not None:
+        context._query_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    active = _active.get()
+    started = getattr(context, '_query_stats_started', None)
+    if not active or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for stats in active:
+        stats.add(statement, elapsed)
+
+
+def instrument(engine):
+    """Time every statement `engine` runs for the active trackers. Idempotent."""
+    from sqlalchemy import event
+    if not event.contains(engine, 'after_cursor_execute', _after_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    return engine
+
+
+class QueryReport:
+    """Rolling per-endpoint query aggregates, recent requests and repeated statements.
+
+    Thread-safe; one instance per process. Endpoints are capped at
+    `max_endpoints` and suspects, keyed by (endpoint, fingerprint), at
+    `max_suspects`; both drop the least recently seen.
+    """
+
+    def __init__(self, recent: int = 200, max_suspects: int = 200, max_endpoints: int = 500):
+        self._lock = threading.Lock()
+        self._recent_size = recent
+        self.max_suspects = max_suspects
+        self.max_endpoints = max_endpoints
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.since = time.time()
+            self.endpoints = {}
+            self.suspects = {}
+            self.recent = deque(maxlen=self._recent_size)
+
+    def record(self, endpoint: str, path: str, status: int, stats: QueryStats, threshold: int = 5) -> list:
+        """Fold one request into the report; returns its repeated statements."""
+        repeated = stats.repeated(threshold)
+        ms = stats.seconds * 1000
+        now = time.time()
+        with self._lock:
+            agg = self.endpoints.pop(endpoint, None) or {'endpoint': endpoint, 'requests': 0, 'queries': 0,
+                                                          'max_queries': 0, 'db_ms': 0.0, 'max_db_ms': 0.0,
+                                                          'n_plus_one_requests': 0}
+            self.endpoints[endpoint] = agg
+            while len(self.endpoints) > self.max_endpoints:
+                self.endpoints.pop(next(iter(self.endpoints)))
+            agg['requests'] += 1
+            agg['queries'] += stats.count
+            agg['max_queries'] = max(agg['max_queries'], stats.count)
+            agg['db_ms'] += ms
+            agg['max_db_ms'] = max(agg['max_db_ms'], ms)
+            if repeated:
+                agg['n_plus_one_requests'] += 1
+            for row in repeated:
+                key = (endpoint, row['statement'])
+                suspect = self.suspects.pop(key, None) or {'endpoint': endpoint, 'statement': row['statement'],
+                                                           'requests': 0, 'max_count': 0}
+                suspect['requests'] += 1
+                suspect['max_count'] = max(suspect['max_count'], row['count'])
+                suspect['last_path'] = path
+                suspect['last_seen'] = now
+                # Re-inserted so the dict stays in least-recently-seen order
+                self.suspects[key] = suspect
+                while len(self.suspects) > self.max_suspects:
+                    self.suspects.pop(next(iter(self.suspects)))
+            self.recent.append({'endpoint': endpoint, 'path': path, 'status': status, 'queries': stats.count,
+                                'db_ms': round(ms, 3), 'repeated': len(repeated), 'at': now})
+        return repeated
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = []
+            for agg in self.endpoints.values():
+                row = dict(agg)
+                row['avg_queries'] = round(agg['queries'] / agg['requests'], 2)
+                row['avg_db_ms'] = round(agg['db_ms'] / agg['requests'], 3)
+                row['db_ms'] = round(agg['db_ms'], 3)
+                row['max_db_ms'] = round(agg['max_db_ms'], 3)
+                endpoints.append(row)
+            suspects = sorted(self.suspects.values(), key=lambda s: (-s['requests'], -s['max_count']))
+            recent = list(self.recent)[::-1]
+            since = self.since
+        endpoints.sort(key=lambda r: -r['db_ms'])
+        return {'since': since, 'endpoints': endpoints, 'n_plus_one': [dict(s) for s in suspects],
+                'recent': recent}
+
+
+report = QueryReport()
@@ -0,0 +1,136 @@
+"""On-demand profiling of single production requests.
+
+A request opts in with a token (see `requested_token`); the app then runs it
+under ``cProfile`` and stores a call tree of where the time went in a
+`ProfileBuffer`, a fixed-size ring that keeps the most recent profiles in
+memory. Requests that do not opt in pay for a token lookup in the
+environment (plus a header lookup when a token is configured).
+
+The tree is rebuilt from cProfile's caller table: a child's time is the time
+spent in it *when called from that parent*, so shared helpers (e.g. SQLAlchemy
+execute) show up under each caller with their own share. Branches under
+`min_fraction` of the request's time are folded into their parent.
+"""
+import os
+import time
+import uuid
+import threading
+from collections import deque
+
+HEADER = 'X-Profile-Token'
+QUERY_ARG = '__profile'
+
+
+def requested_token(request):
+    """The profiling token a request carries (header or query arg), or None."""
+    return request.headers.get(HEADER) or request.args.get(QUERY_ARG)
+
+
+def profiled_path(request) -> str:
+    """The request path and query string, without the profiling token."""
+    from urllib.parse import urlencode
+    args = [(k, v) for k, v in request.args.items(multi=True) if k != QUERY_ARG]
+    return f"{request.path}?{urlencode(args)}" if args else request.path
+
+
+def _label(func) -> str:
+    filename, line, name = func
+    if filename == '~':
+        return name  # builtins, e.g. <method 'execute' of 'sqlite3.Cursor' objects>
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+
+def call_tree(profile, min_fraction: float = 0.01, max_depth: int = 40) -> dict:
+    """Build {'total_ms', 'tree', 'top'} from a finished `cProfile.Profile`.
+
+    `tree` is a nested list of {'function', 'calls', 'cum_ms', 'own_ms', 'children'};
+    `top` lists the 25 functions with the most time of their own.
+    """
+    import pstats
+    stats = pstats.Stats(profile).stats  # func -> (cc, nc, tt, ct, callers)
+    children = {}
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, (_pcc, pnc, _ptt, pct) in callers.items():
+            children.setdefault(caller, []).append((func, pnc, pct))
+    roots = [f for f, (_cc, _nc, _tt, _ct, callers) in stats.items() if not callers]
+    total = sum(stats[f][3] for f in roots) or max((s[3] for s in stats.values()), default=0.0)
+    threshold = total * min_fraction
+
+    def build(func, calls, cum, path, depth):
+        own = stats[func][2] if calls == stats[func][1] else stats[func][2] * calls / max(stats[func][1], 1)
+        node = {'function': _label(func), 'calls': calls, 'cum_ms': round(cum * 1000, 3),
+                'own_ms': round(own * 1000, 3), 'children': []}
+        if depth < max_depth:
+            for child, child_calls, child_cum in sorted(children.get(func, ()), key=lambda c: -c[2]):
+                if child_cum < threshold or child in path:
+                    continue
+                node['children'].append(build(child, child_calls, child_cum, path | {child}, depth + 1))
+        return node
+
+    tree = [build(f, stats[f][1], stats[f][3], {f}, 0)
+            for f in sorted(roots, key=lambda f: -stats[f][3]) if stats[f][3] >= threshold]
+    top = sorted(stats.items(), key=lambda item: -item[1][2])[:25]
+    return {
+        'total_ms': round(total * 1000, 3),
+        'tree': tree,
+        'top': [{'function': _label(f), 'calls': s[1], 'own_ms': round(s[2] * 1000, 3),
+                 'cum_ms': round(s[3] * 1000, 3)} for f, s in top],
+    }
+
+
+def format_tree(tree, indent: int = 0) -> str:
+    """Render `call_tree()['tree']` as indented text, one function per line."""
+    lines = []
+    for node in tree:
+        lines.append(f"{'  ' * indent}{node['cum_ms']:9.1f}ms {node['own_ms']:8.1f}ms own "
+                     f"{node['calls']:>6}x  {node['function']}")
+        if node['children']:
+            lines.append(format_tree(node['children'], indent + 1))
+    return '\n'.join(lines)
+
+
+class ProfileBuffer:
+    """The last `size` request profiles, newest first. Thread-safe."""
+
+    def __init__(self, size: int = 20):
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> dict:
+        with self._lock:
+            self._items.appendleft(entry)
+        return entry
+
+    def get(self, profile_id: str):
+        with self._lock:
+            return next((p for p in self._items if p['id'] == profile_id), None)
+
+    def list(self) -> list:
+        with self._lock:
+            return [{k: v for k, v in p.items() if k not in ('tree', 'top')} for p in self._items]
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RequestProfile:
+    """cProfile running for one request; `finish()` turns it into a buffer entry."""
+
+    def __init__(self):
+        import cProfile  # only profiled requests pay for cProfile/pstats
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+
+    def finish(self, method: str, path: str, endpoint: str, status: int, min_fraction: float = 0.01) -> dict:
+        self.stop()
+        wall = time.perf_counter() - self.started
+        entry = call_tree(self.profile, min_fraction=min_fraction)
+        entry.update(id=uuid.uuid4().hex[:12], at=time.time(), method=method, path=path, endpoint=endpoint,
+                     status=status, wall_ms=round(wall * 1000, 3))
+        self.profile = None
+        return entry
@@ -0,0 +1,93 @@
+"""Benchmark the NumPy sales analytics on synthetic orders.
+
+    python scripts/bench_analytics.py              # 1,000,000 orders
+    python scripts/bench_analytics.py --rows 200000 --skip-python
+
+Times the column load (row tuples -> arrays, as `load_order_columns` does), each
+vectorized report, and a plain per-row Python loop for daily totals and cohorts
+for comparison. No database is needed.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np  # noqa: E402
+import analytics  # noqa: E402
+
+
+def timed(label, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"{label:<34} {time.perf_counter() - t0:8.3f}s")
+    return result
+
+
+def as_rows(cols, batch_size):
+    """Turn synthetic arrays into row batches shaped like `load_order_columns` fetches them."""
+    seconds = cols.created.astype(np.int64).astype(np.float64).tolist()
+    customers = cols.customer.tolist()
+    totals, discounts, subtotals = cols.total.tolist(), cols.discount.tolist(), cols.subtotal.tolist()
+    batches = []
+    for i in range(0, len(cols), batch_size):
+        batches.append([
+            (seconds[j], f"customer{customers[j]}@example.com", totals[j], discounts[j], subtotals[j])
+            for j in range(i, min(i + batch_size, len(cols)))
+        ])
+    return batches
+
+
+def python_daily(rows):
+    totals = {}
+    for batch in rows:
+        for created, _email, total, _discount, _subtotal in batch:
+            day = int(created // 86400)
+            count, revenue = totals.get(day, (0, 0.0))
+            totals[day] = (count + 1, revenue + total)
+    return totals
+
+
+def python_cohorts(rows, periods=12):
+    first, active = {}, set()
+    ordered = sorted((r for batch in rows for r in batch), key=lambda r: r[0])
+    for created, email, *_ in ordered:
+        when = datetime.fromtimestamp(created, timezone.utc)
+        month = when.year * 12 + when.month - 1
+        cohort = first.setdefault(email, month)
+        if month - cohort < periods:
+            active.add((email, month - cohort))
+    matrix = {}
+    for email, offset in active:
+        key = (first[email], offset)
+        matrix[key] = matrix.get(key, 0) + 1
+    return matrix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--batch-size', type=int, default=analytics.DEFAULT_BATCH_SIZE)
+    parser.add_argument('--skip-python', action='store_true', help='Skip the per-row Python baseline.')
+    args = parser.parse_args(argv)
+
+    print(f"{args.rows:,} synthetic orders over {args.days} days")
+    synthetic = timed('generate', analytics.synthetic_orders, args.rows, days=args.days)
+    rows = timed('build DB-like row tuples', as_rows, synthetic, args.batch_size)
+    cols = timed('OrderColumns.from_batches', analytics.OrderColumns.from_batches, rows)
+    timed('daily_totals', analytics.daily_totals, cols)
+    timed('weekly_totals', analytics.weekly_totals, cols)
+    timed('cohort_retention (month, 12)', analytics.cohort_retention, cols)
+    timed('cohort_retention (week, 26)', analytics.cohort_retention, cols, period='week', periods=26)
+    timed('discount_impact', analytics.discount_impact, cols)
+    if not args.skip_python:
+        timed('python loop: daily totals', python_daily, rows)
+        timed('python loop: cohorts', python_cohorts, rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Measure the cold start of the storefront entry point (api/index.py).
+
+    python scripts/bench_cold_start.py              # 5 fresh interpreters, median wall time
+    python scripts/bench_cold_start.py --top 25     # plus the slowest imports from -X importtime
+
+Each run starts a new interpreter, as a Vercel cold start does, and times
+loading api/index.py (which imports app.py). `--top` re-runs once under
+``python -X importtime`` and lists the modules with the largest cumulative
+import time, so a new eager import shows up by name.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Printed by the child: wall milliseconds to load the entry point, then the heavy
+# optional modules that ended up imported.
+CHILD = """
+import sys, time, runpy
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+runpy.run_path({entry!r})
+print('COLD_START_MS', (time.perf_counter() - started) * 1000)
+print('LOADED', ' '.join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+# Modules that should only be imported by the requests that need them
+LAZY_MODULES = ('requests', 'smtplib', 'flask_migrate', 'alembic', 'redis', 'rq', 'boto3', 'numpy', 'cProfile')
+
+
+def _env(extra=None):
+    env = dict(os.environ)
+    # Keep the child quiet and away from the developer's real configuration
+    env.setdefault('LOG_REQUESTS', '0')
+    env.update(extra or {})
+    return env
+
+
+def measure(entry=None, env=None) -> dict:
+    """Load `entry` in a fresh interpreter; returns {'ms': wall ms, 'loaded': [lazy modules imported]}."""
+    entry = entry or os.path.join(ROOT, 'api', 'index.py')
+    code = CHILD.format(root=ROOT, entry=entry, lazy=LAZY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=_env(env), check=True,
+                         capture_output=True, text=True).stdout
+    result = {'ms': None, 'loaded': []}
+    for line in out.splitlines():
+        if line.startswith('COLD_START_MS '):
+            result['ms'] = float(line.split()[1])
+        elif line.startswith('LOADED'):
+            result['loaded'] = line.split()[1:]
+    return result
+
+
+def slowest_imports(top: int = 20, entry=None) -> list:
+    """(cumulative ms, module) for the `top` slowest imports under -X importtime."""
+    entry = entry or os.path.join(ROOT, 'api', 'index.py')
+    code = f'import sys, runpy; sys.path.insert(0, {ROOT!r}); runpy.run_path({entry!r})'
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=_env(),
+                         check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative) / 1000, module.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='also list the N slowest imports')
+    args = parser.parse_args(argv)
+
+    results = [measure() for _ in range(args.runs)]
+    times = sorted(r['ms'] for r in results)
+    print(f"api/index.py cold start over {args.runs} runs: median {statistics.median(times):.0f}ms, "
+          f"min {times[0]:.0f}ms, max {times[-1]:.0f}ms")
+    print('lazy modules imported at startup:', ', '.join(results[-1]['loaded']) or 'none')
+    if args.top:
+        print(f'\nslowest imports (cumulative):')
+        for ms, module in slowest_imports(args.top):
+            print(f'{ms:8.1f}ms  {module}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
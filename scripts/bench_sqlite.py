@@ -0,0 +1,133 @@
+"""Benchmark concurrent SQLite reads and writes with and without the production settings.
+
+    python scripts/bench_sqlite.py                      # 8 readers, 4 writers, 5s per mode
+    python scripts/bench_sqlite.py --readers 16 --writers 8 --seconds 10
+
+Runs the same mixed workload (writers insert an order row and bump a daily
+counter in one transaction; readers aggregate recent orders) against a fresh
+temporary database file in three modes:
+
+- default: SQLite's rollback journal, as the app ran before `configure_sqlite`
+- tuned: WAL and the other pragmas from `db_pool.sqlite_pragmas`
+- serialized: tuned plus the in-process write lock (SQLITE_SERIALIZE_WRITES=1)
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+import db_pool  # noqa: E402
+
+SCHEMA = (
+    'CREATE TABLE orders (id INTEGER PRIMARY KEY, email TEXT, total NUMERIC, created_at REAL)',
+    'CREATE INDEX ix_orders_created_at ON orders (created_at)',
+    'CREATE TABLE daily (day INTEGER PRIMARY KEY, orders INTEGER NOT NULL, revenue NUMERIC NOT NULL)',
+)
+
+
+def make_engine(path, mode, threads):
+    engine = create_engine(f'sqlite:///{path}', pool_size=threads, max_overflow=0)
+    env = {'SQLITE_TUNING': '0' if mode == 'default' else '1'}
+    lock = db_pool.configure_sqlite(engine, env, serialize_writes=(mode == 'serialized'))
+    return engine, lock
+
+
+def run(mode, readers, writers, seconds, seed_rows):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine, lock = make_engine(path, mode, readers + writers)
+    with engine.begin() as conn:
+        for stmt in SCHEMA:
+            conn.execute(text(stmt))
+        now = time.time()
+        conn.execute(text('INSERT INTO orders (email, total, created_at) VALUES (:e, :t, :c)'),
+                     [{'e': f'c{i}@example.com', 't': 10 + i % 90, 'c': now - i} for i in range(seed_rows)])
+
+    stop = time.monotonic() + seconds
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    write_latency = []
+    guard = threading.Lock()
+
+    def writer(n):
+        rng = random.Random(n)
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    total = rng.randint(10, 500)
+                    conn.execute(text('INSERT INTO orders (email, total, created_at) VALUES (:e, :t, :c)'),
+                                 {'e': f'w{n}@example.com', 't': total, 'c': time.time()})
+                    updated = conn.execute(text('UPDATE daily SET orders = orders + 1, revenue = revenue + :t '
+                                                'WHERE day = :d'), {'t': total, 'd': 1}).rowcount
+                    if not updated:
+                        conn.execute(text('INSERT OR IGNORE INTO daily (day, orders, revenue) VALUES (1, 1, :t)'),
+                                     {'t': total})
+            except OperationalError:
+                with guard:
+                    counts['errors'] += 1
+                continue
+            with guard:
+                counts['writes'] += 1
+                write_latency.append(time.perf_counter() - started)
+
+    def reader(n):
+        while time.monotonic() < stop:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT count(*), sum(total) FROM orders WHERE created_at > :c'),
+                                 {'c': time.time() - 3600}).one()
+                    conn.execute(text('SELECT orders, revenue FROM daily WHERE day = 1')).first()
+            except OperationalError:
+                with guard:
+                    counts['errors'] += 1
+                continue
+            with guard:
+                counts['reads'] += 1
+
+    threads = ([threading.Thread(target=writer, args=(i,)) for i in range(writers)] +
+               [threading.Thread(target=reader, args=(i,)) for i in range(readers)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+    write_latency.sort()
+    p95 = write_latency[int(len(write_latency) * 0.95)] * 1000 if write_latency else 0.0
+    worst = write_latency[-1] * 1000 if write_latency else 0.0
+    print(f"{mode:<11} {counts['reads'] / seconds:>9.0f} {counts['writes'] / seconds:>9.0f} "
+          f"{counts['errors']:>7} {p95:>10.1f} {worst:>10.1f}")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--seed-rows', type=int, default=20000)
+    parser.add_argument('--modes', default='default,tuned,serialized')
+    args = parser.parse_args(argv)
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per mode, "
+          f"{args.seed_rows:,} seed rows")
+    print(f"{'mode':<11} {'reads/s':>9} {'writes/s':>9} {'errors':>7} {'p95 write':>10} {'max write':>10}")
+    for mode in args.modes.split(','):
+        run(mode.strip(), args.readers, args.writers, args.seconds, args.seed_rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,8 @@ from io import BytesIO
 import importlib
 
 sys.path.insert(0, os.getcwd())
-from app import app, db, AdminUser
+from app import app, db, AdminUser, error_log
+from error_buffer import format_groups
 from sqlalchemy.orm import Session
 
 # Simple setup to run the admin settings test simulation
@@ -43,22 +44,19 @@ if __name__ == '__main__':
     # Patch the Session.flush method used by SQLAlchemy sessions created per request
     Session.flush = fake_flush
 
-    import tempfile
-    from pathlib import Path
-    last_err_path = str(Path(tempfile.gettempdir()) / 'last_error.txt')
-    if os.path.exists(last_err_path):
-        os.unlink(last_err_path)
+    error_log.clear()
 
     fp = BytesIO(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR')
     fp.name = 'tiny.png'
     resp2 = client.post('/admin/settings', data={'primary_color': '#ffffff', 'logo_file': (fp, 'tiny.png')}, content_type='multipart/form-data', follow_redirects=True)
     print('settings post status:', resp2.status_code)
 
-    if os.path.exists(last_err_path):
-        print('last_error file exists; content:')
-        print(open(last_err_path, 'r', encoding='utf-8').read())
+    groups = error_log.grouped()
+    if groups:
+        print('recorded errors (as listed on /__last_error):')
+        print(format_groups(groups))
     else:
-        print('last_error file not found')
+        print('no error recorded')
 
     # restore original flush
     Session.flush = orig_flush
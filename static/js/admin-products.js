@@ -0,0 +1,29 @@
+// "Load more" for the admin product dashboard.
+// The button carries the JSON endpoint (data-url) and the last product id shown (data-after);
+// each click appends the server-rendered rows for the next page.
+document.addEventListener('DOMContentLoaded', function(){
+  const button = document.getElementById('admin-products-more');
+  const container = document.getElementById('admin-products');
+  if (!button || !container) return;
+
+  button.addEventListener('click', async function() {
+    const url = new URL(button.getAttribute('data-url'), window.location.origin);
+    url.searchParams.set('after', button.getAttribute('data-after'));
+    button.disabled = true;
+    try {
+      const resp = await fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } });
+      if (!resp.ok) throw new Error('HTTP ' + resp.status);
+      const page = await resp.json();
+      container.insertAdjacentHTML('beforeend', page.html || '');
+      if (page.next_cursor) {
+        button.setAttribute('data-after', page.next_cursor);
+        button.disabled = false;
+      } else {
+        button.parentElement.remove();
+      }
+    } catch (e) {
+      button.disabled = false;
+      button.textContent = 'Could not load more products — try again';
+    }
+  });
+});
@@ -0,0 +1,69 @@
+// Direct-to-bucket admin uploads.
+// When the form carries data-presign-url, files picked in inputs marked data-direct-upload
+// are sent straight to object storage; the form then submits only a signed token
+// (<input name>_direct_token) instead of the file. Any failure falls back to the normal upload.
+document.addEventListener('DOMContentLoaded', function(){
+  document.querySelectorAll('form[data-presign-url]').forEach(form => {
+    const presignUrl = form.getAttribute('data-presign-url');
+    const submitButtons = form.querySelectorAll('button[type="submit"], input[type="submit"]');
+    let pending = 0;
+
+    function setBusy(delta) {
+      pending += delta;
+      submitButtons.forEach(btn => { btn.disabled = pending > 0; });
+    }
+
+    function tokenInput(fileInput) {
+      const name = fileInput.name + '_direct_token';
+      let hidden = form.querySelector('input[type="hidden"][name="' + name + '"]');
+      if (!hidden) {
+        hidden = document.createElement('input');
+        hidden.type = 'hidden';
+        hidden.name = name;
+        form.appendChild(hidden);
+      }
+      return hidden;
+    }
+
+    async function sendToBucket(signed, file) {
+      if (signed.method === 'PUT') {
+        return fetch(signed.url, { method: 'PUT', headers: signed.headers || {}, body: file });
+      }
+      const body = new FormData();
+      Object.entries(signed.fields || {}).forEach(([k, v]) => body.append(k, v));
+      body.append('file', file);
+      return fetch(signed.url, { method: 'POST', body: body });
+    }
+
+    form.querySelectorAll('input[type="file"][data-direct-upload]').forEach(fileInput => {
+      fileInput.addEventListener('change', async function() {
+        const file = this.files && this.files[0];
+        const hidden = tokenInput(this);
+        hidden.value = '';
+        if (!file) return;
+        const label = this.parentElement.querySelector('.file-input-label');
+        setBusy(1);
+        try {
+          const presign = await fetch(presignUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, content_type: file.type, size: file.size })
+          });
+          if (!presign.ok) return;
+          const signed = await presign.json();
+          const uploaded = await sendToBucket(signed, file);
+          if (!uploaded.ok) return;
+          hidden.value = signed.token;
+          // The file is already stored; do not send it through the app again
+          this.value = '';
+          if (label) label.textContent = '✓ ' + file.name + ' uploaded';
+        } catch (e) {
+          hidden.value = '';
+        } finally {
+          setBusy(-1);
+        }
+      });
+    });
+  });
+});
@@ -0,0 +1,39 @@
+// Poll background image jobs queued by the last admin upload and report when they finish.
+document.addEventListener('DOMContentLoaded', function(){
+  document.querySelectorAll('.image-jobs[data-status-url]').forEach(box => {
+    const urlTemplate = box.getAttribute('data-status-url');
+
+    box.querySelectorAll('.image-job[data-job-id]').forEach(line => {
+      const url = urlTemplate.replace('JOB_ID', encodeURIComponent(line.getAttribute('data-job-id')));
+      let delay = 1000;
+
+      async function poll() {
+        try {
+          const resp = await fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } });
+          const job = await resp.json();
+          if (job.job_status === 'done') {
+            line.textContent = '✓ Image processed. ';
+            if (job.url) {
+              const link = document.createElement('a');
+              link.href = job.url;
+              link.textContent = 'View';
+              link.target = '_blank';
+              line.appendChild(link);
+            }
+            return;
+          }
+          if (job.job_status === 'failed' || !resp.ok) {
+            line.textContent = '✗ Image processing failed: ' + (job.error || job.message || 'unknown error');
+            return;
+          }
+        } catch (e) {
+          // Network hiccup: keep polling
+        }
+        delay = Math.min(delay * 1.5, 5000);
+        setTimeout(poll, delay);
+      }
+
+      poll();
+    });
+  });
+});
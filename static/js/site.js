@@ -0,0 +1,141 @@
+// Mobile Navigation Toggle
+document.addEventListener('DOMContentLoaded', function(){
+  const mobileToggle = document.getElementById('mobile-menu-toggle');
+  const navPanel = document.getElementById('main-nav-panel');
+  
+  if (mobileToggle && navPanel) {
+    // Toggle nav panel on button click
+    mobileToggle.addEventListener('click', (e) => {
+      e.stopPropagation();
+      const isOpen = navPanel.classList.toggle('open');
+      mobileToggle.setAttribute('aria-expanded', isOpen ? 'true' : 'false');
+    });
+    
+    // Close nav when clicking a link inside it
+    navPanel.querySelectorAll('a').forEach(link => {
+      link.addEventListener('click', () => {
+        navPanel.classList.remove('open');
+        mobileToggle.setAttribute('aria-expanded', 'false');
+      });
+    });
+    
+    // Close nav when clicking outside of it
+    document.addEventListener('click', (e) => {
+      if (!navPanel.contains(e.target) && !mobileToggle.contains(e.target)) {
+        navPanel.classList.remove('open');
+        mobileToggle.setAttribute('aria-expanded', 'false');
+      }
+    });
+    
+    // Close nav on Escape key
+    document.addEventListener('keydown', (e) => {
+      if (e.key === 'Escape' && navPanel.classList.contains('open')) {
+        navPanel.classList.remove('open');
+        mobileToggle.setAttribute('aria-expanded', 'false');
+      }
+    });
+  }
+});
+
+// Simple autoslider for ads (rotates images)
+document.addEventListener('DOMContentLoaded', function(){
+  // Ads slider
+  const ads = document.querySelectorAll('.ads-slider .slide');
+  let adIndex = 0;
+  if (ads.length > 0) {
+    setInterval(() => {
+      ads[adIndex].classList.remove('active');
+      adIndex = (adIndex + 1) % ads.length;
+      ads[adIndex].classList.add('active');
+    }, 4000);
+  }
+
+  // Featured product slider controls
+  const prevBtn = document.querySelector('.featured-prev');
+  const nextBtn = document.querySelector('.featured-next');
+  const track = document.querySelector('.featured-track');
+  if (prevBtn && nextBtn && track) {
+    const cardWidth = track.querySelector('.card').offsetWidth + 16;
+    prevBtn.addEventListener('click', () => { track.scrollBy({ left: -cardWidth, behavior: 'smooth' }); });
+    nextBtn.addEventListener('click', () => { track.scrollBy({ left: cardWidth, behavior: 'smooth' }); });
+  }
+});
+
+  // Cart count population: fetch /cart and parse quantities from the cart table
+  document.addEventListener('DOMContentLoaded', function(){
+    const cartCountEl = document.querySelector('.cart-count');
+    function setCartCount(n){
+      if (!cartCountEl) return;
+      if (!n || Number(n) === 0) {
+        cartCountEl.textContent = '';
+        cartCountEl.style.display = 'none';
+        return;
+      }
+      cartCountEl.textContent = String(n);
+      cartCountEl.style.display = 'inline-block';
+    }
+
+    async function fetchCartCount(){
+        try {
+          // Prefer the compact JSON endpoint, fallback to scraping /cart
+          const resJson = await fetch('/api/cart-count', { credentials: 'same-origin' });
+          if (resJson && resJson.ok) {
+            const data = await resJson.json();
+            if (data && typeof data.count !== 'undefined') {
+              return setCartCount(Number(data.count) || 0);
+            }
+          }
+          const res = await fetch('/cart', { credentials: 'same-origin' });
+          if (!res.ok) return setCartCount(0);
+          const text = await res.text();
+          const parser = new DOMParser();
+          const doc = parser.parseFromString(text, 'text/html');
+        // Try to find the cart table and qty inputs
+        let count = 0;
+        const qtyInputs = doc.querySelectorAll('input[name^="qty_"]');
+        if (qtyInputs && qtyInputs.length) {
+          qtyInputs.forEach(i => { try { count += Number(i.value || 0); } catch(e){} });
+        } else {
+          // Try to detect rows in cart-table
+          const rows = doc.querySelectorAll('.cart-table tbody tr');
+          if (rows && rows.length) {
+            rows.forEach(r => {
+              const input = r.querySelector('input[type="number"]');
+              if (input) { try { count += Number(input.value || 0); } catch(e){} }
+            });
+            // if still zero, fallback to number of rows
+            if (count === 0) count = rows.length;
+          } else {
+            // If cart page shows "Your cart is empty." then 0
+            if (text.includes('Your cart is empty')) count = 0;
+          }
+        }
+        setCartCount(count || 0);
+      } catch (err) {
+        // on error don't fail silently; hide count
+        setCartCount(0);
+      }
+    }
+
+    // Update count on load and periodically (in case of client-side changes)
+    fetchCartCount();
+    // Also listen for clicks on add-to-cart buttons to provide instant feedback (best-effort)
+    document.body.addEventListener('submit', function(e){
+      const form = e.target;
+      if (!form || !(form instanceof HTMLFormElement)) return;
+      if (form.action && form.action.includes('/cart/add')) {
+        // Try to update local room: read qty and update displayed value
+        const formQty = form.querySelector('input[name="qty"], input[type="number"]');
+        let qty = 1;
+        if (formQty && formQty.value) {
+          qty = Number(formQty.value) || 1;
+        }
+        // Attempt to read the current count displayed and increment it
+        const cur = Number(cartCountEl ? (cartCountEl.textContent || '0') : '0') || 0;
+        setCartCount(cur + qty);
+      }
+    }, true);
+
+    // Poll occasionally (every 30s) to keep the header count accurate for long-lived pages
+    setInterval(fetchCartCount, 30000);
+  });
@@ -0,0 +1,325 @@
+"""Pluggable storage backends for uploaded images.
+
+All upload and serve paths go through a `Storage` driver:
+
+- `LocalStorage`: files under a folder (``UPLOAD_FOLDER``), served at ``/uploads/images``.
+- `S3Storage`: any S3-compatible bucket (AWS, MinIO, R2). The boto3 client is built
+  once and reused; large files are sent with multipart uploads.
+- `DatabaseStorage`: rows in a blob table, for serverless hosts without a writable
+  disk or object store.
+
+Drivers share one small API: ``put``, ``open_stream``, ``url``, ``delete`` and ``exists``.
+Keys are relative, forward-slash paths such as ``logo_1700000000_logo.png``.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import mimetypes
+from pathlib import Path
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+
+class StorageError(IOError):
+    """Raised when a backend cannot store or read an object."""
+
+
+class StoredObject:
+    """A readable stored object: an iterator of byte chunks plus metadata."""
+
+    def __init__(self, chunks, content_type=None, size=None, etag=None):
+        self.chunks = chunks
+        self.content_type = content_type or 'application/octet-stream'
+        self.size = size
+        self.etag = etag
+
+    def read(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+def clean_key(key: str) -> str:
+    """Normalize a storage key and reject path traversal."""
+    key = (key or '').replace('\\', '/').lstrip('/')
+    parts = [p for p in key.split('/') if p not in ('', '.')]
+    if not parts or any(p == '..' for p in parts):
+        raise StorageError(f'Invalid storage key: {key!r}')
+    return '/'.join(parts)
+
+
+def _guess_type(key: str, content_type=None) -> str:
+    return content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+class Storage:
+    """Interface implemented by every storage driver."""
+
+    name = 'base'
+
+    def put(self, key: str, fileobj, content_type=None) -> str:
+        """Store the readable `fileobj` under `key` and return its public URL."""
+        raise NotImplementedError
+
+    def open_stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> StoredObject:
+        """Return a `StoredObject` for `key`. Raises `FileNotFoundError` when missing."""
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    """Store files in a local folder. Writes go to a temp file and are renamed into place."""
+
+    name = 'local'
+
+    def __init__(self, root, url_prefix: str = '/uploads/images', on_put=None):
+        self.root = Path(root)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.on_put = on_put
+
+    def _path(self, key: str) -> Path:
+        return self.root / clean_key(key)
+
+    def put(self, key, fileobj, content_type=None):
+        key = clean_key(key)
+        dest = self._path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        fd, tmp = tempfile.mkstemp(dir=str(dest.parent), prefix='.upload_')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(fileobj, out, DEFAULT_CHUNK_SIZE)
+            os.replace(tmp, dest)
+        except Exception as exc:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise StorageError(f'Local write failed for {key}: {exc}') from exc
+        if self.on_put is not None:
+            self.on_put(str(self.root), key)
+        return self.url(key)
+
+    def open_stream(self, key, chunk_size=DEFAULT_CHUNK_SIZE):
+        path = self._path(key)
+        if not path.is_file():
+            raise FileNotFoundError(key)
+        stat = path.stat()
+
+        def _chunks():
+            with open(path, 'rb') as fh:
+                while True:
+                    block = fh.read(chunk_size)
+                    if not block:
+                        break
+                    yield block
+
+        return StoredObject(_chunks(), _guess_type(key), stat.st_size, f"{int(stat.st_mtime)}-{stat.st_size}")
+
+    def url(self, key):
+        return f"{self.url_prefix}/{clean_key(key)}"
+
+    def delete(self, key):
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return self._path(key).is_file()
+
+
+class S3Storage(Storage):
+    """S3-compatible object storage with a single, lazily built, shared client."""
+
+    name = 's3'
+
+    def __init__(self, bucket, region=None, endpoint_url=None, access_key=None, secret_key=None,
+                 prefix='', public_base_url=None, acl='public-read',
+                 multipart_threshold=DEFAULT_MULTIPART_THRESHOLD, client=None):
+        self.bucket = bucket
+        self.region = region or None
+        self.endpoint_url = endpoint_url or None
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = prefix.strip('/') + '/' if prefix and prefix.strip('/') else ''
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        self.acl = acl or None
+        self.multipart_threshold = multipart_threshold
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import importlib
+                    boto3 = importlib.import_module('boto3')
+                    self._client = boto3.client(
+                        's3',
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        region_name=self.region,
+                        endpoint_url=self.endpoint_url,
+                    )
+        return self._client
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(multipart_threshold=self.multipart_threshold,
+                              multipart_chunksize=self.multipart_threshold)
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + clean_key(key)
+
+    def put(self, key, fileobj, content_type=None):
+        key = clean_key(key)
+        extra = {'ContentType': _guess_type(key, content_type)}
+        if self.acl:
+            extra['ACL'] = self.acl
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        try:
+            # upload_fileobj switches to multipart above `multipart_threshold`
+            self.client.upload_fileobj(fileobj, self.bucket, self.object_key(key),
+                                       ExtraArgs=extra, Config=self._transfer_config())
+        except Exception as exc:
+            raise StorageError(f'S3 upload failed for {key}: {exc}') from exc
+        return self.url(key)
+
+    def open_stream(self, key, chunk_size=DEFAULT_CHUNK_SIZE):
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as exc:
+            if _is_s3_not_found(exc):
+                raise FileNotFoundError(key) from exc
+            raise StorageError(f'S3 read failed for {key}: {exc}') from exc
+        body = obj['Body']
+        return StoredObject(body.iter_chunks(chunk_size), obj.get('ContentType'),
+                            obj.get('ContentLength'), (obj.get('ETag') or '').strip('"') or None)
+
+    def url(self, key):
+        object_key = self.object_key(key)
+        if self.public_base_url:
+            return f"{self.public_base_url}/{object_key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{object_key}"
+        if self.region and self.region != 'us-east-1':
+            return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{object_key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{object_key}"
+
+    def presign_post(self, key, content_type, max_bytes, expires_in=300):
+        """Return ``{'url', 'fields'}`` for a browser form POST straight to the bucket.
+
+        The policy pins the key and content type and rejects bodies over `max_bytes`.
+        """
+        fields = {'Content-Type': content_type}
+        conditions = [{'Content-Type': content_type}, ['content-length-range', 1, int(max_bytes)]]
+        if self.acl:
+            fields['acl'] = self.acl
+            conditions.append({'acl': self.acl})
+        return self.client.generate_presigned_post(
+            self.bucket, self.object_key(key), Fields=fields, Conditions=conditions, ExpiresIn=expires_in)
+
+    def presign_put(self, key, content_type, expires_in=300):
+        """Return ``{'url', 'headers'}`` for a direct PUT. PUT cannot cap the size, so check it with `stat`."""
+        params = {'Bucket': self.bucket, 'Key': self.object_key(key), 'ContentType': content_type}
+        headers = {'Content-Type': content_type}
+        if self.acl:
+            params['ACL'] = self.acl
+            headers['x-amz-acl'] = self.acl
+        url = self.client.generate_presigned_url('put_object', Params=params, ExpiresIn=expires_in)
+        return {'url': url, 'headers': headers}
+
+    def stat(self, key):
+        """Return ``{'size', 'content_type'}`` for an object. Raises `FileNotFoundError` when missing."""
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as exc:
+            if _is_s3_not_found(exc):
+                raise FileNotFoundError(key) from exc
+            raise StorageError(f'S3 head failed for {key}: {exc}') from exc
+        return {'size': head.get('ContentLength', 0), 'content_type': head.get('ContentType')}
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except Exception as exc:
+            if _is_s3_not_found(exc):
+                return False
+            raise
+
+
+def _is_s3_not_found(exc) -> bool:
+    response = getattr(exc, 'response', None) or {}
+    code = str((response.get('Error') or {}).get('Code', ''))
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+class DatabaseStorage(Storage):
+    """Store blobs in a SQLAlchemy model with `key`, `data`, `content_type` and `size` columns.
+
+    Rows are added to the caller's session without committing, so they commit (or
+    roll back) together with the product or settings change that references them.
+    """
+
+    name = 'db'
+
+    def __init__(self, db, model, url_prefix='/files'):
+        self.db = db
+        self.model = model
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def _row(self, key):
+        return self.model.query.filter_by(key=clean_key(key)).first()
+
+    def put(self, key, fileobj, content_type=None):
+        key = clean_key(key)
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        data = fileobj.read()
+        row = self._row(key)
+        if row is None:
+            row = self.model(key=key)
+            self.db.session.add(row)
+        row.data = data
+        row.content_type = _guess_type(key, content_type)
+        row.size = len(data)
+        return self.url(key)
+
+    def open_stream(self, key, chunk_size=DEFAULT_CHUNK_SIZE):
+        row = self._row(key)
+        if row is None or row.data is None:
+            raise FileNotFoundError(key)
+        data = bytes(row.data)
+
+        def _chunks():
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+
+        return StoredObject(_chunks(), row.content_type, len(data), f"db-{row.id}-{len(data)}")
+
+    def url(self, key):
+        return f"{self.url_prefix}/{clean_key(key)}"
+
+    def delete(self, key):
+        row = self._row(key)
+        if row is not None:
+            self.db.session.delete(row)
+
+    def exists(self, key):
+        return self._row(key) is not None
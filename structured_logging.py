@@ -0,0 +1,230 @@
+"""JSON log records written off the request thread.
+
+`configure(logger, ...)` replaces the logger's handlers with a `QueueHandler`
+feeding a bounded in-memory queue; a `QueueListener` thread drains it to
+stdout. A request thread only formats the message and appends to the queue,
+so a slow or blocked stdout pipe never stalls a request. When the queue is
+full, records are dropped (and counted) rather than waited on.
+
+Two filters run on the request thread before a record is queued:
+
+* `ContextFilter` copies request fields (request id, route, user kind,
+  latency so far, DB query count) onto the record from a provider callable,
+  since the listener thread cannot see the request.
+* `RateLimitFilter` lets the first of a run of identical warnings through and
+  swallows repeats for `interval` seconds; the next one to get through carries
+  the number suppressed in between.
+
+`JsonFormatter` renders one JSON object per line with those fields.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+# Record attributes `ContextFilter` may set, in output order
+CONTEXT_FIELDS = ('request_id', 'method', 'path', 'route', 'user', 'status', 'latency_ms', 'db_queries', 'db_ms')
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_installed = []  # (logger, handler, listener) set up by configure()
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, request fields, exc."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Add the fields returned by `provider()` (a dict, or None outside a request) to each record."""
+
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def filter(self, record):
+        try:
+            fields = self.provider()
+        except Exception:
+            fields = None
+        if fields:
+            for key, value in fields.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of an identical WARNING (same logger and message) within `interval` seconds.
+
+    ERROR and above always pass. At most `max_keys` distinct messages are
+    tracked; beyond that, expired entries are pruned and then the table starts over.
+    """
+
+    def __init__(self, interval: float = 60.0, max_keys: int = 2048):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.suppressed_total = 0
+        self._seen = {}  # (logger, level, message) -> [window end, suppressed count]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.interval <= 0 or not (logging.WARNING <= record.levelno < logging.ERROR):
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and seen[0] > now:
+                seen[1] += 1
+                self.suppressed_total += 1
+                return False
+            if seen is None and len(self._seen) >= self.max_keys:
+                self._seen = {k: v for k, v in self._seen.items() if v[0] > now}
+                if len(self._seen) >= self.max_keys:
+                    self._seen.clear()
+            if seen is not None and seen[1]:
+                record.suppressed = seen[1]
+            self._seen[key] = [now + self.interval, 0]
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Like the stock prepare() (merge args into msg so the record pickles and
+        # can't change under the listener), but keep the traceback as exc_text
+        # for the formatter instead of folding it into the message.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        if record.stack_info:
+            record.exc_text = (record.exc_text + '\n' if record.exc_text else '') + record.stack_info
+            record.stack_info = None
+        return record
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """StreamHandler bound to whatever `sys.stdout` is when a record is written."""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure(logger, level=logging.INFO, fmt: str = 'json', context=None, rate_limit: float = 60.0,
+              queue_size: int = 10000):
+    """Route `logger` through a queue to stdout; returns the `QueueHandler`.
+
+    `fmt` is ``'json'`` or ``'text'``; `context` is a provider for `ContextFilter`.
+    Calling it again for the same logger replaces the previous setup.
+    """
+    output = _StdoutHandler()
+    output.setLevel(level)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+    handler = _QueueHandler(queue.Queue(maxsize=queue_size))
+    handler.setLevel(level)
+    if context is not None:
+        handler.addFilter(ContextFilter(context))
+    handler.rate_limit = RateLimitFilter(rate_limit)
+    handler.addFilter(handler.rate_limit)
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+
+    with _lock:
+        for entry in [e for e in _installed if e[0] is logger]:
+            _remove(entry)
+        for existing in list(logger.handlers):
+            if isinstance(existing, logging.StreamHandler):
+                logger.removeHandler(existing)
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        listener.start()
+        _installed.append((logger, handler, listener))
+    return handler
+
+
+def _remove(entry):
+    logger, handler, listener = entry
+    logger.removeHandler(handler)
+    try:
+        listener.stop()
+    except Exception:
+        pass
+    _installed.remove(entry)
+
+
+def shutdown():
+    """Stop every listener, writing out whatever is still queued."""
+    with _lock:
+        for entry in list(_installed):
+            _remove(entry)
+
+
+def flush(timeout: float = 1.0):
+    """Wait (up to `timeout` seconds) until every queued record has been written."""
+    deadline = time.monotonic() + timeout
+    for _logger, handler, _listener in list(_installed):
+        while handler.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork(); give the child fresh queues and threads
+    for _logger, handler, listener in _installed:
+        handler.queue = listener.queue = queue.Queue(maxsize=handler.queue.maxsize)
+        listener._thread = None
+        listener.start()
+
+
+atexit.register(shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
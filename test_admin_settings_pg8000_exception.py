@@ -1,14 +1,12 @@
 import os
 import sys
-import tempfile
 from io import BytesIO
-from pathlib import Path
 
 import pg8000
 import pytest
 
 sys.path.insert(0, os.getcwd())
-from app import app, db, AdminUser
+from app import app, db, AdminUser, error_log
 
 
 def setup_admin(app, username='pgerradmin'):
@@ -23,7 +21,7 @@ def setup_admin(app, username='pgerradmin'):
 
 
 def test_admin_settings_handles_pg8000_interface_error(monkeypatch, tmp_path):
-    """A minimal test that patches SQLAlchemy Session.commit and verifies last_error is written.
+    """A minimal test that patches SQLAlchemy Session.commit and verifies the error is recorded for /__last_error.
     """
     setup_admin(app, username='pgerradmin')
     client = app.test_client()
@@ -45,22 +43,16 @@ def test_admin_settings_handles_pg8000_interface_error(monkeypatch, tmp_path):
 
     monkeypatch.setattr(Session, 'flush', fake_flush, raising=False)
 
-    last_err_path = Path(tempfile.gettempdir()) / 'last_error.txt'
-    try:
-        if last_err_path.exists():
-            last_err_path.unlink()
-    except Exception:
-        pass
+    error_log.clear()
 
     fp = BytesIO(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR')
     fp.name = 'tiny.png'
     resp2 = client.post('/admin/settings', data={'primary_color': '#ffffff', 'logo_file': (fp, 'tiny.png')}, content_type='multipart/form-data', follow_redirects=False)
     assert resp2.status_code in (200, 500)
 
-    content = last_err_path.read_text(encoding='utf-8') if last_err_path.exists() else ''
+    content = '\n'.join(f"{g['message']}\n{g['traceback']}" for g in error_log.grouped())
     print('flush call count:', counter['count'])
-    if last_err_path.exists():
-        print('last_err content:\n', content)
+    print('recorded errors:\n', content)
     assert 'simulated interface error for tests' in content
 
     monkeypatch.setattr(Session, 'flush', orig_flush, raising=False)
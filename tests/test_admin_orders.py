@@ -0,0 +1,97 @@
+import os
+import uuid
+import importlib.util
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def orders():
+    prefix = f"keyset{uuid.uuid4().hex[:6]}"
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    with mod.app.app_context():
+        mod.db.create_all()
+        rows = []
+        for i in range(7):
+            o = mod.Order(reference=f"{prefix}-{i}", email=f"{prefix}{i}@example.com",
+                          total=Decimal(10 + i), subtotal=Decimal(10 + i),
+                          status='completed' if i % 2 else 'pending', paid=bool(i % 2),
+                          payment_method='wallet', created_at=base + timedelta(days=i))
+            rows.append(o)
+        # Two orders share a timestamp to exercise the id tie-breaker
+        rows[3].created_at = rows[2].created_at
+        mod.db.session.add_all(rows)
+        mod.db.session.commit()
+        yield prefix, [o.id for o in rows]
+
+
+def _page(args):
+    with mod.app.test_request_context():
+        return mod.paginate_orders(args, per_page=3)
+
+
+def test_keyset_pages_cover_all_orders_once(orders):
+    prefix, ids = orders
+    seen, args = [], {'q': prefix}
+    while True:
+        page = _page(args)
+        seen.extend(o.id for o in page['orders'])
+        if not page['next_cursor']:
+            break
+        args = {'q': prefix, 'after': page['next_cursor']}
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+    # Newest first; ties broken by id descending
+    assert seen[0] == ids[6] and seen[-1] == ids[0]
+    assert seen.index(ids[3]) < seen.index(ids[2])
+
+
+def test_previous_cursor_returns_preceding_page(orders):
+    prefix, _ = orders
+    first = _page({'q': prefix})
+    assert first['prev_cursor'] is None
+    second = _page({'q': prefix, 'after': first['next_cursor']})
+    back = _page({'q': prefix, 'before': second['prev_cursor']})
+    assert [o.id for o in back['orders']] == [o.id for o in first['orders']]
+
+
+def test_filters_and_sorting(orders):
+    prefix, ids = orders
+    page = _page({'q': prefix, 'status': 'completed', 'sort': 'total', 'dir': 'asc'})
+    assert [o.id for o in page['orders']] == [ids[1], ids[3], ids[5]]
+    assert page['filters'] == {'q': prefix, 'status': 'completed'}
+    page = _page({'q': prefix, 'paid': 'no', 'date_from': '2026-01-03', 'date_to': '2026-01-05'})
+    assert sorted(o.id for o in page['orders']) == [ids[2], ids[4]]
+    # LIKE wildcards in the search box are matched literally
+    assert _page({'q': prefix[:3] + '%'})['orders'] == []
+
+
+def test_rows_with_null_sort_values_are_paged(orders):
+    prefix, ids = orders
+    for i in (0, 4, 5):
+        mod.db.session.get(mod.Order, ids[i]).status = None
+    mod.db.session.commit()
+    for direction in ('asc', 'desc'):
+        seen, args = [], {'q': prefix, 'sort': 'status', 'dir': direction}
+        while True:
+            page = _page(args)
+            seen.extend(o.id for o in page['orders'])
+            if not page['next_cursor']:
+                break
+            args = dict(args, after=page['next_cursor'])
+        assert sorted(seen) == sorted(ids) and len(seen) == len(set(seen))
+
+
+def test_admin_orders_page_renders_filters_and_pager(orders, admin_client):
+    prefix, _ = orders
+    resp = admin_client.get(f'/admin/orders?q={prefix}&per_page=3')
+    assert resp.status_code == 200
+    assert resp.data.count(b'/admin/order/') == 3
+    assert b'after=' in resp.data
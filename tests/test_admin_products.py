@@ -0,0 +1,69 @@
+import os
+import uuid
+import importlib.util
+from decimal import Decimal
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def products():
+    tag = f"grid{uuid.uuid4().hex[:6]}"
+    with mod.app.app_context():
+        mod.db.create_all()
+        rows = []
+        for i in range(5):
+            p = mod.Product(title=f"Item {tag} {i}", short=None if i == 0 else 'desc',
+                            price_ghc=Decimal(10 + i), featured=(i % 2 == 1),
+                            image=f'/static/images/{tag}-{i}.png')
+            if i == 4:
+                p.product_image_data = b'\x89PNG\r\n\x1a\n' + b'0' * 1024
+                p.product_image_mime = 'image/png'
+            rows.append(p)
+        mod.db.session.add_all(rows)
+        mod.db.session.commit()
+        yield tag, [p.id for p in rows]
+
+
+def _page(args, per_page=2):
+    with mod.app.test_request_context():
+        return mod.admin_product_page(args, per_page=per_page)
+
+
+def test_product_pages_are_projected_and_cover_all(products):
+    tag, ids = products
+    seen, args = [], {'q': tag}
+    while True:
+        page = _page(args)
+        seen.extend(page['products'])
+        if not page['next_cursor']:
+            break
+        args = {'q': tag, 'after': page['next_cursor']}
+    assert [p['id'] for p in seen] == list(reversed(ids))
+    by_id = {p['id']: p for p in seen}
+    assert by_id[ids[4]]['image_url'] == f'/product/image/{ids[4]}'
+    assert by_id[ids[1]]['image_url'] == f'/static/images/{tag}-1.png'
+    assert by_id[ids[0]]['short'] == ''
+    assert all('product_image_data' not in p for p in seen)
+
+
+def test_featured_filter_and_title_search_escape(products):
+    tag, ids = products
+    page = _page({'q': tag, 'featured': 'yes'}, per_page=10)
+    assert [p['id'] for p in page['products']] == [ids[3], ids[1]]
+    assert _page({'q': tag + '%'}, per_page=10)['products'] == []
+
+
+def test_products_api_returns_next_page_html(products, admin_client):
+    tag, ids = products
+    html = admin_client.get(f'/admin?q={tag}').get_data(as_text=True)
+    assert html.count('class="product-card"') == 5
+    body = admin_client.get(f'/admin/products/api?q={tag}&per_page=2&after={ids[3]}&layout=compact').get_json()
+    assert [p['id'] for p in body['products']] == [ids[2], ids[1]]
+    assert body['next_cursor'] == ids[1]
+    assert body['html'].count('class="product-compact-row"') == 2
@@ -0,0 +1,120 @@
+import os
+import uuid
+import importlib.util
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def customers():
+    prefix = f"wallet{uuid.uuid4().hex[:6]}"
+    balances = ['5.00', '40.00', '40.00', '12.50', None]
+    with mod.app.app_context():
+        mod.db.create_all()
+        ids = []
+        for i, balance in enumerate(balances):
+            user = mod.User(email=f"{prefix}{i}@example.com")
+            user.set_password('secret1')
+            if balance is not None:
+                user.wallet = mod.Wallet(balance=Decimal(balance))
+            mod.db.session.add(user)
+            mod.db.session.flush()
+            ids.append(user.id)
+        mod.db.session.commit()
+        yield prefix, ids
+
+
+def _page(args, per_page=2):
+    with mod.app.test_request_context():
+        page = mod.paginate_wallets(args, per_page=per_page)
+        return page, [(u.id, u.wallet.balance if u.wallet else None) for u in page['users']]
+
+
+def test_wallet_pages_sort_by_balance_with_id_tiebreak(customers):
+    prefix, ids = customers
+    seen, args = [], {'q': prefix, 'sort': 'balance', 'dir': 'desc'}
+    while True:
+        page, rows = _page(args)
+        seen.extend(rows)
+        if not page['next_cursor']:
+            break
+        args = {'q': prefix, 'sort': 'balance', 'dir': 'desc', 'after': page['next_cursor']}
+    assert [uid for uid, _ in seen] == [ids[2], ids[1], ids[3], ids[0], ids[4]]
+    assert seen[-1][1] is None
+
+    back, rows = _page({'q': prefix, 'sort': 'balance', 'dir': 'desc', 'before': page['prev_cursor']})
+    assert [uid for uid, _ in rows] == [ids[3], ids[0]]
+
+
+def test_customers_without_wallets_sort_below_every_balance(customers):
+    prefix, ids = customers
+    for sort in ('balance', 'updated_at'):
+        seen, args = [], {'q': prefix, 'sort': sort, 'dir': 'asc'}
+        while True:
+            page, rows = _page(args)
+            seen.extend(uid for uid, _ in rows)
+            if not page['next_cursor']:
+                break
+            args = dict(args, after=page['next_cursor'])
+        assert seen[0] == ids[4] and sorted(seen) == sorted(ids) and len(seen) == len(set(seen))
+    assert seen[1:] == ids[:4]
+
+
+def test_balance_sort_scans_the_wallet_index(customers):
+    captured = []
+
+    def keep(conn, cursor, statement, parameters, *args):
+        captured.append((statement, parameters))
+
+    with mod.app.app_context():
+        engine = mod.db.engine
+        event.listen(engine, 'before_cursor_execute', keep)
+        try:
+            _page({'sort': 'balance', 'dir': 'desc'})
+        finally:
+            event.remove(engine, 'before_cursor_execute', keep)
+        statement, parameters = captured[0]
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    assert any('ix_wallet_balance' in row[-1] for row in plan), plan
+
+
+def test_wallet_page_loads_wallets_in_one_query(customers):
+    prefix, _ = customers
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with mod.app.app_context():
+        engine = mod.db.engine
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            page, rows = _page({'q': prefix, 'sort': 'email'}, per_page=10)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+    assert len(rows) == 5
+    assert len(statements) == 1
+
+
+def test_liabilities_are_summed_in_sql(customers):
+    with mod.app.app_context():
+        expected = sum(Decimal(str(w.balance)) for w in mod.Wallet.query.all())
+        result = mod.wallet_liabilities()
+    assert result['total'] == expected
+    assert result['funded_wallets'] >= 4
+
+
+def test_admin_wallets_page_renders_search_and_total(customers, admin_client):
+    prefix, _ = customers
+    html = admin_client.get(f'/admin/wallets?q={prefix}&per_page=2').get_data(as_text=True)
+    assert 'Total wallet liabilities' in html
+    assert html.count('class="wallet-card"') == 2
+    assert 'Next &rarr;' in html
@@ -0,0 +1,90 @@
+import os
+import random
+import importlib.util
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import analytics
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+def _cols(rows):
+    # rows: (iso datetime, email, total, discount)
+    batch = [(np.datetime64(ts, 's').astype(np.int64), email, total, disc, total + disc)
+             for ts, email, total, disc in rows]
+    return analytics.OrderColumns.from_batches([batch])
+
+
+def test_moving_average_uses_available_points_at_start():
+    assert analytics.moving_average([2, 4, 6, 8], 2).tolist() == [2.0, 3.0, 5.0, 7.0]
+
+
+def test_daily_and_weekly_totals_fill_gaps():
+    cols = _cols([('2024-03-04T10:00:00', 'a@x.com', 10.0, 0.0),
+                  ('2024-03-04T18:00:00', 'b@x.com', 30.0, 5.0),
+                  ('2024-03-06T09:00:00', 'a@x.com', 20.0, 0.0),
+                  ('2024-03-11T09:00:00', 'c@x.com', 40.0, 0.0)])
+    daily = analytics.daily_totals(cols, date(2024, 3, 3), date(2024, 3, 6), window=2)
+    assert daily['period'] == ['2024-03-03', '2024-03-04', '2024-03-05', '2024-03-06']
+    assert daily['orders'] == [0, 2, 0, 1]
+    assert daily['revenue'] == [0.0, 40.0, 0.0, 20.0]
+    assert daily['average_order_value'] == [0.0, 20.0, 0.0, 20.0]
+    assert daily['revenue_moving_average'] == [0.0, 20.0, 20.0, 10.0]
+
+    weekly = analytics.weekly_totals(cols)
+    assert weekly['period'] == ['2024-03-04', '2024-03-11']  # Mondays
+    assert weekly['orders'] == [3, 1]
+    assert weekly['discount'] == [5.0, 0.0]
+
+
+def test_cohort_retention_counts_each_customer_once_per_period():
+    cols = _cols([('2024-01-05T00:00:00', 'a@x.com', 10.0, 0.0),
+                  ('2024-01-20T00:00:00', 'A@x.com ', 10.0, 0.0),
+                  ('2024-02-02T00:00:00', 'a@x.com', 10.0, 0.0),
+                  ('2024-01-09T00:00:00', 'b@x.com', 10.0, 0.0),
+                  ('2024-02-15T00:00:00', 'c@x.com', 10.0, 0.0),
+                  ('2024-03-01T00:00:00', 'c@x.com', 10.0, 0.0)])
+    result = analytics.cohort_retention(cols, periods=3)
+    assert result['cohorts'] == ['2024-01', '2024-02']
+    assert result['sizes'] == [2, 1]
+    assert result['active'] == [[2, 1, 0], [1, 1, None]]
+    assert result['retention'] == [[1.0, 0.5, 0.0], [1.0, 1.0, None]]
+
+
+def test_discount_impact_splits_orders_and_repeat_rates():
+    cols = _cols([('2024-01-01T00:00:00', 'a@x.com', 80.0, 20.0),
+                  ('2024-01-10T00:00:00', 'a@x.com', 100.0, 0.0),
+                  ('2024-01-02T00:00:00', 'b@x.com', 50.0, 0.0)])
+    result = analytics.discount_impact(cols)
+    assert result['discounted']['orders'] == 1
+    assert result['discounted']['discount_rate'] == 0.2
+    assert result['full_price']['average_order_value'] == 75.0
+    assert result['repeat_rate'] == {'first_order_discounted': 1.0, 'first_order_full_price': 0.0}
+
+
+def test_admin_analytics_api_reads_orders(admin_client):
+    day = date(2045, 1, 1) + timedelta(days=random.randint(0, 3000))
+    with mod.app.app_context():
+        for offset, total, paid in ((0, '25.00', True), (0, '35.00', True), (2, '40.00', True), (2, '99.00', False)):
+            mod.db.session.add(mod.Order(
+                reference=f"an-{random.random()}", email='analytics@example.com', subtotal=Decimal(total),
+                discount=Decimal('0'), total=Decimal(total), paid=paid, status='completed',
+                created_at=datetime.combine(day + timedelta(days=offset), datetime.min.time()) + timedelta(hours=12)))
+        mod.db.session.commit()
+    end = day + timedelta(days=2)
+    body = admin_client.get(f'/admin/analytics/api/daily?start={day}&end={end}&window=2').get_json()
+    assert body['status'] == 'success'
+    assert body['orders'] == [2, 0, 1]
+    assert body['revenue'] == [60.0, 0.0, 40.0]
+    assert body['revenue_moving_average'] == [60.0, 30.0, 20.0]
+    cohorts = admin_client.get(f'/admin/analytics/api/cohorts?start={day}&end={end}').get_json()
+    assert cohorts['sizes'] == [1]
+    assert admin_client.get('/admin/analytics/api/nope').status_code == 404
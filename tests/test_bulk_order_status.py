@@ -0,0 +1,105 @@
+import io
+import os
+import random
+import importlib.util
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def orders(monkeypatch):
+    sent = []
+    monkeypatch.setattr(mod, 'send_html_emails_async', lambda messages: sent.extend(messages) or len(messages))
+    # A day no other test writes orders on, so the rollup row is ours alone
+    day = date(2045, 1, 1) + timedelta(days=random.randint(0, 3000))
+    with mod.app.app_context():
+        mod.db.create_all()
+        product = mod.Product(title='Courier box', price_ghc=Decimal('10.00'), image='/static/images/box.png')
+        mod.db.session.add(product)
+        mod.db.session.flush()
+        rows = []
+        for i, status in enumerate(('pending', 'pending', 'completed')):
+            o = mod.Order(reference=f"bulk-{random.random()}", email=f'bulk{i}@example.com', name='Ama',
+                          subtotal=Decimal('20.00'), discount=Decimal('0'), total=Decimal('20.00'), paid=True,
+                          status=status, payment_method='wallet',
+                          created_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=9))
+            mod.db.session.add(o)
+            mod.db.session.flush()
+            mod.db.session.add(mod.OrderItem(order_id=o.id, product_id=product.id, title='Courier box', qty=2,
+                                             price=Decimal('10.00'), subtotal=Decimal('20.00')))
+            rows.append(o)
+        mod.db.session.commit()
+        yield day, [(o.id, o.reference) for o in rows], sent
+
+
+def test_bulk_status_updates_logs_and_batches_emails(orders):
+    day, refs, sent = orders
+    ids = [oid for oid, _ in refs]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = mod.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = mod.bulk_update_order_status('completed', ids=ids, actor='courier-desk')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert (result['matched'], result['updated'], result['unchanged'], result['notified']) == (3, 2, 1, 2)
+    assert len([s for s in statements if s.lstrip().upper().startswith('UPDATE "ORDER"')]) == 1
+    assert len([s for s in statements if 'FROM order_item' in s]) == 1
+    assert len([s for s in statements if 'FROM product' in s]) == 1
+    assert sorted(m[0] for m in sent) == ['bulk0@example.com', 'bulk1@example.com']
+    assert 'COMPLETED' in sent[0][1] and '/static/images/box.png' in sent[0][2]
+
+    mod.db.session.expire_all()
+    assert {o.status for o in mod.Order.query.filter(mod.Order.id.in_(ids))} == {'completed'}
+    logs = mod.OrderLog.query.filter(mod.OrderLog.order_id.in_(ids)).all()
+    assert sorted((l.order_id, l.old_status, l.new_status, l.changed_by) for l in logs) == [
+        (ids[0], 'pending', 'completed', 'courier-desk'), (ids[1], 'pending', 'completed', 'courier-desk')]
+
+
+def test_bulk_cancel_keeps_sales_rollups_in_step(orders):
+    day, refs, sent = orders
+    before = mod.db.session.get(mod.DailySales, day)
+    assert (before.orders_count, before.items_sold) == (3, 6)
+    mod.bulk_update_order_status('cancelled', references=[refs[0][1], refs[2][1]], notify=False)
+    mod.db.session.expire_all()
+    after = mod.db.session.get(mod.DailySales, day)
+    assert (after.orders_count, Decimal(str(after.revenue)), after.items_sold) == (1, Decimal('20.00'), 2)
+    assert sent == []
+
+    mod.backfill_sales_rollups(day, day)
+    mod.db.session.expire_all()
+    rebuilt = mod.db.session.get(mod.DailySales, day)
+    assert (rebuilt.orders_count, rebuilt.items_sold) == (1, 2)
+
+
+def test_bulk_status_endpoint_reads_reference_csv(orders, admin_client):
+    day, refs, sent = orders
+    csv_body = io.BytesIO(f"reference,courier\n{refs[0][1]},DHL\nnot-a-real-ref,DHL\n".encode())
+    resp = admin_client.post('/admin/orders/bulk_status', data={'status': 'completed', 'order_ids': [str(refs[1][0])],
+                                                               'file': (csv_body, 'pickup.csv')},
+                             content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    result = resp.get_json()['result']
+    assert (result['updated'], result['missing']) == (2, ['not-a-real-ref'])
+    bad = admin_client.post('/admin/orders/bulk_status', data={'status': 'shipped', 'order_ids': [str(refs[0][0])]})
+    assert bad.status_code == 302
+
+
+def test_malformed_reference_csv_is_a_400(admin_client):
+    csv_body = io.BytesIO(b'reference\n' + b'x' * 200000 + b'\n')
+    resp = admin_client.post('/admin/orders/bulk_status', data={'status': 'completed', 'file': (csv_body, 'big.csv')},
+                             content_type='multipart/form-data', headers={'Accept': 'application/json'})
+    assert resp.status_code == 400
+    assert resp.get_json()['message'].startswith('Could not read the CSV file')
@@ -0,0 +1,26 @@
+import os
+import sys
+import importlib.util
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+import bench_cold_start  # noqa: E402
+
+# Wall-clock budget for loading api/index.py in a fresh interpreter. Generous enough
+# for a loaded CI box; the lazy-module check below is the precise guard.
+BUDGET_MS = float(os.environ.get('COLD_START_BUDGET_MS', '1500'))
+
+
+def test_storefront_entry_point_starts_within_budget():
+    runs = [bench_cold_start.measure(env={'REDIS_URL': 'redis://127.0.0.1:1/0'}) for _ in range(3)]
+    assert all(r['loaded'] == [] for r in runs), runs[0]['loaded']
+    best = min(r['ms'] for r in runs)
+    assert best < BUDGET_MS, f'api/index.py took {best:.0f}ms to import (budget {BUDGET_MS:.0f}ms)'
+
+
+def test_migrate_is_bound_on_demand():
+    spec = importlib.util.spec_from_file_location('app', os.path.join(ROOT, 'app.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    config = mod.init_migrate(mod.app)
+    assert config.db is mod.db and mod.init_migrate(mod.app) is config
@@ -0,0 +1,77 @@
+import os
+import uuid
+import importlib.util
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+NOW = datetime(2040, 6, 1, 12, 0, 0)
+
+
+def _user(tag):
+    user = mod.User(email=f"{tag}-{uuid.uuid4().hex[:8]}@example.com")
+    user.set_password('secret1')
+    mod.db.session.add(user)
+    mod.db.session.flush()
+    return user
+
+
+def _orders(user, days_ago, totals, paid=True):
+    for i, total in enumerate(totals):
+        mod.db.session.add(mod.Order(
+            reference=f"rfm-{uuid.uuid4().hex}", user_id=user.id, email=user.email,
+            subtotal=Decimal(total), discount=Decimal('0'), total=Decimal(total), paid=paid,
+            status='completed', created_at=NOW - timedelta(days=days_ago, hours=i)))
+
+
+def test_refresh_scores_customers_and_updates_incrementally():
+    with mod.app.app_context():
+        mod.db.create_all()
+        champion, newbie, at_risk, unpaid = _user('champ'), _user('new'), _user('risk'), _user('unpaid')
+        _orders(champion, 3, ['600.00'] * 10)
+        _orders(newbie, 10, ['50.00'])
+        _orders(at_risk, 200, ['400.00', '400.00', '400.00'])
+        _orders(unpaid, 1, ['999.00'], paid=False)
+        mod.db.session.commit()
+
+        mod.refresh_customer_segments(full=True, now=NOW)
+        seg = {u.id: mod.db.session.get(mod.CustomerSegment, u.id) for u in (champion, newbie, at_risk, unpaid)}
+        assert (seg[champion.id].rfm, seg[champion.id].segment) == ('555', 'champions')
+        assert (seg[newbie.id].rfm, seg[newbie.id].segment) == ('511', 'new')
+        assert (seg[at_risk.id].rfm, seg[at_risk.id].segment) == ('233', 'at_risk')
+        assert seg[unpaid.id] is None
+
+        _orders(newbie, 1, ['60.00'])
+        mod.db.session.commit()
+        result = mod.refresh_customer_segments(now=NOW + timedelta(days=100))
+        assert not result['full'] and result['customers_updated'] == 1
+        mod.db.session.expire_all()
+        newbie_seg = mod.db.session.get(mod.CustomerSegment, newbie.id)
+        assert (newbie_seg.orders_count, newbie_seg.monetary) == (2, Decimal('110.00'))
+        # Recency is re-scored for everyone, including customers without new orders
+        assert mod.db.session.get(mod.CustomerSegment, champion.id).recency_score == 3
+
+
+def test_segment_coupons_are_single_use_and_downloadable(admin_client):
+    with mod.app.app_context():
+        mod.db.create_all()
+        lapsed = _user('lapsed')
+        _orders(lapsed, 400, ['20.00'])
+        mod.db.session.commit()
+        mod.refresh_customer_segments(full=True, now=NOW)
+        issued = dict(mod.issue_segment_coupons('lapsed', 'percent', Decimal('10'), prefix='BACK', batch_size=2))
+        email = lapsed.email
+        code = issued[email]
+        coupon = mod.Coupon.query.filter_by(code=code).one()
+        assert code.startswith('BACK-') and coupon.max_uses == 1 and coupon.is_valid()[0]
+        assert len(set(issued.values())) == len(issued)
+    assert admin_client.get('/admin/segments').status_code == 200
+    resp = admin_client.post('/admin/segments/coupons', data={'segment': 'lapsed', 'discount_type': 'fixed',
+                                                              'discount_value': '15', 'expiry_days': '30'})
+    assert resp.status_code == 200 and resp.mimetype == 'text/csv'
+    lines = resp.get_data(as_text=True).splitlines()
+    assert lines[0] == 'email,code' and any(line.startswith(email + ',LAPSED-') for line in lines[1:])
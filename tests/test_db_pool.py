@@ -0,0 +1,210 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import db_pool  # noqa: E402
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+PG = 'postgresql+pg8000://u:p@db.example.com/shop'
+
+
+def test_profile_detection_and_options():
+    assert db_pool.detect_pool_profile(PG, {'VERCEL': '1'}) == 'serverless'
+    assert db_pool.detect_pool_profile(PG, {}) == 'server'
+    assert db_pool.detect_pool_profile('sqlite:///data.db', {'VERCEL': '1'}) == 'sqlite'
+    assert db_pool.detect_pool_profile(PG, {'VERCEL': '1', 'DB_POOL_PROFILE': 'server'}) == 'server'
+    assert db_pool.detect_pool_profile(PG, {'DB_POOL_PROFILE': 'bogus'}) == 'server'
+
+    # The serverless default keeps the warmed-up connection; without warm-up nothing is kept
+    assert db_pool.engine_options_for_profile('serverless', PG, {'DB_WARMUP': '0'}) == {'poolclass': NullPool}
+    assert db_pool.engine_options_for_profile('serverless', PG, {'DB_POOL_SIZE': '0'}) == {'poolclass': NullPool}
+    tiny = db_pool.engine_options_for_profile('serverless', PG, {})
+    assert (tiny['poolclass'], tiny['pool_size'], tiny['max_overflow'], tiny['pool_pre_ping']) == (QueuePool, 1, 0, True)
+    server = db_pool.engine_options_for_profile('server', PG, {'GUNICORN_CMD_ARGS': '--workers 2 --threads 8'})
+    assert (server['pool_size'], server['pool_recycle'], server['pool_pre_ping']) == (10, 1800, True)
+    assert db_pool.engine_options_for_profile('server', PG, {'DB_POOL_SIZE': '3'})['pool_size'] == 3
+    assert db_pool.engine_options_for_profile('sqlite', 'sqlite://', {}) == {'poolclass': StaticPool}
+    assert db_pool.engine_options_for_profile('sqlite', 'sqlite:///data.db', {}) == {}
+
+
+def test_metrics_track_checkouts_saturation_and_timeouts():
+    db_pool.pool_metrics.reset()
+    # Without a poolclass the dialect's default is timed; a configured one is wrapped
+    assert db_pool.timed_engine_options({}, PG)['poolclass'] is db_pool.timed_pool_class(QueuePool)
+    options = db_pool.timed_engine_options({'poolclass': QueuePool, 'pool_size': 1, 'max_overflow': 1,
+                                            'pool_timeout': 0.05}, 'sqlite:///:memory:')
+    engine = db_pool.instrument_engine(create_engine('sqlite:///:memory:', **options))
+    first, second = engine.connect(), engine.connect()
+    first.execute(text('select 1'))
+    status = db_pool.pool_status(engine)
+    assert (status['pool_class'], status['checkouts'], status['in_use'], status['capacity']) == ('QueuePool', 2, 2, 2)
+    assert status['saturation'] == 1.0
+    with pytest.raises(PoolTimeout):
+        engine.connect()
+    first.close()
+    second.close()
+    status = db_pool.pool_status(engine)
+    assert (status['in_use'], status['peak_saturation'], status['failures']) == (0, 1.0, 1)
+    assert status['checkout_ms_max'] >= status['checkout_ms_p50'] >= 0
+    engine.dispose()
+    assert type(engine.pool) is db_pool.timed_pool_class(QueuePool)
+
+
+def test_in_memory_sqlite_pool_is_timed_after_flask_sqlalchemy_replaces_it():
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.timed_engine_options(
+        db_pool.engine_options_for_profile('sqlite', 'sqlite://', {}), 'sqlite://')
+    ext = SQLAlchemy()
+    ext.init_app(app)
+    with app.app_context():
+        # Flask-SQLAlchemy sets poolclass to a plain StaticPool for in-memory SQLite
+        assert type(ext.engine.pool) is StaticPool
+        db_pool.pool_metrics.reset()
+        engine = db_pool.instrument_engine(ext.engine)
+        assert type(engine.pool) is db_pool.timed_pool_class(StaticPool)
+        with engine.connect() as conn:
+            conn.execute(text('select 1'))
+        assert db_pool.pool_metrics.snapshot()['checkouts'] == 1
+
+
+def test_app_engine_uses_profile_and_reports_pool(admin_client):
+    assert mod.app.config['DB_POOL_PROFILE'] == 'sqlite'
+    assert getattr(mod.app.config['SQLALCHEMY_ENGINE_OPTIONS']['poolclass'], '_pool_metrics_timed', False)
+    with mod.app.app_context():
+        assert getattr(mod.db.engine.pool, '_pool_metrics_timed', False)
+    body = admin_client.get('/admin/diagnostics/pool').get_json()
+    assert body['profile'] == 'sqlite' and body['pool']['checkouts'] > 0
+
+
+def _self_signed(tmp_path):
+    x509 = pytest.importorskip('cryptography.x509')
+    from datetime import datetime, timedelta, timezone
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now - timedelta(minutes=1))
+            .not_valid_after(now + timedelta(hours=1))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName('localhost')]), critical=False)
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return str(cert_path), str(key_path)
+
+
+def test_shared_ssl_context_resumes_tls_sessions(tmp_path):
+    import ssl
+    import socket
+    import threading
+    cert, key = _self_signed(tmp_path)
+    server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_ctx.load_cert_chain(cert, key)
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+
+    def serve(n):
+        for _ in range(n):
+            conn, _addr = listener.accept()
+            with server_ctx.wrap_socket(conn, server_side=True) as tls:
+                tls.sendall(b'ok')
+                tls.recv(1)
+
+    threading.Thread(target=serve, args=(3,), daemon=True).start()
+    db_pool.connect_metrics.reset()
+    ctx = db_pool.build_ssl_context(cert)
+    reused = []
+    for _ in range(3):
+        with ctx.wrap_socket(socket.create_connection(('127.0.0.1', port)), server_hostname='localhost') as tls:
+            tls.recv(2)
+            reused.append(tls.session_reused)
+            tls.sendall(b'x')
+    listener.close()
+    assert reused == [False, True, True]
+    stats = db_pool.connect_metrics.snapshot()
+    assert (stats['tls_handshakes'], stats['tls_resumed']) == (3, 2) and stats['tls_ms_last'] > 0
+
+
+def test_connects_are_timed_and_warm_up_validates(monkeypatch):
+    db_pool.connect_metrics.reset()
+    engine = db_pool.instrument_engine(create_engine('sqlite:///:memory:', poolclass=NullPool))
+    assert db_pool.warm_up(engine)['ok'] is True
+    with engine.connect() as conn:
+        conn.execute(text('select 1'))
+    assert db_pool.connect_metrics.snapshot()['connects'] == 2
+    broken = create_engine('sqlite:////nonexistent-dir/x.db')
+    assert db_pool.warm_up(broken)['ok'] is False
+
+    assert mod.app.config['DB_WARMUP'] == {'status': 'disabled'}
+    monkeypatch.setenv('DB_WARMUP', 'sync')
+    mod._start_db_warmup(mod.app)
+    assert mod.app.config['DB_WARMUP']['status'] == 'ok'
+    # Built on first use only (SQLite never needs it), then shared
+    assert mod._db_ssl_context is None
+    ctx = mod.get_db_ssl_context()
+    assert isinstance(ctx, db_pool.ResumingSSLContext) and mod.get_db_ssl_context() is ctx
+
+
+def test_sqlite_pragmas_are_applied_per_connection(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    assert db_pool.configure_sqlite(engine, {'SQLITE_BUSY_TIMEOUT_MS': '2500'}) is None
+    with engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()  # noqa: E731
+        assert (pragma('journal_mode'), pragma('synchronous'), pragma('busy_timeout'), pragma('foreign_keys')) == \
+            ('wal', 1, 2500, 1)
+    engine.dispose()
+    assert db_pool.configure_sqlite(create_engine(PG), {}) is None
+
+
+def test_sqlite_write_lock_serializes_threads(tmp_path):
+    import threading
+    engine = create_engine(f"sqlite:///{tmp_path / 'locked.db'}", pool_size=8, max_overflow=0)
+    lock = db_pool.configure_sqlite(engine, {}, serialize_writes=True)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE counter (id INTEGER PRIMARY KEY, n INTEGER NOT NULL)'))
+        conn.execute(text('INSERT INTO counter VALUES (1, 0)'))
+    errors = []
+
+    def bump():
+        for _ in range(25):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text('UPDATE counter SET n = n + 1 WHERE id = 1'))
+                    conn.execute(text('UPDATE counter SET n = n WHERE id = 1'))
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+    threads = [threading.Thread(target=bump) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT n FROM counter')).scalar() == 150
+        conn.execute(text('UPDATE counter SET n = 0'))
+        conn.rollback()
+    # Released on rollback too, so the next writer does not wait
+    with engine.begin() as conn:
+        conn.execute(text('UPDATE counter SET n = 1'))
+    # One acquisition per write transaction, not per statement
+    assert (lock.snapshot()['write_locks'], lock.snapshot()['write_lock_timeouts']) == (153, 0)
+    assert not lock._lock.locked()
+    engine.dispose()
@@ -0,0 +1,101 @@
+import os
+import io
+import importlib.util
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+requests = pytest.importorskip('requests')
+mock_s3 = getattr(moto, 'mock_aws', None) or moto.mock_s3
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+@pytest.fixture
+def s3_admin_client(admin_client, monkeypatch):
+    monkeypatch.setenv('AWS_S3_BUCKET', 'direct-bucket')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_REGION', 'us-east-1')
+    with mock_s3():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='direct-bucket')
+        monkeypatch.setattr(mod, '_s3_storage_instance', None)
+        with mod.app.app_context():
+            product = mod.Product(title='Direct upload product', price_ghc=1)
+            mod.db.session.add(product)
+            mod.db.session.commit()
+            pid = product.id
+        yield admin_client, pid
+        monkeypatch.setattr(mod, '_s3_storage_instance', None)
+
+
+def _presign(client, **overrides):
+    payload = {'filename': 'pic.png', 'content_type': 'image/png', 'size': len(PNG)}
+    payload.update(overrides)
+    return client.post('/admin/uploads/presign', json=payload)
+
+
+def test_presigned_post_upload_and_finalize_product(s3_admin_client):
+    client, pid = s3_admin_client
+    resp = _presign(client)
+    assert resp.status_code == 200
+    signed = resp.get_json()
+    assert signed['method'] == 'POST' and signed['key'].startswith('direct/')
+
+    uploaded = requests.request('POST', signed['url'], data=signed['fields'], files={'file': ('pic.png', PNG, 'image/png')})
+    assert uploaded.status_code in (200, 201, 204)
+
+    done = client.post('/admin/uploads/finalize', json={'token': signed['token'], 'target': 'product', 'product_id': pid})
+    assert done.status_code == 200
+    url = done.get_json()['url']
+    assert url.endswith(signed['key'])
+    with mod.app.app_context():
+        assert mod.db.session.get(mod.Product, pid).image == url
+
+
+def test_presigned_put_finalize_settings_slot(s3_admin_client):
+    client, _ = s3_admin_client
+    signed = _presign(client, method='put').get_json()
+    assert signed['method'] == 'PUT'
+    uploaded = requests.request('PUT', signed['url'], data=PNG, headers=signed['headers'])
+    assert uploaded.status_code == 200
+
+    done = client.post('/admin/uploads/finalize', json={'token': signed['token'], 'target': 'settings', 'slot': 'banner1'})
+    assert done.status_code == 200
+    with mod.app.app_context():
+        settings = mod.get_settings()
+        assert settings.banner1_image == done.get_json()['url']
+        assert settings.banner1_image_data is None
+
+
+def test_presign_rejects_bad_requests_and_finalize_checks_object(s3_admin_client):
+    client, pid = s3_admin_client
+    assert _presign(client, size=mod.DIRECT_UPLOAD_MAX_BYTES + 1).status_code == 400
+    assert _presign(client, filename='evil.exe').status_code == 400
+    assert _presign(client, content_type='text/html').status_code == 400
+
+    signed = _presign(client).get_json()
+    # Nothing uploaded yet
+    missing = client.post('/admin/uploads/finalize', json={'token': signed['token'], 'target': 'product', 'product_id': pid})
+    assert missing.status_code == 400
+    forged = client.post('/admin/uploads/finalize', json={'token': signed['token'] + 'x', 'target': 'product', 'product_id': pid})
+    assert forged.status_code == 400
+
+
+def test_finalize_rejects_urls_too_long_for_settings(s3_admin_client, monkeypatch):
+    client, _ = s3_admin_client
+    long_url = 'https://cdn.example.com/' + 'a' * 400 + '.png'
+    monkeypatch.setattr(mod, '_verify_direct_upload', lambda token: (long_url, 'image/png'))
+    done = client.post('/admin/uploads/finalize', json={'token': 't', 'target': 'settings', 'slot': 'logo'})
+    assert done.status_code == 400 and 'too long' in done.get_json()['message']
+
+    page = client.post('/admin/settings', data={'logo_file_direct_token': 't'}, follow_redirects=True)
+    assert 'Logo upload failed: Image URL is too long' in page.get_data(as_text=True)
+    with mod.app.app_context():
+        assert mod.get_settings().logo_image != long_url
@@ -0,0 +1,86 @@
+import os
+import sys
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import error_buffer  # noqa: E402
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@mod.app.route('/__test_boom/<int:n>')
+def _test_boom(n):
+    raise RuntimeError(f'boom {n}')
+
+
+def _fail(buffer, exc_type, message):
+    try:
+        raise exc_type(message)
+    except Exception as exc:
+        return buffer.record(exc, route='checkout')
+
+
+def test_same_failure_is_grouped_and_oldest_groups_are_evicted():
+    buffer = error_buffer.ErrorBuffer(size=2)
+    first = _fail(buffer, ValueError, 'order 1')
+    again = _fail(buffer, ValueError, 'order 2')
+    assert first['fingerprint'] == again['fingerprint'] and again['count'] == 2
+    assert again['message'] == 'order 2' and 'ValueError: order 2' in again['traceback']
+
+    _fail(buffer, KeyError, 'a')
+    _fail(buffer, TypeError, 'b')
+    assert [g['type'] for g in buffer.grouped()] == ['TypeError', 'KeyError']
+    assert len(buffer.recent()) == 2
+    pending = {g['type']: g['new'] for g in buffer.take_pending()}
+    assert pending == {'KeyError': 1, 'TypeError': 1} and buffer.take_pending() == []
+
+    # Without persistence nothing is kept for take_pending
+    memory_only = error_buffer.ErrorBuffer(size=2, track_pending=False)
+    _fail(memory_only, ValueError, 'order 3')
+    assert len(memory_only) == 1 and memory_only.take_pending() == []
+
+
+def test_last_error_lists_grouped_errors_and_persists_them(monkeypatch):
+    with mod.app.app_context():
+        mod.db.create_all()
+    mod.error_log.clear()
+    monkeypatch.setattr(mod.error_log, 'track_pending', True)
+    client = mod.app.test_client()
+    assert client.get('/__test_boom/1', headers={'X-Request-ID': 'req-a'}).status_code == 500
+    assert client.get('/__test_boom/2', headers={'X-Request-ID': 'req-b'}).status_code == 500
+
+    assert client.get('/__last_error').status_code == 403
+    monkeypatch.setenv('ERROR_VIEW_TOKEN', 'err-token')
+    text = client.get('/__last_error', headers={'X-ERROR-TOKEN': 'err-token'}).get_data(as_text=True)
+    assert '2x RuntimeError: boom 2' in text and 'route=_test_boom request_id=req-b' in text
+    errors = client.get('/__last_error?token=err-token&format=json').get_json()['errors']
+    assert [(e['type'], e['count']) for e in errors] == [('RuntimeError', 2)]
+
+    # Batched persistence: counts from each flush are added to the stored row
+    assert mod._flush_error_groups() == 1
+    assert client.get('/__test_boom/3').status_code == 500
+    assert mod._flush_error_groups() == 1 and mod._flush_error_groups() == 0
+    stored = client.get('/__last_error?token=err-token&format=json&source=db').get_json()['errors']
+    assert [(e['fingerprint'], e['count'], e['message']) for e in stored] == [
+        (errors[0]['fingerprint'], 3, 'boom 3')]
+
+
+def test_long_route_and_type_are_cut_to_the_column_widths(monkeypatch):
+    with mod.app.app_context():
+        mod.db.create_all()
+    mod.error_log.clear()
+    monkeypatch.setattr(mod.error_log, 'track_pending', True)
+    long_type = type('E' * 200, (Exception,), {})
+    with mod.app.test_request_context('/' + 'x' * 500):
+        try:
+            raise long_type('too long')
+        except Exception as exc:
+            mod._record_error(exc)
+    assert len(mod.error_log.grouped()[0]['route']) == 120
+    assert mod._flush_error_groups() == 1
+    with mod.app.app_context():
+        row = mod.ErrorGroup.query.filter_by(message='too long').one()
+        assert (len(row.exc_type), len(row.route)) == (120, 120)
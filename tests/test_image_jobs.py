@@ -0,0 +1,110 @@
+import os
+import io
+import time
+import importlib.util
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+from image_processing import process_image, ImageValidationError
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _image_bytes(fmt='PNG', size=(1200, 600), exif=None):
+    out = io.BytesIO()
+    kwargs = {'exif': exif} if exif is not None else {}
+    Image.new('RGB', size, (200, 30, 30)).save(out, fmt, **kwargs)
+    return out.getvalue()
+
+
+def test_process_image_strips_exif_and_builds_derivatives():
+    exif = Image.Exif()
+    exif[0x010F] = 'SecretCam'  # Make
+    processed = process_image(_image_bytes('JPEG', exif=exif.tobytes()))
+    assert processed.mime_type == 'image/jpeg'
+    assert 'exif' not in Image.open(io.BytesIO(processed.data)).info
+    assert set(processed.derivatives) == {'thumb', 'medium'}
+    assert max(Image.open(io.BytesIO(processed.derivatives['thumb'])).size) == 320
+
+
+def test_process_image_rejects_non_images():
+    with pytest.raises(ImageValidationError):
+        process_image(b'<html>not an image</html>')
+    with pytest.raises(ImageValidationError):
+        process_image(b'\x89PNG\r\n\x1a\n' + b'\x00' * 16)
+
+
+@pytest.fixture
+def admin_client(admin_client, tmp_path, monkeypatch):
+    # The shared admin client, with uploads staged under tmp_path
+    monkeypatch.setattr(mod, 'IMAGE_STAGING_DIR', tmp_path / 'staging')
+    monkeypatch.setitem(mod.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    return admin_client
+
+
+def test_processing_defaults_to_inline_on_serverless(monkeypatch):
+    monkeypatch.delenv('IMAGE_PROCESSING_MODE', raising=False)
+    assert mod._image_processing_mode() == 'background'
+    monkeypatch.setenv('VERCEL', '1')
+    assert mod._image_processing_mode() == 'inline'
+    monkeypatch.setenv('IMAGE_PROCESSING_MODE', 'background')
+    assert mod._image_processing_mode() == 'background'
+
+
+def _wait_for_job(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        body = client.get(f'/admin/uploads/jobs/{job_id}').get_json()
+        if body['job_status'] in ('done', 'failed'):
+            return body
+        time.sleep(0.05)
+    raise AssertionError('image job did not finish')
+
+
+def test_settings_upload_is_queued_and_processed(admin_client, tmp_path):
+    data = {'primary_color': '#ffffff', 'banner1_file': (io.BytesIO(_image_bytes()), 'banner.png')}
+    resp = admin_client.post('/admin/settings', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 200
+    assert b'processing in the background' in resp.data
+    with mod.app.app_context():
+        job = mod.ImageJob.query.filter_by(slot='banner1').order_by(mod.ImageJob.created_at.desc()).first()
+        job_id = job.id
+    assert job_id.encode() in resp.data
+
+    body = _wait_for_job(admin_client, job_id)
+    assert body['job_status'] == 'done', body
+    assert body['url'].startswith('/uploads/images/banner1_')
+    assert set(body['derivatives']) == {'thumb', 'medium'}
+    assert not list((tmp_path / 'staging').iterdir())
+    with mod.app.app_context():
+        assert mod.get_settings().banner1_image == body['url']
+
+
+def test_product_upload_invalid_image_fails_job(admin_client):
+    data = {'title': 'Job product', 'price': '5', 'image_file': (io.BytesIO(b'GIF89a-broken'), 'bad.gif')}
+    resp = admin_client.post('/admin/new', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 302
+    with mod.app.app_context():
+        product = mod.Product.query.filter_by(title='Job product').first()
+        job = mod.ImageJob.query.filter_by(target='product', target_id=product.id).first()
+        job_id = job.id
+    body = _wait_for_job(admin_client, job_id)
+    assert body['job_status'] == 'failed'
+    assert body['error']
+
+
+def test_rolled_back_job_is_not_dispatched(admin_client, tmp_path, monkeypatch):
+    from werkzeug.datastructures import FileStorage
+    called = []
+    monkeypatch.setattr(mod, 'process_image_job', lambda job_id: called.append(job_id))
+    with mod.app.test_request_context():
+        job = mod.enqueue_image_job(FileStorage(io.BytesIO(_image_bytes()), 'x.png'), 'settings', slot='logo')
+        assert os.path.exists(job.staging_path)
+        mod.db.session.rollback()
+        assert not os.path.exists(job.staging_path)
+    assert called == []
@@ -0,0 +1,54 @@
+import os
+import io
+import importlib.util
+from werkzeug.datastructures import FileStorage
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+def test_manifest_scan_and_lookup(tmp_path):
+    (tmp_path / 'a.png').write_bytes(b'a')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'b.jpg').write_bytes(b'b')
+    (tmp_path / '.permcheck').write_text('ok')
+    manifest = mod.ImageManifest()
+    assert manifest.scan(tmp_path) == 2
+    assert manifest.lookup('uploads', 'a.png', [tmp_path]) == str(tmp_path)
+    assert manifest.lookup('uploads', 'sub/b.jpg', [tmp_path]) == str(tmp_path)
+    assert manifest.lookup('uploads', '.permcheck', [tmp_path]) is None
+    assert manifest.lookup('uploads', '../a.png', [tmp_path / 'sub']) is None
+
+
+def test_manifest_caches_misses_until_registered(tmp_path):
+    manifest = mod.ImageManifest(miss_ttl=3600)
+    assert manifest.lookup('uploads', 'late.png', [tmp_path]) is None
+    # A file appearing on disk is not seen while the negative entry is fresh...
+    (tmp_path / 'late.png').write_bytes(b'x')
+    assert manifest.lookup('uploads', 'late.png', [tmp_path]) is None
+    # ...but an explicit registration (as done on upload) clears it
+    manifest.add(tmp_path, 'late.png')
+    assert manifest.lookup('uploads', 'late.png', [tmp_path]) == str(tmp_path)
+
+
+def test_upload_is_served_and_missing_returns_placeholder(tmp_path):
+    mod.app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    fs = FileStorage(stream=io.BytesIO(b'img-bytes'), filename='m.png', content_type='image/png')
+    saved = mod._save_uploaded_file(fs, 'manifest_test.png', mime_type='image/png')
+    assert saved == '/uploads/images/manifest_test.png'
+
+    client = mod.app.test_client()
+    resp = client.get('/uploads/images/manifest_test.png')
+    assert resp.status_code == 200
+    assert resp.data == b'img-bytes'
+    assert 'max-age=3600' in resp.headers.get('Cache-Control', '')
+
+    missing = client.get('/uploads/images/does-not-exist.png')
+    assert missing.status_code == 200
+    assert missing.mimetype == 'image/svg+xml'
+    assert b'Image not available' in missing.data
+
+    assert client.get('/static/images/does-not-exist.png').status_code == 404
+    assert client.get('/static/images/logo.svg').status_code == 200
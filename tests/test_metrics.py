@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import subprocess
+import importlib.util
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+import metrics  # noqa: E402
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(ROOT, 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+WORKER = """
+import sys
+sys.path.insert(0, {root!r})
+import metrics
+r = metrics.Registry({directory!r})
+c = metrics.Counter('jobs_total', 'Jobs', ['kind'], registry=r)
+h = metrics.Histogram('job_seconds', 'Job latency', registry=r, buckets=(0.1, 1))
+g = metrics.Gauge('busy', 'Busy workers', registry=r)
+c.inc(3, kind='email')
+h.observe(0.5)
+g.set(1)
+"""
+
+
+def _registry(directory):
+    r = metrics.Registry(directory)
+    c = metrics.Counter('jobs_total', 'Jobs', ['kind'], registry=r)
+    h = metrics.Histogram('job_seconds', 'Job latency', registry=r, buckets=(0.1, 1))
+    g = metrics.Gauge('busy', 'Busy workers', registry=r)
+    return r, c, h, g
+
+
+def test_multiprocess_merge_sums_counters_and_drops_dead_gauges(tmp_path):
+    # A worker that exits: its counters must survive, its gauge must not
+    subprocess.run([sys.executable, '-c', WORKER.format(root=ROOT, directory=str(tmp_path))], check=True)
+    r, c, h, g = _registry(str(tmp_path))
+    c.inc(kind='email')
+    h.observe(0.05)
+    g.set(1)
+    # A live sibling worker (the parent process stands in for one)
+    (tmp_path / f'metrics-{os.getppid()}.json').write_text(json.dumps(
+        {'busy': {'type': 'gauge', 'help': 'Busy workers', 'labelnames': [], 'mode': 'livesum', 'values': [[[], 1.0]]}}))
+
+    text = r.render()
+    assert 'jobs_total{kind="email"} 4.0' in text
+    assert 'job_seconds_bucket{le="0.1"} 1' in text and 'job_seconds_bucket{le="1.0"} 2' in text
+    assert 'job_seconds_count 2' in text
+    assert 'busy 2.0' in text
+    # The exited worker was folded into the archive; totals are unchanged on the next scrape
+    assert (tmp_path / metrics.ARCHIVE_NAME).exists()
+    assert sorted(p.name for p in tmp_path.glob('metrics-*.json')) == sorted(
+        [metrics.ARCHIVE_NAME, f'metrics-{os.getpid()}.json', f'metrics-{os.getppid()}.json'])
+    assert 'jobs_total{kind="email"} 4.0' in r.render()
+
+
+def test_metrics_endpoint_requires_token_and_reports_requests(monkeypatch):
+    client = mod.app.test_client()
+    assert client.get('/metrics').status_code == 403
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-me')
+    assert client.get('/metrics?token=wrong').status_code == 403
+
+    with mod.app.app_context():
+        mod.db.create_all()
+    client.get('/cart')
+    mod.image_manifest.lookup('static', 'definitely-missing.png', mod._image_dirs('static'))
+    mod.image_manifest.lookup('static', 'definitely-missing.png', mod._image_dirs('static'))
+    with mod._outbound_call('paystack', 'verify') as call:
+        call['status'] = 200
+    with pytest.raises(ConnectionError):
+        with mod._outbound_call('sendgrid', 'send'):
+            raise ConnectionError('timed out')
+
+    resp = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert resp.status_code == 200 and resp.mimetype == 'text/plain'
+    text = resp.get_data(as_text=True)
+    assert 'shop_http_requests_total{method="GET",endpoint="view_cart",status="200"}' in text
+    assert 'shop_http_request_duration_seconds_count{method="GET",endpoint="view_cart"}' in text
+    assert 'shop_http_requests_in_flight 1.0' in text  # the scrape itself
+    assert 'shop_db_pool_checkouts_total' in text
+    assert 'shop_email_queue_depth{queue="failed_email"}' in text
+    assert 'shop_cache_hit_ratio{cache="image_manifest"}' in text
+    assert 'shop_outbound_request_duration_seconds_count{service="paystack",operation="verify",outcome="2xx"} 1' in text
+    assert 'shop_outbound_request_duration_seconds_count{service="sendgrid",operation="send",outcome="error"} 1' in text
+
+
+def test_flushed_file_does_not_count_the_flushing_request(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(mod.metrics_registry, 'directory', str(tmp_path))
+    monkeypatch.setattr(mod.metrics_registry, 'flush_interval', 0)
+    in_use = mod.db_pool.pool_metrics.snapshot()['in_use']
+    assert admin_client.get('/admin/sales').status_code == 200
+    with open(tmp_path / f'metrics-{os.getpid()}.json', encoding='utf-8') as fh:
+        written = json.load(fh)
+    assert written['shop_http_requests_in_flight']['values'] == [[[], 0]]
+    assert written['shop_db_pool_connections_in_use']['values'] == [[[], in_use]]
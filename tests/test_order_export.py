@@ -0,0 +1,81 @@
+import os
+import csv
+import gzip
+import json
+import uuid
+import importlib.util
+from io import StringIO
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def client_and_orders(admin_client, monkeypatch):
+    # Small batches so the keyset batching is exercised
+    monkeypatch.setattr(mod, 'ORDER_EXPORT_BATCH_SIZE', 2)
+    prefix = f"exp{uuid.uuid4().hex[:6]}"
+    with mod.app.app_context():
+        ids = []
+        for i in range(5):
+            o = mod.Order(reference=f"{prefix}-{i}", email=f"{prefix}{i}@example.com", total=Decimal('10.50') * (i + 1),
+                          status='completed' if i < 3 else 'pending', paid=i < 3,
+                          created_at=datetime(2026, 2, 1) + timedelta(days=i))
+            mod.db.session.add(o)
+            mod.db.session.flush()
+            # Order 0 has no items, the others have i items each
+            for n in range(i):
+                mod.db.session.add(mod.OrderItem(order_id=o.id, product_id=n + 1, title=f"Item {n}",
+                                                 qty=1, price=Decimal('1.00'), subtotal=Decimal('1.00')))
+            ids.append(o.id)
+        mod.db.session.commit()
+    return admin_client, prefix, ids
+
+
+def test_csv_export_streams_filtered_orders(client_and_orders):
+    client, prefix, ids = client_and_orders
+    resp = client.get(f'/admin/orders/export?q={prefix}&status=completed')
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.mimetype == 'text/csv'
+    rows = list(csv.reader(StringIO(resp.get_data(as_text=True))))
+    assert rows[0] == ['id', 'reference', 'email', 'total', 'paid', 'status', 'created_at']
+    assert [int(r[0]) for r in rows[1:]] == [ids[2], ids[1], ids[0]]
+    assert rows[1][4] == 'yes' and rows[1][3] == '31.5'
+
+
+def test_csv_export_with_items_gzip(client_and_orders):
+    client, prefix, ids = client_and_orders
+    resp = client.get(f'/admin/orders/export?q={prefix}&items=1&gzip=1')
+    assert resp.mimetype == 'application/gzip'
+    assert 'orders.csv.gz' in resp.headers['Content-Disposition']
+    rows = list(csv.reader(StringIO(gzip.decompress(resp.data).decode())))
+    assert rows[0][-5:] == ['item_product_id', 'item_title', 'item_qty', 'item_price', 'item_subtotal']
+    # 4 + 3 + 2 + 1 item lines plus one blank-item line for the order without items
+    assert len(rows) - 1 == 11
+    assert [r for r in rows[1:] if int(r[0]) == ids[0]][0][-5:] == [''] * 5
+
+
+def test_jsonl_export_with_items_and_date_range(client_and_orders):
+    client, prefix, ids = client_and_orders
+    resp = client.get(f'/admin/orders/export?q={prefix}&format=jsonl&items=1&date_from=2026-02-02&date_to=2026-02-04')
+    assert resp.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [r['id'] for r in records] == [ids[3], ids[2], ids[1]]
+    assert [len(r['items']) for r in records] == [3, 2, 1]
+    assert records[0]['items'][0] == {'product_id': 1, 'title': 'Item 0', 'qty': 1, 'price': 1.0, 'subtotal': 1.0}
+
+
+def test_iter_orders_for_export_batches_without_duplicates(client_and_orders):
+    _client, prefix, ids = client_and_orders
+    with mod.app.test_request_context(f'/?q={prefix}'):
+        from flask import request
+        criteria, _ = mod.order_filters_from_args(request.args)
+        seen = [o.id for o, _items in mod.iter_orders_for_export(criteria, include_items=True, batch_size=2)]
+    assert seen == sorted(ids, reverse=True)
@@ -0,0 +1,83 @@
+import os
+import json
+import uuid
+import importlib.util
+from decimal import Decimal
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def products():
+    tag = f"bulk{uuid.uuid4().hex[:6]}"
+    with mod.app.app_context():
+        mod.db.create_all()
+        rows = [mod.Product(title=f"Item {tag} {i}", price_ghc=Decimal(price), featured=(i == 0))
+                for i, price in enumerate(('100.00', '19.99', '5.00'))]
+        mod.db.session.add_all(rows)
+        mod.db.session.commit()
+        yield tag, [p.id for p in rows]
+
+
+def _prices(ids):
+    mod.db.session.expire_all()
+    return [(p.price_ghc, p.old_price_ghc, p.featured)
+            for p in mod.Product.query.filter(mod.Product.id.in_(ids)).order_by(mod.Product.id)]
+
+
+def test_sale_by_percentage_keeps_old_price_and_audits(products):
+    tag, ids = products
+    loaded = mod.db.session.get(mod.Product, ids[0])
+    version = mod.catalog_version
+    result = mod.bulk_update_products('price_percent', -20, filters={'q': tag}, keep_old_price=True,
+                                      actor='tester')
+    assert result['affected'] == 3 and mod.catalog_version == version + 1
+    # Objects loaded before the bulk UPDATE do not keep stale prices
+    assert loaded.price_ghc == Decimal('80.00')
+    assert _prices(ids) == [(Decimal('80.00'), Decimal('100.00'), True),
+                            (Decimal('15.99'), Decimal('19.99'), False),
+                            (Decimal('4.00'), Decimal('5.00'), False)]
+    entry = mod.db.session.get(mod.AdminAuditLog, result['audit_id'])
+    assert (entry.action, entry.actor, entry.affected) == ('product.price_percent', 'tester', 3)
+    assert entry.to_display_dict()['detail'] == {'filter': {'q': tag}, 'value': -20, 'keep_old_price': True}
+
+    mod.bulk_update_products('price_amount', '-10', ids=ids)
+    mod.bulk_update_products('featured', 'toggle', ids=ids[:2])
+    mod.bulk_update_products('set_old_price', None, ids=ids[1:])
+    assert _prices(ids) == [(Decimal('70.00'), Decimal('100.00'), False),
+                            (Decimal('5.99'), None, True),
+                            (Decimal('0.00'), None, False)]
+
+
+def test_invalid_operations_write_nothing(products):
+    tag, ids = products
+    before = mod.AdminAuditLog.query.count()
+    for kwargs in ({'action': 'price_percent', 'value': 'abc', 'ids': ids},
+                   {'action': 'price_percent', 'value': -150, 'ids': ids},
+                   {'action': 'rename', 'ids': ids},
+                   {'action': 'featured', 'value': 'maybe', 'ids': ids},
+                   {'action': 'delete', 'filters': {}},
+                   {'action': 'delete'}):
+        with pytest.raises(ValueError):
+            mod.bulk_update_products(**kwargs)
+    assert mod.AdminAuditLog.query.count() == before
+    assert _prices(ids)[0] == (Decimal('100.00'), None, True)
+
+
+def test_bulk_endpoint_deletes_selected_products(products, admin_client):
+    tag, ids = products
+    resp = admin_client.post('/admin/products/bulk', json={'action': 'delete', 'ids': ids[1:]})
+    assert resp.status_code == 200 and resp.get_json()['affected'] == 2
+    bad = admin_client.post('/admin/products/bulk', data=json.dumps({'action': 'featured', 'value': 1, 'ids': ids}),
+                            content_type='application/json')
+    assert bad.status_code == 400 and bad.get_json()['status'] == 'error'
+    with mod.app.app_context():
+        remaining = mod.Product.query.filter(mod.Product.title.like(f'Item {tag} %')).all()
+        assert [p.id for p in remaining] == ids[:1]
+        entry = mod.AdminAuditLog.query.order_by(mod.AdminAuditLog.id.desc()).first()
+        assert (entry.action, entry.actor, entry.affected) == ('product.delete', 'testadmin', 2)
@@ -0,0 +1,143 @@
+import io
+import os
+import json
+import uuid
+import importlib.util
+from decimal import Decimal
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+def _csv(tag, rows):
+    lines = ['sku,title,price_ghc,old_price_ghc,featured,card_size']
+    lines += [','.join(str(v) for v in row) for row in rows]
+    return io.BytesIO(('\n'.join(lines) + '\n').encode())
+
+
+def test_csv_import_upserts_by_sku_and_reports_bad_rows():
+    tag = uuid.uuid4().hex[:6]
+    rows = [(f'{tag}-1', 'Router', '120.00', '150', 'yes', 'large'),
+            (f'{tag}-2', 'Cable', '9.50', '', '', ''),
+            ('', 'No sku', '5', '', '', ''),
+            (f'{tag}-4', '', 'abc', '', '', 'huge')]
+    with mod.app.app_context():
+        mod.db.create_all()
+        dry = mod.import_products(_csv(tag, rows), 'csv', dry_run=True)
+        assert (dry['inserted'], dry['updated'], dry['failed']) == (2, 0, 2)
+        assert mod.Product.query.filter(mod.Product.sku.like(f'{tag}-%')).count() == 0
+        assert dry['errors'][0] == {'line': 4, 'sku': None, 'errors': ['sku is required']}
+        assert set(dry['errors'][1]['errors']) == {'Product title is required', 'Invalid price format',
+                                                   'card_size must be small, medium or large'}
+
+        report = mod.import_products(_csv(tag, rows), 'csv', batch_size=1)
+        assert (report['inserted'], report['updated'], report['failed']) == (2, 0, 2)
+        router = mod.Product.query.filter_by(sku=f'{tag}-1').one()
+        assert (router.price_ghc, router.featured, router.card_size) == (Decimal('120.00'), True, 'large')
+
+        rows[0] = (f'{tag}-1', 'Router v2', '99.00', '', 'no', 'small')
+        again = mod.import_products(_csv(tag, rows[:2]), 'csv')
+        assert (again['inserted'], again['updated']) == (0, 2)
+        mod.db.session.expire_all()
+        router = mod.Product.query.filter_by(sku=f'{tag}-1').one()
+        assert (router.title, router.price_ghc, router.featured) == ('Router v2', Decimal('99.00'), False)
+
+
+def test_jsonl_import_and_export_round_trip():
+    tag = uuid.uuid4().hex[:6]
+    lines = [json.dumps({'sku': f'{tag}-{i}', 'title': f'Item {i}', 'price_ghc': 10 + i, 'featured': i == 0})
+             for i in range(3)]
+    lines.insert(1, '{not json')
+    with mod.app.app_context():
+        mod.db.create_all()
+        legacy = mod.Product(title=f'Legacy {tag}', price_ghc=Decimal('5.00'))
+        mod.db.session.add(legacy)
+        mod.db.session.commit()
+        legacy_id = legacy.id
+        report = mod.import_products(io.BytesIO('\n'.join(lines).encode()), 'jsonl')
+        assert (report['inserted'], report['failed']) == (3, 1)
+        assert report['errors'][0]['line'] == 2
+
+        exported = ''.join(mod.generate_products_export(mod.iter_products_for_export(batch_size=2), 'jsonl'))
+        mine = [r for r in map(json.loads, exported.splitlines()) if r['sku'].startswith(tag)]
+        assert [r['title'] for r in mine] == ['Item 0', 'Item 1', 'Item 2']
+        assert mine[0]['featured'] is True and mine[2]['price_ghc'] == '12.00'
+
+        csv_text = ''.join(mod.generate_products_export(mod.iter_products_for_export(), 'csv'))
+        again = mod.import_products(io.BytesIO(csv_text.encode()), 'csv', dry_run=True)
+        assert again['failed'] == 0 and again['inserted'] == 0
+        # Products without a SKU export as product-<id> and re-import onto themselves
+        assert f'product-{legacy_id},Legacy {tag}' in csv_text
+        mod.import_products(io.BytesIO(csv_text.encode()), 'csv')
+        assert mod.Product.query.filter_by(title=f'Legacy {tag}').count() == 1
+        assert mod.db.session.get(mod.Product, legacy_id).sku == f'product-{legacy_id}'
+
+
+def test_admin_import_endpoint_returns_json_report(admin_client):
+    tag = uuid.uuid4().hex[:6]
+    data = {'file': (_csv(tag, [(f'{tag}-1', 'Mouse', '20', '', '', '')]), 'products.csv')}
+    resp = admin_client.post('/admin/products/import', data=data, content_type='multipart/form-data',
+                             headers={'Accept': 'application/json'})
+    body = resp.get_json()
+    assert body['status'] == 'success' and body['inserted'] == 1 and not body['dry_run']
+    assert admin_client.get('/admin/products/import').status_code == 200
+    export = admin_client.get('/admin/products/export')
+    assert export.mimetype == 'text/csv' and f'{tag}-1,Mouse' in export.get_data(as_text=True)
+
+
+def test_partial_header_updates_only_the_columns_it_names():
+    tag = uuid.uuid4().hex[:6]
+    with mod.app.app_context():
+        mod.db.create_all()
+        mod.db.session.add(mod.Product(sku=f'{tag}-1', title='Lamp', short='Warm light', price_ghc=Decimal('30.00'),
+                                       old_price_ghc=Decimal('40.00'), image='/static/lamp.png', featured=True))
+        mod.db.session.commit()
+        body = f'sku,price_ghc,title\n{tag}-1,25.00,Lamp v2\n{tag}-2,5.00,Bulb\n{tag}-3,7.00,\n{tag}-1,24.00,Lamp v3\n'
+        report = mod.import_products(io.BytesIO(body.encode()), 'csv')
+        # The repeated SKU in one batch is one update, with the later row applied
+        assert (report['inserted'], report['updated'], report['failed']) == (1, 1, 1)
+        mod.db.session.expire_all()
+        lamp = mod.Product.query.filter_by(sku=f'{tag}-1').one()
+        assert (lamp.title, lamp.price_ghc) == ('Lamp v3', Decimal('24.00'))
+        assert (lamp.short, lamp.old_price_ghc, lamp.image, lamp.featured) == (
+            'Warm light', Decimal('40.00'), '/static/lamp.png', True)
+
+        # A new SKU needs a title and price even when the file has no such column
+        report = mod.import_products(io.BytesIO(f'sku,featured\n{tag}-1,no\n{tag}-4,yes\n'.encode()), 'csv')
+        assert (report['inserted'], report['updated']) == (0, 1)
+        assert report['errors'] == [{'line': 3, 'sku': f'{tag}-4', 'errors': [
+            'Product title is required', 'Product price is required']}]
+        mod.db.session.expire_all()
+        assert mod.Product.query.filter_by(sku=f'{tag}-1').one().featured is False
+
+
+def test_record_is_validated_only_for_the_fields_it_carries():
+    assert mod.normalize_product_record({'sku': 'a', 'price': '-1'}) == (
+        {'sku': 'a'}, ['Product price cannot be negative'])
+    assert mod.normalize_product_record({'sku': 'a', 'title': ' '}) == (
+        {'sku': 'a', 'title': ''}, ['Product title is required'])
+    assert mod.normalize_product_record({'sku': 'a', 'title': 'Fan', 'price_ghc': 12}) == (
+        {'sku': 'a', 'title': 'Fan', 'price_ghc': Decimal('12')}, [])
+
+def test_rows_the_database_rejects_are_reported_per_row():
+    tag = uuid.uuid4().hex[:6]
+    with mod.app.app_context():
+        mod.db.create_all()
+        # SQLite does not enforce Numeric(10, 2); emulate the Postgres overflow error
+        mod.db.session.execute(mod.db.text(
+            "CREATE TRIGGER product_price_overflow BEFORE INSERT ON product WHEN NEW.price_ghc >= 100000000 "
+            "BEGIN SELECT RAISE(ABORT, 'numeric field overflow'); END"))
+        mod.db.session.commit()
+        try:
+            rows = [(f'{tag}-1', 'Desk', '80.00', '', '', ''), (f'{tag}-2', 'Yacht', '250000000', '', '', ''),
+                    (f'{tag}-3', 'Chair', '45.00', '', '', '')]
+            report = mod.import_products(_csv(tag, rows), 'csv')
+        finally:
+            mod.db.session.execute(mod.db.text('DROP TRIGGER product_price_overflow'))
+            mod.db.session.commit()
+        assert (report['inserted'], report['failed']) == (2, 1)
+        assert report['errors'][0]['line'] == 3 and report['errors'][0]['sku'] == f'{tag}-2'
+        assert 'numeric field overflow' in report['errors'][0]['errors'][0]
+        assert mod.Product.query.filter(mod.Product.sku.like(f'{tag}-%')).count() == 2
@@ -0,0 +1,59 @@
+import os
+import importlib.util
+
+import pytest
+from sqlalchemy import create_engine, select
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    # A fresh schema, so indexes added to existing models are present
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('explain') / 'plan.db'}")
+    mod.db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _plan(engine, stmt):
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        return ' | '.join(row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}'))
+
+
+HOT_QUERIES = {
+    # account(): a customer's orders, newest first
+    'ix_order_user_id_created_at': lambda: select(mod.Order).filter_by(user_id=7)
+    .order_by(mod.Order.created_at.desc()),
+    # order detail pages and order emails
+    'ix_order_item_order_id': lambda: select(mod.OrderItem).filter_by(order_id=7),
+    'ix_order_log_order_id_created_at': lambda: select(mod.OrderLog).filter_by(order_id=7)
+    .order_by(mod.OrderLog.created_at),
+    # index(): featured strip and the full listing
+    'ix_product_featured_created_at': lambda: select(mod.Product).filter_by(featured=True)
+    .order_by(mod.Product.created_at.desc()),
+    'ix_product_created_at_id': lambda: select(mod.Product)
+    .order_by(mod.Product.created_at.desc(), mod.Product.id.desc()),
+    'ix_wallet_user_id': lambda: select(mod.Wallet).filter_by(user_id=7),
+    # failed email retry loop
+    'ix_failed_email_attempts_last_attempt_at': lambda: select(mod.FailedEmail)
+    .where(mod.FailedEmail.attempts < 5),
+    # paystack_callback / login look users up by email (unique constraint index)
+    'sqlite_autoindex_user_1': lambda: select(mod.User).filter_by(email='a@example.com'),
+}
+
+
+@pytest.mark.parametrize('index_name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(engine, index_name):
+    plan = _plan(engine, HOT_QUERIES[index_name]())
+    assert f'INDEX {index_name}' in plan, plan
+    assert 'USE TEMP B-TREE FOR ORDER BY' not in plan, plan
+
+
+def test_wallet_is_unique_per_user():
+    index = next(ix for ix in mod.Wallet.__table__.indexes if ix.name == 'ix_wallet_user_id')
+    assert index.unique
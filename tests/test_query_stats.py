@@ -0,0 +1,93 @@
+import os
+import sys
+import uuid
+import importlib.util
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import query_stats  # noqa: E402
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def products():
+    tag = f"perf{uuid.uuid4().hex[:6]}"
+    with mod.app.app_context():
+        mod.db.create_all()
+        rows = [mod.Product(title=f"{tag} {i}", price_ghc=Decimal('5.00')) for i in range(6)]
+        mod.db.session.add_all(rows)
+        mod.db.session.commit()
+        ids = [p.id for p in rows]
+    # Outside the app context, so requests get their own session and identity map
+    return ids
+
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    a = query_stats.fingerprint("SELECT * FROM product WHERE id IN (?, ?, ?) AND title = 'x''y' LIMIT 10")
+    b = query_stats.fingerprint('SELECT *  FROM product\n WHERE id IN (%s, %s) AND title = %s LIMIT 20')
+    assert a == b == 'SELECT * FROM product WHERE id IN (?...) AND title = ? LIMIT ?'
+
+
+def test_assert_max_queries_flags_per_row_lookups(products):
+    with mod.app.app_context():
+        with query_stats.track() as outer:
+            with pytest.raises(AssertionError, match=r'6x SELECT product\.id'):
+                with query_stats.assert_max_queries(10, max_repeats=1):
+                    for pid in products:
+                        mod.db.session.get(mod.Product, pid)
+            mod.db.session.expire_all()
+            with query_stats.assert_max_queries(1):
+                mod.Product.query.filter(mod.Product.id.in_(products)).all()
+        # Nested trackers all see the statements run inside them
+        assert outer.count == 7 and outer.repeated(6)[0]['count'] == 6
+
+
+def test_requests_are_reported_with_debug_headers(products, monkeypatch):
+    monkeypatch.setitem(mod.app.config, 'SQL_STATS_HEADERS', True)
+    client = mod.app.test_client()
+    for pid in products:
+        client.post(f'/cart/add/{pid}', data={'qty': 1})
+    query_stats.report.reset()
+    resp = client.get('/cart')
+    assert resp.status_code == 200
+    assert int(resp.headers['X-SQL-Queries']) >= len(products)
+    # At least one product lookup per cart line
+    repeats, statement = resp.headers['X-SQL-Repeated'].split('x ', 1)
+    assert int(repeats) >= len(products) and statement.startswith('SELECT product.id')
+
+    report = query_stats.report.snapshot()
+    cart = next(e for e in report['endpoints'] if e['endpoint'] == 'view_cart')
+    assert (cart['requests'], cart['n_plus_one_requests']) == (1, 1)
+    assert report['n_plus_one'][0]['endpoint'] == 'view_cart'
+    assert report['recent'][0]['path'] == '/cart'
+
+
+def test_admin_perf_report_and_route_budget(admin_client):
+    with query_stats.assert_max_queries(10):
+        assert admin_client.get('/admin/sales').status_code == 200
+    body = admin_client.get('/admin/perf', headers={'Accept': 'application/json'}).get_json()
+    assert 'admin_sales' in {e['endpoint'] for e in body['report']['endpoints']}
+    assert admin_client.get('/admin/perf').status_code == 200
+    assert admin_client.post('/admin/perf', headers={'Accept': 'application/json'}).status_code == 200
+    # Only the reset request itself is left
+    assert [e['endpoint'] for e in query_stats.report.snapshot()['endpoints']] == ['admin_perf']
+
+
+def test_unmatched_urls_share_one_endpoint_and_endpoints_are_capped():
+    query_stats.report.reset()
+    client = mod.app.test_client()
+    for i in range(3):
+        assert client.get(f'/no-such-page-{i}').status_code == 404
+    endpoints = query_stats.report.snapshot()['endpoints']
+    assert [(e['endpoint'], e['requests']) for e in endpoints] == [('unmatched', 3)]
+
+    capped = query_stats.QueryReport(max_endpoints=2)
+    for endpoint in ('a', 'b', 'a', 'c'):
+        capped.record(endpoint, '/', 200, query_stats.QueryStats())
+    assert {e['endpoint']: e['requests'] for e in capped.snapshot()['endpoints']} == {'a': 2, 'c': 1}
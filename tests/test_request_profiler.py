@@ -0,0 +1,57 @@
+import os
+import sys
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import request_profiler  # noqa: E402
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+def _walk(tree):
+    for node in tree:
+        yield node
+        yield from _walk(node['children'])
+
+
+def test_profiling_needs_the_token(monkeypatch):
+    with mod.app.app_context():
+        mod.db.create_all()
+    client = mod.app.test_client()
+    monkeypatch.delenv('PROFILER_TOKEN', raising=False)
+    monkeypatch.delenv('ERROR_VIEW_TOKEN', raising=False)
+    assert 'X-Profile-Id' not in client.get('/cart', headers={'X-Profile-Token': 'anything'}).headers
+    monkeypatch.setenv('ERROR_VIEW_TOKEN', 'err-token')
+    assert 'X-Profile-Id' not in client.get('/cart?__profile=wrong').headers
+
+    resp = client.get('/cart?__profile=err-token&page=2')
+    entry = mod.profile_buffer.get(resp.headers['X-Profile-Id'])
+    assert (entry['path'], entry['endpoint'], entry['status']) == ('/cart?page=2', 'view_cart', 200)
+    functions = [n['function'] for n in _walk(entry['tree'])]
+    assert any(f.endswith('(view_cart)') for f in functions)
+    assert entry['top'] and entry['wall_ms'] >= entry['total_ms'] > 0
+
+
+def test_profiles_are_listed_in_diagnostics(monkeypatch, admin_client):
+    monkeypatch.setenv('PROFILER_TOKEN', 'prof-token')
+    profile_id = admin_client.get('/cart', headers={'X-Profile-Token': 'prof-token'}).headers['X-Profile-Id']
+
+    page = admin_client.get('/admin/diagnostics')
+    assert page.status_code == 200 and f'/admin/diagnostics/profiles/{profile_id}' in page.get_data(as_text=True)
+    detail = admin_client.get(f'/admin/diagnostics/profiles/{profile_id}')
+    assert detail.status_code == 200 and '(view_cart)' in detail.get_data(as_text=True)
+    body = admin_client.get(f'/admin/diagnostics/profiles/{profile_id}',
+                            headers={'Accept': 'application/json'}).get_json()
+    assert body['profile']['id'] == profile_id
+    missing = admin_client.get('/admin/diagnostics/profiles/nope', headers={'Accept': 'application/json'})
+    assert missing.status_code == 404
+
+
+def test_buffer_keeps_only_the_newest():
+    buffer = request_profiler.ProfileBuffer(size=2)
+    for i in range(3):
+        buffer.add({'id': str(i), 'tree': [], 'top': []})
+    assert [p['id'] for p in buffer.list()] == ['2', '1'] and buffer.get('0') is None
@@ -0,0 +1,78 @@
+import os
+import random
+import importlib.util
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+@pytest.fixture
+def day():
+    # A day no other test writes orders on
+    return date(2035, 1, 1) + timedelta(days=random.randint(0, 3000))
+
+
+def _order(ref_day, ref, total, items, paid=True, status='pending'):
+    o = mod.Order(reference=f"{ref}-{random.random()}", email='rollup@example.com', subtotal=Decimal(total),
+                  discount=Decimal('1.00'), total=Decimal(total), paid=paid, status=status,
+                  created_at=datetime.combine(ref_day, datetime.min.time()) + timedelta(hours=10))
+    mod.db.session.add(o)
+    mod.db.session.flush()
+    for product_id, title, qty, subtotal in items:
+        mod.db.session.add(mod.OrderItem(order_id=o.id, product_id=product_id, title=title, qty=qty,
+                                         price=Decimal(subtotal) / qty, subtotal=Decimal(subtotal)))
+    mod.db.session.commit()
+    return o
+
+
+def _snapshot(day):
+    daily = mod.db.session.get(mod.DailySales, day)
+    products = {p.product_id: (p.qty, Decimal(str(p.revenue)))
+                for p in mod.ProductSalesDaily.query.filter_by(day=day).all()}
+    return (daily.orders_count, Decimal(str(daily.revenue)), Decimal(str(daily.discount)), daily.items_sold), products
+
+
+def test_rollups_follow_order_creation_and_status_changes(day):
+    with mod.app.app_context():
+        mod.db.create_all()
+        a = _order(day, 'a', '30.00', [(901, 'Mouse', 2, '20.00'), (902, 'Pad', 1, '10.00')])
+        _order(day, 'b', '15.00', [(901, 'Mouse', 1, '15.00')])
+        _order(day, 'unpaid', '99.00', [(903, 'Desk', 1, '99.00')], paid=False)
+
+        daily, products = _snapshot(day)
+        assert daily == (2, Decimal('45.00'), Decimal('2.00'), 4)
+        assert products == {901: (3, Decimal('35.00')), 902: (1, Decimal('10.00'))}
+
+        a.status = 'cancelled'
+        mod.db.session.commit()
+        daily, products = _snapshot(day)
+        assert daily == (1, Decimal('15.00'), Decimal('1.00'), 1)
+        assert products[901] == (1, Decimal('15.00')) and products[902] == (0, Decimal('0'))
+
+        a.status = 'completed'
+        mod.db.session.commit()
+        incremental = _snapshot(day)
+
+        mod.backfill_sales_rollups(day, day)
+        assert _snapshot(day) == (incremental[0], {k: v for k, v in incremental[1].items() if v[0]})
+
+
+def test_sales_api_reads_rollups(day, admin_client):
+    with mod.app.app_context():
+        mod.db.create_all()
+        _order(day, 'c', '40.00', [(911, 'Keyboard', 1, '40.00')])
+        _order(day + timedelta(days=1), 'd', '20.00', [(912, 'Cable', 4, '20.00')])
+    end = day + timedelta(days=1)
+    body = admin_client.get(f'/admin/sales/api?start={day}&end={end}').get_json()
+    assert body['orders'] == 2
+    assert body['revenue'] == 60.0
+    assert body['average_order_value'] == 30.0
+    assert [p['title'] for p in body['top_products']] == ['Keyboard', 'Cable']
+    assert [d['day'] for d in body['daily']] == [day.isoformat(), end.isoformat()]
+    assert admin_client.get(f'/admin/sales?start={day}&end={end}').status_code == 200
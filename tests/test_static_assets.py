@@ -0,0 +1,65 @@
+import os
+import gzip
+import importlib.util
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+def test_static_url_is_content_hashed():
+    url = mod.static_url('css/style.css')
+    assert url.startswith('/assets/css/style.') and url.endswith('.css')
+    # Unknown files fall back to the plain static path
+    assert mod.static_url('css/nope.css') == '/static/css/nope.css'
+
+
+def test_hashed_asset_served_with_immutable_cache_and_gzip():
+    client = mod.app.test_client()
+    url = mod.static_url('css/style.css')
+    raw = open(os.path.join(os.path.dirname(__file__), '..', 'static', 'css', 'style.css'), 'rb').read()
+
+    plain = client.get(url)
+    assert plain.status_code == 200
+    assert plain.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == raw
+
+    gz = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert gz.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(gz.data) == raw
+
+    again = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': gz.headers['ETag']})
+    assert again.status_code == 304
+
+    assert client.get('/assets/css/style.deadbeef.css').status_code == 404
+
+
+def test_fresh_process_serves_hashed_urls_it_never_rendered(monkeypatch):
+    url = mod.static_url('css/style.css')
+    stale = url.replace(url.rsplit('.', 2)[1], '0123456789ab')
+    # Another worker: nothing registered until the hashed URL is requested
+    monkeypatch.setattr(mod, 'asset_registry', mod.AssetRegistry(mod.BASE_DIR / 'static'))
+    client = mod.app.test_client()
+    resp = client.get(url)
+    assert resp.status_code == 200 and resp.headers['Cache-Control'] == mod.ASSET_CACHE_CONTROL
+    # A digest from another version of the file, or no digest at all, stays a 404
+    assert client.get(stale).status_code == 404
+    assert client.get('/assets/css/style.css').status_code == 404
+
+    # Checking made-up digests reads the file once and compresses nothing
+    registry = mod.AssetRegistry(mod.BASE_DIR / 'static')
+    reads = []
+    monkeypatch.setattr(registry, '_read', lambda logical, _read=registry._read: reads.append(logical) or _read(logical))
+    for digest in ('0123456789ab', 'ba9876543210', '0123456789ab'):
+        assert registry.resolve(url[len('/assets/'):].replace(url.rsplit('.', 2)[1], digest)) is None
+    assert reads == ['css/style.css'] and registry.manifest() == {}
+
+
+def test_preferred_encoding_respects_q_values():
+    entry = {'variants': {'identity': b'', 'gzip': b'', 'br': b''}}
+    assert mod._preferred_asset_encoding(entry, 'gzip, br') == 'br'
+    assert mod._preferred_asset_encoding(entry, 'br;q=0, gzip') == 'gzip'
+    assert mod._preferred_asset_encoding(entry, '') == 'identity'
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import structured_logging  # noqa: E402
+
+# Import the app module by file path so we can run in CI
+spec = importlib.util.spec_from_file_location('app', os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+
+
+def _records(capsys):
+    structured_logging.flush()
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+
+
+def test_request_records_carry_request_fields(capsys):
+    with mod.app.app_context():
+        mod.db.create_all()
+    client = mod.app.test_client()
+    capsys.readouterr()
+    resp = client.get('/cart', headers={'X-Request-ID': 'req-123'})
+    assert resp.headers['X-Request-ID'] == 'req-123'
+    access = [r for r in _records(capsys) if r.get('request_id') == 'req-123']
+    assert access and access[-1]['message'] == 'GET /cart 200'
+    record = access[-1]
+    assert (record['route'], record['user'], record['status'], record['level']) == ('view_cart', 'anonymous', 200, 'INFO')
+    assert record['latency_ms'] > 0 and isinstance(record['db_queries'], int)
+
+    # Unusable incoming ids are replaced
+    generated = client.get('/cart', headers={'X-Request-ID': 'bad id; ' * 20}).headers['X-Request-ID']
+    assert len(generated) == 32 and ' ' not in generated
+
+
+def test_exceptions_are_kept_as_a_separate_field(capsys):
+    capsys.readouterr()
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        mod.app.logger.exception('Failed to do the thing')
+    record = _records(capsys)[-1]
+    assert record['message'] == 'Failed to do the thing' and 'ValueError: boom' in record['exc']
+    assert 'request_id' not in record
+
+
+def test_repeated_warnings_are_rate_limited():
+    limiter = structured_logging.RateLimitFilter(interval=0.05)
+
+    def warning(msg, *args):
+        return logging.LogRecord('app', logging.WARNING, __file__, 1, msg, args, None)
+
+    assert limiter.filter(warning('Image not found (%s): %s', 'static', 'a.png'))
+    assert not any(limiter.filter(warning('Image not found (%s): %s', 'static', 'a.png')) for _ in range(4))
+    assert limiter.filter(warning('Image not found (%s): %s', 'static', 'b.png'))
+    assert limiter.filter(logging.LogRecord('app', logging.ERROR, __file__, 1, 'Image not found (%s): %s',
+                                            ('static', 'a.png'), None))
+    time.sleep(0.06)
+    after = warning('Image not found (%s): %s', 'static', 'a.png')
+    assert limiter.filter(after) and after.suppressed == 4 and limiter.suppressed_total == 4
+
+
+def test_a_blocked_stdout_never_blocks_the_caller(monkeypatch):
+    release = threading.Event()
+
+    class StuckStream:
+        def write(self, text):
+            release.wait(5)
+
+        def flush(self):
+            pass
+
+    monkeypatch.setattr(sys, 'stdout', StuckStream())
+    logger = logging.getLogger('tests.structured_logging.blocked')
+    logger.propagate = False
+    handler = structured_logging.configure(logger, queue_size=10, rate_limit=0)
+    try:
+        started = time.perf_counter()
+        for i in range(200):
+            logger.info('record %s', i)
+        assert time.perf_counter() - started < 1.0
+        assert handler.dropped > 0
+    finally:
+        release.set()
+        structured_logging.configure(logger)  # replaces (and stops) the stuck listener
+
+
+def test_serverless_requests_end_after_their_records_are_written(monkeypatch):
+    written = []
+
+    class SlowStream:
+        def write(self, text):
+            time.sleep(0.02)
+            written.append(text)
+
+        def flush(self):
+            pass
+
+    with mod.app.app_context():
+        mod.db.create_all()
+    monkeypatch.setenv('VERCEL', '1')
+    monkeypatch.setattr(sys, 'stdout', SlowStream())
+    mod.app.test_client().get('/cart', headers={'X-Request-ID': 'req-frozen'})
+    assert any('req-frozen' in text and 'GET /cart 200' in text for text in written)